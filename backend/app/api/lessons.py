@@ -12,10 +12,11 @@ from pathlib import Path
 from app.core.deps import get_db, get_current_active_user
 from app.models.user import User
 from app.models.lesson import LessonPlan, LessonStatus
+from app.models.teaching_model import TeachingModel
 from app.schemas.lesson import LessonCreate, LessonResponse, LessonListResponse
 from app.services.document_parser import DocumentParserService
-from app.tasks.lesson_task import LessonTaskHandler
-from app.tasks.scheduler import scheduler
+from app.services.execution_plan import ExecutionPlanError, get_execution_plan
+from app.tasks.lesson_task import schedule_lesson, cancel_lesson
 
 router = APIRouter(prefix="/lessons", tags=["教案"])
 
@@ -41,6 +42,18 @@ async def create_lesson(
     if current_user.quota_remaining <= 0:
         raise HTTPException(status_code=403, detail="配额已用完")
     
+    # 校验教学模型配置，无效时在扣减配额前直接拒绝
+    model_result = await db.execute(
+        select(TeachingModel).where(TeachingModel.id == teaching_model_id)
+    )
+    teaching_model = model_result.scalar_one_or_none()
+    if not teaching_model:
+        raise HTTPException(status_code=404, detail="教学模型不存在")
+    try:
+        get_execution_plan(teaching_model)
+    except ExecutionPlanError as e:
+        raise HTTPException(status_code=400, detail=f"教学模型配置无效: {str(e)}")
+    
     # 处理文件上传
     parsed_content = None
     if source_type == "upload" and file:
@@ -94,14 +107,7 @@ async def create_lesson(
     await db.commit()
     
     # 添加异步任务
-    task_handler = LessonTaskHandler()
-    scheduler.add_job(
-        task_handler.process_lesson,
-        'date',  # 立即执行一次
-        args=[lesson.id],
-        id=f"lesson_{lesson.id}",
-        replace_existing=True
-    )
+    schedule_lesson(lesson.id)
     
     return LessonResponse.from_orm(lesson)
 
@@ -146,6 +152,75 @@ async def get_lesson(
     
     return LessonResponse.from_orm(lesson)
 
+@router.post("/{lesson_id}/retry", response_model=LessonResponse)
+async def retry_lesson(
+    lesson_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    重试失败的教案
+    从检查点续跑，已完成的专家意见和讨论结果不会重新生成，不重复扣减配额
+    """
+    result = await db.execute(
+        select(LessonPlan).where(
+            LessonPlan.id == lesson_id,
+            LessonPlan.user_id == current_user.id
+        )
+    )
+    lesson = result.scalar_one_or_none()
+    
+    if not lesson:
+        raise HTTPException(status_code=404, detail="教案不存在")
+    
+    if lesson.status != LessonStatus.FAILED:
+        raise HTTPException(status_code=400, detail="只能重试失败的教案")
+    
+    lesson.status = LessonStatus.QUEUED
+    lesson.error_message = None
+    await db.commit()
+    await db.refresh(lesson)
+    
+    schedule_lesson(lesson.id)
+    
+    return LessonResponse.from_orm(lesson)
+
+@router.post("/{lesson_id}/cancel", response_model=LessonResponse)
+async def cancel_lesson_task(
+    lesson_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    取消生成中的教案
+    已完成的专家意见和讨论结果保留，之后可通过重试续跑
+    """
+    result = await db.execute(
+        select(LessonPlan).where(
+            LessonPlan.id == lesson_id,
+            LessonPlan.user_id == current_user.id
+        )
+    )
+    lesson = result.scalar_one_or_none()
+    
+    if not lesson:
+        raise HTTPException(status_code=404, detail="教案不存在")
+    
+    if lesson.status not in (LessonStatus.QUEUED, LessonStatus.PROCESSING):
+        raise HTTPException(status_code=400, detail="只能取消排队中或生成中的教案")
+    
+    await cancel_lesson(lesson_id)
+    
+    # 运行中的任务会自行标记为失败；尚未开始的任务在此标记
+    await db.refresh(lesson)
+    if lesson.status in (LessonStatus.QUEUED, LessonStatus.PROCESSING):
+        lesson.status = LessonStatus.FAILED
+        lesson.error_message = "任务已取消"
+        await db.commit()
+        await db.refresh(lesson)
+    
+    return LessonResponse.from_orm(lesson)
+
 @router.delete("/{lesson_id}", status_code=204)
 async def delete_lesson(
     lesson_id: str,
@@ -164,6 +239,9 @@ async def delete_lesson(
     if not lesson:
         raise HTTPException(status_code=404, detail="教案不存在")
     
+    # 先停止排队中或运行中的生成任务，避免继续产生模型调用
+    await cancel_lesson(lesson_id)
+    
     await db.delete(lesson)
     await db.commit()
     
@@ -3,13 +3,19 @@
 """
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, func
 from typing import List
 
 from app.core.deps import get_db, get_current_active_user
 from app.models.user import User
 from app.models.teaching_model import TeachingModel
-from app.schemas.teaching_model import TeachingModelResponse
+from app.models.lesson import LessonPlan, LessonStatus
+from app.schemas.teaching_model import (
+    TeachingModelResponse,
+    TeachingModelUsageResponse,
+    TeachingModelPlanResponse
+)
+from app.services.execution_plan import ExecutionPlanError, get_execution_plan
 
 router = APIRouter(prefix="/teaching-models", tags=["教学模型"])
 
@@ -44,3 +50,72 @@ async def get_teaching_model(
     
     return TeachingModelResponse.from_orm(model)
 
+
+@router.get("/{model_id}/plan", response_model=TeachingModelPlanResponse)
+async def get_teaching_model_plan(
+    model_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """校验教学模型配置，返回执行计划和单个教案的预计LLM消耗"""
+    result = await db.execute(
+        select(TeachingModel).where(TeachingModel.id == model_id)
+    )
+    model = result.scalar_one_or_none()
+    
+    if not model:
+        raise HTTPException(status_code=404, detail="教学模型不存在")
+    
+    try:
+        plan = get_execution_plan(model)
+    except ExecutionPlanError as e:
+        raise HTTPException(status_code=422, detail=f"教学模型配置无效: {str(e)}")
+    
+    estimate = plan.estimate()
+    
+    return TeachingModelPlanResponse(
+        model_id=plan.model_id,
+        version=plan.version,
+        stage_count=len(plan.stages),
+        agent_count=len(plan.agents),
+        discussion_rounds=plan.rounds,
+        vote_threshold=plan.vote_threshold,
+        voting_strategy=plan.voting_strategy,
+        llm_calls_min=estimate.llm_calls_min,
+        llm_calls_max=estimate.llm_calls_max,
+        prompt_tokens_max=estimate.prompt_tokens_max,
+        completion_tokens_max=estimate.completion_tokens_max,
+        latency_seconds_min=estimate.latency_seconds_min,
+        latency_seconds_max=estimate.latency_seconds_max
+    )
+
+
+@router.get("/{model_id}/usage", response_model=TeachingModelUsageResponse)
+async def get_teaching_model_usage(
+    model_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """获取教学模型的平均LLM消耗（token数、调用次数、耗时）"""
+    result = await db.execute(
+        select(
+            func.count(LessonPlan.id),
+            func.avg(LessonPlan.prompt_tokens),
+            func.avg(LessonPlan.completion_tokens),
+            func.avg(LessonPlan.llm_calls),
+            func.avg(LessonPlan.llm_latency_ms)
+        ).where(
+            LessonPlan.teaching_model_id == model_id,
+            LessonPlan.status == LessonStatus.COMPLETED
+        )
+    )
+    count, prompt_tokens, completion_tokens, llm_calls, latency_ms = result.one()
+    
+    return TeachingModelUsageResponse(
+        model_id=model_id,
+        lesson_count=count,
+        avg_prompt_tokens=float(prompt_tokens or 0),
+        avg_completion_tokens=float(completion_tokens or 0),
+        avg_llm_calls=float(llm_calls or 0),
+        avg_llm_latency_ms=float(latency_ms or 0)
+    )
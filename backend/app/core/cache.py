@@ -0,0 +1,58 @@
+"""
+进程内缓存工具
+带过期时间和容量上限的LRU缓存
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+
+class TTLCache:
+    """带TTL的LRU缓存（仅供事件循环内使用，非线程安全）"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        """
+        Args:
+            max_entries: 最大条目数，超出时淘汰最久未使用的条目
+            ttl: 默认过期时间（秒）
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        """获取缓存值，不存在或已过期时返回None"""
+        item = self._data.get(key)
+        if item is None:
+            return None
+
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """写入缓存值"""
+        if self.max_entries <= 0:
+            return
+
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        """删除缓存值"""
+        self._data.pop(key, None)
+
+    def clear(self):
+        """清空缓存"""
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
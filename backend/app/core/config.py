@@ -2,7 +2,7 @@
 应用配置
 """
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List
 import os
 
 class Settings(BaseSettings):
@@ -26,16 +26,100 @@ class Settings(BaseSettings):
     # CORS配置
     CORS_ORIGINS: List[str] = ["http://localhost", "http://localhost:3000"]
     
+    # Socket.IO配置
+    SOCKETIO_REDIS_ENABLED: bool = False  # 多worker部署时通过Redis转发事件（任务与客户端可能不在同一进程）
+    
     # AI模型配置
     OPENAI_API_KEY: str = ""
     OPENAI_BASE_URL: str = "https://api.openai.com/v1"
     
     QWEN_API_KEY: str = ""
     QWEN_BASE_URL: str = "https://dashscope.aliyuncs.com/api/v1"
+    QWEN_MODEL: str = "qwen-max"
+    
+    # LLM提供商选择：auto（OpenAI优先，Qwen降级）| mock（离线模拟，用于压测）
+    LLM_PROVIDER: str = "auto"
+    
+    # 模拟LLM配置（LLM_PROVIDER=mock时生效）
+    MOCK_LLM_LATENCY_PROFILE: str = "fixed"  # fixed | normal | longtail
+    MOCK_LLM_LATENCY_MS: float = 800.0  # 固定延迟 / 正态均值 / 长尾中位数
+    MOCK_LLM_LATENCY_STDDEV_MS: float = 200.0  # normal分布标准差
+    MOCK_LLM_TAIL_SIGMA: float = 0.8  # longtail（对数正态）分布sigma
+    MOCK_LLM_ERROR_RATE: float = 0.0  # 注入错误概率
+    MOCK_LLM_SEED: int = 42
+    
+    # LLM连接池配置（每个提供商一个共享连接池）
+    LLM_POOL_MAX_CONNECTIONS: int = 100
+    LLM_POOL_MAX_KEEPALIVE: int = 20
+    LLM_POOL_KEEPALIVE_EXPIRY: float = 30.0  # 秒
+    LLM_CONNECT_TIMEOUT: float = 10.0  # 秒
+    LLM_REQUEST_TIMEOUT: float = 120.0  # 秒
+    
+    # LLM响应缓存配置（进程内LRU + Redis）
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_REDIS_ENABLED: bool = True
+    LLM_CACHE_MAX_ENTRIES: int = 1000
+    LLM_CACHE_MEMORY_TTL: int = 3600  # 秒
+    LLM_CACHE_TTL: int = 7 * 24 * 3600  # Redis过期时间（秒）
+    LLM_CACHE_MAX_TEMPERATURE: float = 0.2  # 超过该温度的调用默认不缓存（采样生成的调用每次结果应不同）
+    LLM_CACHE_REDIS_BACKOFF: float = 30.0  # Redis出错后暂停访问Redis的时间（秒），期间只使用进程内缓存
+    
+    # LLM限流配置（0表示不限制）
+    LLM_MAX_IN_FLIGHT: int = 32  # 全局最大在途请求数
+    OPENAI_RPM: int = 500
+    OPENAI_TPM: int = 80000
+    QWEN_RPM: int = 300
+    QWEN_TPM: int = 100000
+    LLM_MODEL_RATE_LIMITS: Dict[str, Dict[str, int]] = {}  # 模型级覆盖，如 {"gpt-4": {"rpm": 200, "tpm": 40000}}
+    
+    # LLM延迟路由与对冲请求配置
+    LLM_LATENCY_WINDOW: int = 200  # 每个提供商/模型保留的延迟样本数
+    LLM_LATENCY_MIN_SAMPLES: int = 20  # 样本不足时不参与路由和对冲
+    LLM_LATENCY_ROUTING: bool = False  # 按中位延迟选择主提供商
+    LLM_HEDGE_ENABLED: bool = False
+    LLM_HEDGE_PERCENTILE: float = 0.95  # 主请求超过该延迟分位数仍未返回时发送备份请求
+    LLM_HEDGE_MAX_RATIO: float = 0.1  # 对冲请求占主请求的比例上限
+    LLM_HEDGE_BURST: float = 5.0
+    
+    # LLM熔断配置（按提供商）
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = 5  # 连续失败次数
+    LLM_CIRCUIT_RECOVERY_TIMEOUT: float = 30.0  # 熔断后进入半开状态的等待时间（秒）
+    LLM_CIRCUIT_HALF_OPEN_CALLS: int = 1  # 半开状态下的探测请求数
+    LLM_RETRY_ATTEMPTS: int = 3  # 单个提供商遇到暂时性错误（超时、5xx、限流429）时的最多尝试次数
+    LLM_RETRY_MAX_WAIT: float = 10.0  # 重试前随机指数退避的最长等待时间（秒）
+    
+    # Token预算配置
+    LLM_CONTEXT_WINDOWS: Dict[str, int] = {}  # 模型上下文窗口覆盖，如 {"gpt-4": 8192}
+    LESSON_CONTENT_TOKEN_BUDGET: int = 3000  # 每个提示词中教材内容的token上限
+    LESSON_REFERENCE_TOKEN_BUDGET: int = 800  # 每个提示词中RAG参考资料的token上限
+    
+    # 教案生成并发配置
+    LESSON_STAGE1_CONCURRENCY: int = 25  # Stage 1 单个教案内并发的(阶段, 专家)分析数
+    LESSON_BALLOT_OPINION_TOKEN_BUDGET: int = 800  # 批量投票模式下每个方案的token上限
+    LESSON_WRITE_FLUSH_INTERVAL: float = 2.0  # 讨论记录和进度缓冲的最长落库间隔（秒）
+    LESSON_WRITE_BATCH_SIZE: int = 25  # 缓冲的讨论记录达到该条数时落库
+    LESSON_DEADLINE_SECONDS: float = 900  # 单个教案协作过程的最长时间（秒），0表示不限制
+    LESSON_STAGE1_CACHE_ENABLED: bool = True  # Stage 1 分析使用响应缓存（同一教材章节的提示词相同，重新生成时直接复用）
+    LESSON_RESUME_ON_STARTUP: bool = True  # 启动时及之后定期接管中断的教案任务（通过租约保证同一教案只在一个进程执行）
+    LESSON_LEASE_TIMEOUT: float = 120  # 教案任务租约时长（秒），持有进程超过该时间未续约时可被其他进程接管
     
     # Chroma向量库配置
+    VECTOR_BACKEND: str = "chroma"  # 向量库后端：chroma（Chroma服务）/ local（本地mmap向量库）
+    VECTOR_STORE_PATH: str = "./vector_store"  # 本地向量库存储目录
+    VECTOR_ANN_MIN_DOCUMENTS: int = 50000  # 本地向量库文档数达到该值时构建近似最近邻索引（需安装hnswlib，0表示不使用）
     CHROMA_HOST: str = "localhost"
     CHROMA_PORT: int = 8000
+    RAG_MAX_WORKERS: int = 8  # 向量库同步调用的线程池大小
+    RAG_QUERY_TIMEOUT: float = 5.0  # 单次检索超时（秒），超时返回空结果
+    RAG_WRITE_TIMEOUT: float = 60.0  # 写入/删除超时（秒）
+    RAG_CONNECT_TIMEOUT: float = 10.0  # 连接向量库超时（秒）
+    RAG_RECONNECT_INTERVAL: float = 30.0  # 连接失败后重新尝试的最短间隔（秒）
+    RAG_CACHE_ENABLED: bool = True  # 检索结果缓存（向量库写入/删除时清空）
+    RAG_CACHE_MAX_ENTRIES: int = 1024
+    RAG_CACHE_TTL: int = 600  # 秒
+    RAG_LESSON_SCOPED: bool = True  # 教案生成时每个教学阶段只检索一次，供该阶段所有专家共用
+    RAG_LESSON_EMBEDDING_TOKENS: int = 256  # 教案内容嵌入时使用的token上限（嵌入模型的输入长度有限）
+    RAG_LESSON_EMBEDDING_WEIGHT: float = 0.7  # 阶段检索向量中教案内容向量的权重，其余为阶段意图
     
     # MinIO配置
     MINIO_ENDPOINT: str = "localhost:9000"
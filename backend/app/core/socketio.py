@@ -0,0 +1,84 @@
+"""
+Socket.IO服务
+客户端连接时携带访问令牌和教案ID，校验教案归属后加入该教案的房间 lesson_{id}
+任务处理器通过emit_lesson_event向房间推送进度事件
+"""
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs
+import socketio
+from loguru import logger
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.database import async_session_maker
+from app.core.security import decode_access_token
+from app.models.lesson import LessonPlan
+
+# 多worker部署时通过Redis转发，任务所在进程发出的事件也能送达其他进程的客户端
+client_manager = (
+    socketio.AsyncRedisManager(settings.REDIS_URL)
+    if settings.SOCKETIO_REDIS_ENABLED else None
+)
+
+sio = socketio.AsyncServer(
+    async_mode='asgi',
+    cors_allowed_origins=settings.CORS_ORIGINS,
+    client_manager=client_manager
+)
+
+
+def lesson_room(lesson_id: str) -> str:
+    """教案房间名"""
+    return f"lesson_{lesson_id}"
+
+
+async def emit_lesson_event(lesson_id: str, event: str, data: Dict[str, Any]):
+    """
+    向教案房间推送事件
+    推送失败只记录日志，不影响任务执行
+    """
+    try:
+        await sio.emit(event, {"lesson_id": lesson_id, **data}, room=lesson_room(lesson_id))
+    except Exception as e:
+        logger.warning(f"推送事件失败 {event} - {lesson_id}: {str(e)}")
+
+
+async def _authorize(token: Optional[str], lesson_id: Optional[str]) -> bool:
+    """校验令牌，并确认教案属于该用户"""
+    if not token or not lesson_id:
+        return False
+
+    payload = decode_access_token(token)
+    if payload is None or payload.get("sub") is None:
+        return False
+
+    async with async_session_maker() as session:
+        result = await session.execute(
+            select(LessonPlan.id).where(
+                LessonPlan.id == lesson_id,
+                LessonPlan.user_id == payload["sub"]
+            )
+        )
+        return result.scalar_one_or_none() is not None
+
+
+@sio.event
+async def connect(sid, environ, auth):
+    """客户端连接：校验身份后加入教案房间"""
+    query = parse_qs(environ.get("QUERY_STRING", ""))
+    auth = auth or {}
+    token = auth.get("token")
+    lesson_id = auth.get("lesson_id") or (query.get("lesson_id") or [None])[0]
+
+    if not await _authorize(token, lesson_id):
+        logger.warning(f"Socket.IO连接被拒绝: {sid}")
+        raise socketio.exceptions.ConnectionRefusedError("无效的认证凭据或教案不存在")
+
+    await sio.enter_room(sid, lesson_room(lesson_id))
+    logger.info(f"✅ Client connected: {sid} -> {lesson_room(lesson_id)}")
+
+
+@sio.event
+async def disconnect(sid):
+    """客户端断开"""
+    logger.info(f"❌ Client disconnected: {sid}")
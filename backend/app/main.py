@@ -10,6 +10,7 @@ import socketio
 
 from app.core.config import settings
 from app.core.database import engine, Base
+from app.core.socketio import sio
 from app.api import auth, teaching_models, lessons, export
 
 @asynccontextmanager
@@ -20,15 +21,38 @@ async def lifespan(app: FastAPI):
         await conn.run_sync(Base.metadata.create_all)
     print("✅ 数据库表初始化完成")
     
+    # 初始化LLM连接池
+    from app.services.llm_clients import init_llm_clients
+    init_llm_clients()
+    
+    # 加载tokenizer（可能需要下载，在线程中执行）
+    from app.services.token_budget import init_token_encoding
+    await init_token_encoding()
+    
+    # 连接向量库（进程内共享）
+    from app.services.rag_service import init_rag_service
+    await init_rag_service()
+    
     # 启动任务调度器
     from app.tasks.scheduler import init_scheduler
     init_scheduler()
     
+    # 接管中断的教案任务（启动时一次，之后定期检查）
+    if settings.LESSON_RESUME_ON_STARTUP:
+        from app.tasks.lesson_task import schedule_lesson_recovery
+        schedule_lesson_recovery()
+    
     yield
     
     # 关闭时清理资源
     from app.tasks.scheduler import shutdown_scheduler
     shutdown_scheduler()
+    from app.services.llm_clients import close_llm_clients
+    from app.services.llm_cache import close_llm_cache
+    await close_llm_clients()
+    await close_llm_cache()
+    from app.services.rag_service import close_rag_service
+    await close_rag_service()
     await engine.dispose()
     print("🔚 数据库连接已关闭")
 
@@ -51,12 +75,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 创建Socket.IO服务器
-sio = socketio.AsyncServer(
-    async_mode='asgi',
-    cors_allowed_origins=settings.CORS_ORIGINS
-)
-
 # 将Socket.IO集成到FastAPI
 socket_app = socketio.ASGIApp(sio, app)
 
@@ -78,22 +96,25 @@ async def root():
 @app.get("/health")
 async def health_check():
     """健康检查"""
+    from app.services.llm_cache import llm_cache
+    from app.services.rate_limiter import llm_rate_limiter
+    from app.services.llm_routing import llm_router
+    from app.services.circuit_breaker import circuit_breakers
+    from app.services.ai_service import llm_single_flight
+    from app.tasks.cancellation import lesson_tasks
+    from app.services.rag_service import rag_service
     return {
         "status": "healthy",
-        "service": "edusymphony-backend"
+        "service": "edusymphony-backend",
+        "llm_cache": llm_cache.get_stats(),
+        "llm_rate_limiter": llm_rate_limiter.get_stats(),
+        "llm_routing": llm_router.get_stats(),
+        "llm_circuit_breakers": circuit_breakers.get_stats(),
+        "llm_single_flight": llm_single_flight.get_stats(),
+        "lesson_tasks": lesson_tasks.get_stats(),
+        "rag_cache": rag_service.get_cache_stats()
     }
 
-# Socket.IO事件处理
-@sio.event
-async def connect(sid, environ):
-    """客户端连接"""
-    print(f"✅ Client connected: {sid}")
-
-@sio.event
-async def disconnect(sid):
-    """客户端断开"""
-    print(f"❌ Client disconnected: {sid}")
-
 # 导出应用（用于uvicorn）
 application = socket_app
 
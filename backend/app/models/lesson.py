@@ -45,12 +45,22 @@ class LessonPlan(Base):
     progress = Column(Integer, default=0)
     current_stage = Column(Integer, default=0)
     error_message = Column(Text)
+    worker_id = Column(String(100))  # 持有任务租约的进程
+    heartbeat_at = Column(TIMESTAMP)  # 租约最近一次续约时间
     
     # 内容
     source_type = Column(Enum(SourceType), nullable=False)
     source_content = Column(Text)
     parsed_content = Column(Text)
     final_content = Column(JSON)
+    checkpoint = Column(JSON)  # 已完成工作单元的检查点，用于断点续跑
+    content_embedding = Column(JSON)  # 教案内容的嵌入向量，用于构建各阶段的检索向量
+    
+    # LLM消耗统计
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    llm_calls = Column(Integer, default=0)
+    llm_latency_ms = Column(Integer, default=0)
     
     # 时间戳
     started_at = Column(TIMESTAMP)
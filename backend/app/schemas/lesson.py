@@ -28,6 +28,10 @@ class LessonResponse(BaseModel):
     progress: int
     current_stage: int
     final_content: Optional[Dict[str, Any]] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    llm_calls: Optional[int] = None
+    llm_latency_ms: Optional[int] = None
     created_at: datetime
     completed_at: Optional[datetime] = None
     
@@ -19,3 +19,29 @@ class TeachingModelResponse(BaseModel):
     class Config:
         from_attributes = True
 
+
+class TeachingModelUsageResponse(BaseModel):
+    """教学模型LLM消耗统计Schema（基于已完成的教案）"""
+    model_id: str
+    lesson_count: int
+    avg_prompt_tokens: float
+    avg_completion_tokens: float
+    avg_llm_calls: float
+    avg_llm_latency_ms: float
+
+
+class TeachingModelPlanResponse(BaseModel):
+    """教学模型执行计划Schema（单个教案的预计LLM消耗，token为按输出上限估算的上界）"""
+    model_id: str
+    version: str
+    stage_count: int
+    agent_count: int
+    discussion_rounds: int
+    vote_threshold: float
+    voting_strategy: str
+    llm_calls_min: int
+    llm_calls_max: int
+    prompt_tokens_max: int
+    completion_tokens_max: int
+    latency_seconds_min: Optional[float] = None
+    latency_seconds_max: Optional[float] = None
@@ -4,11 +4,11 @@
 """
 import asyncio
 import uuid
-from app.services.rag_service import RAGService
+from app.services.rag_service import rag_service, init_rag_service, close_rag_service
 
 async def init_references():
     """初始化参考资料"""
-    rag_service = RAGService()
+    await init_rag_service()
     
     # 教学理论参考
     theory_references = [
@@ -149,13 +149,26 @@ PBL能培养学生的问题解决能力、创新思维和团队协作能力。""
     # 合并所有参考资料
     all_references = theory_references + standard_references + case_references
     
+    # 去重：一次批量检索每条资料的最近邻，库中已有相同内容的跳过（脚本可重复执行）
+    nearest = await rag_service.search_references_batch([
+        {"query": ref["content"], "ref_type": ref["metadata"]["type"], "n_results": 1}
+        for ref in all_references
+    ])
+    new_references = [
+        ref for ref, matches in zip(all_references, nearest)
+        if not any(match["content"] == ref["content"] for match in matches)
+    ]
+    
     # 批量添加
-    await rag_service.batch_add_references(all_references)
+    if new_references:
+        await rag_service.batch_add_references(new_references)
     
     # 显示统计
     stats = await rag_service.get_collection_stats()
-    print(f"✅ 成功初始化 {len(all_references)} 条参考资料")
+    print(f"✅ 成功初始化 {len(new_references)} 条参考资料（跳过已存在 {len(all_references) - len(new_references)} 条）")
     print(f"📊 向量库总文档数: {stats['total_documents']}")
+    
+    await close_rag_service()
 
 if __name__ == "__main__":
     asyncio.run(init_references())
@@ -62,7 +62,8 @@ async def init_models():
                     {"role": "技术整合专家", "expertise": "技术工具、资源整合"}
                 ],
                 "discussion_rounds": 3,
-                "vote_threshold": 0.6
+                "vote_threshold": 0.6,
+                "voting_strategy": "per_opinion"
             },
             "applicable_subjects": ["科学", "数学", "物理", "化学", "生物", "地理"],
             "applicable_grades": ["小学", "初中", "高中"]
@@ -126,7 +127,8 @@ async def init_models():
                     {"role": "技术整合专家", "expertise": "技术工具、资源整合"}
                 ],
                 "discussion_rounds": 3,
-                "vote_threshold": 0.6
+                "vote_threshold": 0.6,
+                "voting_strategy": "per_opinion"
             },
             "applicable_subjects": ["全学科"],
             "applicable_grades": ["大学", "职业教育"]
@@ -183,7 +185,8 @@ async def init_models():
                     {"role": "技术整合专家", "expertise": "技术工具、资源整合"}
                 ],
                 "discussion_rounds": 3,
-                "vote_threshold": 0.6
+                "vote_threshold": 0.6,
+                "voting_strategy": "per_opinion"
             },
             "applicable_subjects": ["全学科"],
             "applicable_grades": ["初中", "高中", "大学"]
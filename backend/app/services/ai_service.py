@@ -1,50 +1,69 @@
 """
 AI服务
-集成多个AI模型提供商（OpenAI, Qwen等）
-实现重试和降级机制
+集成多个AI模型提供商（OpenAI, Qwen等），以及用于离线压测的模拟提供商
+实现熔断、降级、对冲请求、响应缓存、请求合并和限流机制，支持流式生成
 """
 import asyncio
-from typing import Optional, List, Dict
+import json
+import time
+from contextlib import aclosing
+from typing import Optional, List, Dict, Tuple, AsyncIterator
 from openai import AsyncOpenAI
 import httpx
 from tenacity import (
-    retry,
+    AsyncRetrying,
+    retry_if_exception,
     stop_after_attempt,
-    wait_exponential,
-    retry_if_exception_type
+    wait_random_exponential
 )
 from app.core.config import settings
+from app.services.llm_clients import llm_clients
+from app.services.llm_cache import llm_cache
+from app.services.rate_limiter import llm_rate_limiter
+from app.services.llm_routing import llm_router
+from app.services.mock_llm import mock_llm
+from app.services.single_flight import SingleFlight
+from app.services.token_budget import (
+    estimate_tokens,
+    fit_prompt_to_context,
+    record_usage
+)
+from app.services.circuit_breaker import (
+    circuit_breakers,
+    CircuitOpenError,
+    is_provider_failure,
+    is_rate_limited,
+    is_retryable_error
+)
 from loguru import logger
 
+# 进程级共享：合并相同请求（提示词、模型和采样参数都相同）的并发调用
+llm_single_flight = SingleFlight()
+
 class AIService:
     """AI服务类"""
     
     def __init__(self):
-        # OpenAI客户端
-        self.openai_client = AsyncOpenAI(
-            api_key=settings.OPENAI_API_KEY,
-            base_url=settings.OPENAI_BASE_URL
-        ) if settings.OPENAI_API_KEY else None
-        
         # Qwen API配置
         self.qwen_api_key = settings.QWEN_API_KEY
         self.qwen_base_url = settings.QWEN_BASE_URL
     
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=10),
-        retry=retry_if_exception_type((httpx.HTTPError, asyncio.TimeoutError))
-    )
+    @property
+    def openai_client(self) -> Optional[AsyncOpenAI]:
+        """OpenAI客户端（进程级共享连接池）"""
+        return llm_clients.get_openai_client()
+    
     async def generate(
         self,
         prompt: str,
         model: str = "gpt-4",
         temperature: float = 0.7,
         max_tokens: int = 2000,
-        system_message: Optional[str] = None
+        system_message: Optional[str] = None,
+        use_cache: Optional[bool] = None
     ) -> str:
         """
-        生成AI响应（带重试机制）
+        生成AI响应（带缓存、请求合并、熔断降级机制）
         
         Args:
             prompt: 用户提示词
@@ -52,35 +71,251 @@ class AIService:
             temperature: 温度参数
             max_tokens: 最大token数
             system_message: 系统消息
+            use_cache: 是否使用响应缓存，None时按温度自动决定
         
         Returns:
             AI生成的文本
         """
+        candidates = self._candidate_providers(model)
+        if not candidates:
+            response, _, _ = await self._generate_uncached(
+                prompt, model, temperature, max_tokens, system_message
+            )
+            return response
+        
+        # 按首选提供商查找缓存；降级得到的响应只缓存在实际应答的提供商名下
+        primary, primary_model = candidates[0]
+        request_key = llm_cache.make_key(
+            prompt, primary, primary_model, temperature, max_tokens, system_message
+        )
+        caching = llm_cache.should_cache(temperature, use_cache)
+        if caching:
+            cached = await llm_cache.get(request_key)
+            if cached is not None:
+                return cached
+        
+        # 相同请求正在进行中时共享其结果，不重复调用模型（与是否缓存无关）
+        async def generate_shared() -> str:
+            response, provider, provider_model = await self._generate_uncached(
+                prompt, model, temperature, max_tokens, system_message
+            )
+            if caching:
+                await llm_cache.set(
+                    llm_cache.make_key(
+                        prompt, provider, provider_model, temperature, max_tokens, system_message
+                    ),
+                    response
+                )
+            return response
+        
+        return await llm_single_flight.do(request_key, generate_shared)
+    
+    async def _generate_uncached(
+        self,
+        prompt: str,
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        system_message: Optional[str]
+    ) -> Tuple[str, str, str]:
+        """
+        调用模型生成响应（带熔断、降级和对冲）
+        处于熔断状态的提供商直接跳过，不再重试整条调用链
+        
+        Returns:
+            (响应文本, 实际应答的提供商, 模型)
+        """
+        candidates = self._candidate_providers(model)
+        if not candidates:
+            raise Exception("未配置任何可用的AI模型")
+        
+        providers = llm_router.order_providers([
+            (provider, provider_model) for provider, provider_model in candidates
+            if circuit_breakers.get(provider).is_available()
+        ])
+        if not providers:
+            raise CircuitOpenError("/".join(provider for provider, _ in candidates))
+        
+        llm_router.hedge_budget.on_request()
+        
+        if settings.LLM_HEDGE_ENABLED and len(providers) > 1:
+            return await self._hedged_call(
+                providers, prompt, temperature, max_tokens, system_message
+            )
+        
+        return await self._call_with_fallback(
+            providers, prompt, temperature, max_tokens, system_message
+        )
+    
+    def _candidate_providers(self, model: str) -> List[Tuple[str, str]]:
+        """按配置优先级返回可用的(提供商, 模型)列表"""
+        # 离线压测模式：只使用模拟提供商
+        if settings.LLM_PROVIDER == "mock":
+            return [("mock", model)]
+        
+        providers = []
+        
+        # 优先使用OpenAI
+        if self.openai_client and model.startswith("gpt"):
+            providers.append(("openai", model))
+        
+        # 降级到Qwen
+        if self.qwen_api_key and (not providers or model.startswith("gpt")):
+            providers.append(("qwen", settings.QWEN_MODEL))
+        
+        return providers
+    
+    async def _call_provider(
+        self,
+        provider: str,
+        provider_model: str,
+        prompt: str,
+        temperature: float,
+        max_tokens: int,
+        system_message: Optional[str]
+    ) -> Tuple[str, str, str]:
+        """
+        调用指定提供商，返回(响应文本, 提供商, 模型)
+        超时、5xx和限流等暂时性错误按随机指数退避重试，每次尝试都经过熔断器，
+        熔断器打开后不再重试
+        """
+        # 超出上下文窗口的提示词先截断，避免请求直接被拒
+        prompt = fit_prompt_to_context(prompt, provider_model, max_tokens, system_message)
+        
+        async for attempt in AsyncRetrying(
+            stop=stop_after_attempt(max(1, settings.LLM_RETRY_ATTEMPTS)),
+            wait=wait_random_exponential(multiplier=1, max=settings.LLM_RETRY_MAX_WAIT),
+            retry=retry_if_exception(is_retryable_error),
+            before_sleep=lambda state: logger.warning(
+                f"AI生成失败({provider})，第{state.attempt_number}次重试: "
+                f"{str(state.outcome.exception())}"
+            ),
+            reraise=True
+        ):
+            with attempt:
+                result = await self._call_provider_once(
+                    provider, provider_model, prompt, temperature, max_tokens, system_message
+                )
+        return result, provider, provider_model
+    
+    async def _call_provider_once(
+        self,
+        provider: str,
+        provider_model: str,
+        prompt: str,
+        temperature: float,
+        max_tokens: int,
+        system_message: Optional[str]
+    ) -> str:
+        """经过熔断器调用一次指定提供商"""
+        breaker = circuit_breakers.get(provider)
+        if not breaker.allow_request():
+            raise CircuitOpenError(provider)
+        
         try:
-            # 优先使用OpenAI
-            if self.openai_client and model.startswith("gpt"):
-                return await self._call_openai(
-                    prompt, model, temperature, max_tokens, system_message
+            if provider == "openai":
+                result = await self._call_openai(
+                    prompt, provider_model, temperature, max_tokens, system_message
                 )
-            
-            # 降级到Qwen
-            elif self.qwen_api_key:
-                return await self._call_qwen(
-                    prompt, temperature, max_tokens, system_message
+            elif provider == "mock":
+                result = await self._call_mock(
+                    prompt, provider_model, max_tokens, system_message
                 )
-            
             else:
-                raise Exception("未配置任何可用的AI模型")
-                
-        except Exception as e:
-            logger.error(f"AI生成失败: {str(e)}")
-            # 尝试降级
-            if model.startswith("gpt") and self.qwen_api_key:
-                logger.info("降级到Qwen模型")
-                return await self._call_qwen(
+                result = await self._call_qwen(
                     prompt, temperature, max_tokens, system_message
                 )
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception as e:
+            if is_rate_limited(e):
+                # 限流只需退避，不说明提供商不可用，也不能证明已恢复
+                breaker.release()
+            elif is_provider_failure(e):
+                breaker.record_failure()
+            else:
+                # 请求本身有误，但提供商可正常响应
+                breaker.record_success()
             raise
+        
+        breaker.record_success()
+        return result
+    
+    async def _call_with_fallback(
+        self,
+        providers: List[Tuple[str, str]],
+        prompt: str,
+        temperature: float,
+        max_tokens: int,
+        system_message: Optional[str]
+    ) -> Tuple[str, str, str]:
+        """依次尝试各提供商，失败时降级到下一个"""
+        for index, (provider, provider_model) in enumerate(providers):
+            try:
+                return await self._call_provider(
+                    provider, provider_model, prompt, temperature, max_tokens, system_message
+                )
+            except Exception as e:
+                if not isinstance(e, CircuitOpenError):
+                    logger.error(f"AI生成失败({provider}): {str(e)}")
+                if index == len(providers) - 1:
+                    raise
+                logger.info(f"降级到{providers[index + 1][0]}模型")
+    
+    async def _hedged_call(
+        self,
+        providers: List[Tuple[str, str]],
+        prompt: str,
+        temperature: float,
+        max_tokens: int,
+        system_message: Optional[str]
+    ) -> Tuple[str, str, str]:
+        """
+        对冲请求
+        主提供商超过延迟分位数仍未返回时，向备用提供商发送备份请求，
+        取先成功返回的结果
+        """
+        (primary, primary_model), (backup, backup_model) = providers[0], providers[1]
+        
+        tasks = {
+            asyncio.create_task(self._call_provider(
+                primary, primary_model, prompt, temperature, max_tokens, system_message
+            ))
+        }
+        
+        hedged = False
+        try:
+            delay = llm_router.hedge_delay(primary, primary_model)
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and llm_router.hedge_budget.try_spend():
+                    logger.info(f"主请求超过{delay:.1f}s未返回，向{backup}发送对冲请求")
+                    tasks.add(asyncio.create_task(self._call_provider(
+                        backup, backup_model, prompt, temperature, max_tokens, system_message
+                    )))
+                    hedged = True
+            
+            last_error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                    logger.error(f"AI生成失败: {str(last_error)}")
+            
+            if hedged:
+                raise last_error
+            
+            # 主请求失败且未发出对冲请求，按常规流程降级
+            logger.info(f"降级到{backup}模型")
+            return await self._call_with_fallback(
+                providers[1:], prompt, temperature, max_tokens, system_message
+            )
+        finally:
+            for task in tasks:
+                task.cancel()
     
     async def _call_openai(
         self,
@@ -91,21 +326,29 @@ class AIService:
         system_message: Optional[str]
     ) -> str:
         """调用OpenAI API"""
-        messages = []
+        messages = self._build_messages(prompt, system_message)
         
-        if system_message:
-            messages.append({"role": "system", "content": system_message})
+        estimated_tokens = self._estimate_request_tokens(prompt, system_message, max_tokens, model)
+        async with llm_rate_limiter.limit("openai", model, estimated_tokens):
+            started_at = time.monotonic()
+            response = await self.openai_client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+            latency = time.monotonic() - started_at
+            llm_router.latency.record("openai", model, latency)
         
-        messages.append({"role": "user", "content": prompt})
-        
-        response = await self.openai_client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens
-        )
+        content = response.choices[0].message.content
+        if response.usage:
+            record_usage(response.usage.prompt_tokens, response.usage.completion_tokens, latency)
+        else:
+            record_usage(
+                estimated_tokens - max_tokens, estimate_tokens(content, model), latency
+            )
         
-        return response.choices[0].message.content
+        return content
     
     async def _call_qwen(
         self,
@@ -114,30 +357,325 @@ class AIService:
         max_tokens: int,
         system_message: Optional[str]
     ) -> str:
-        """调用通义千问API"""
-        import dashscope
-        from dashscope import Generation
+        """
+        调用通义千问API
+        直接请求DashScope HTTP接口，使用共享连接池，不阻塞事件循环
+        """
+        messages = self._build_messages(prompt, system_message)
+        
+        client = llm_clients.get_http_client("qwen")
+        estimated_tokens = self._estimate_request_tokens(
+            prompt, system_message, max_tokens, settings.QWEN_MODEL
+        )
+        async with llm_rate_limiter.limit("qwen", settings.QWEN_MODEL, estimated_tokens):
+            started_at = time.monotonic()
+            response = await client.post(
+                f"{self.qwen_base_url}/services/aigc/text-generation/generation",
+                headers={"Authorization": f"Bearer {self.qwen_api_key}"},
+                json={
+                    "model": settings.QWEN_MODEL,
+                    "input": {"messages": messages},
+                    "parameters": {
+                        "result_format": "message",
+                        "temperature": temperature,
+                        "max_tokens": max_tokens
+                    }
+                }
+            )
+        
+        if response.status_code == 200:
+            latency = time.monotonic() - started_at
+            llm_router.latency.record("qwen", settings.QWEN_MODEL, latency)
+            data = response.json()
+            usage = data.get("usage", {})
+            record_usage(
+                usage.get("input_tokens", 0), usage.get("output_tokens", 0), latency
+            )
+            return data["output"]["choices"][0]["message"]["content"]
+        else:
+            raise httpx.HTTPStatusError(
+                f"Qwen API错误: {self._qwen_error_message(response)}",
+                request=response.request,
+                response=response
+            )
+    
+    async def _call_mock(
+        self,
+        prompt: str,
+        model: str,
+        max_tokens: int,
+        system_message: Optional[str]
+    ) -> str:
+        """调用模拟提供商（不发起网络请求）"""
+        estimated_tokens = self._estimate_request_tokens(prompt, system_message, max_tokens, model)
+        async with llm_rate_limiter.limit("mock", model, estimated_tokens):
+            started_at = time.monotonic()
+            content = await mock_llm.generate(prompt, max_tokens, system_message)
+            latency = time.monotonic() - started_at
+            llm_router.latency.record("mock", model, latency)
         
-        dashscope.api_key = self.qwen_api_key
+        record_usage(estimated_tokens - max_tokens, estimate_tokens(content, model), latency)
+        return content
+    
+    async def generate_stream(
+        self,
+        prompt: str,
+        model: str = "gpt-4",
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        system_message: Optional[str] = None,
+        use_cache: Optional[bool] = None
+    ) -> AsyncIterator[str]:
+        """
+        流式生成AI响应
+        调用方提前结束迭代（break或aclose）会立即关闭上游连接，
+        不再为剩余token付费
+        
+        Args:
+            参数同generate方法
+        
+        Yields:
+            增量文本片段
+        """
+        candidates = self._candidate_providers(model)
+        caching = bool(candidates) and llm_cache.should_cache(temperature, use_cache)
+        if caching:
+            primary, primary_model = candidates[0]
+            cached = await llm_cache.get(llm_cache.make_key(
+                prompt, primary, primary_model, temperature, max_tokens, system_message
+            ))
+            if cached is not None:
+                yield cached
+                return
+        
+        if not candidates:
+            raise Exception("未配置任何可用的AI模型")
+        providers = [
+            (provider, provider_model) for provider, provider_model in candidates
+            if circuit_breakers.get(provider).is_available()
+        ]
+        if not providers:
+            raise CircuitOpenError("/".join(provider for provider, _ in candidates))
+        
+        chunks = []
+        for index, (provider, provider_model) in enumerate(providers):
+            try:
+                # 调用方提前结束时显式关闭内层生成器，立即断开上游连接
+                async with aclosing(self._stream_provider(
+                    provider, provider_model, prompt, temperature, max_tokens, system_message
+                )) as stream:
+                    async for chunk in stream:
+                        chunks.append(chunk)
+                        yield chunk
+                break
+            except Exception as e:
+                # 已输出部分内容时无法无缝降级
+                if chunks or index == len(providers) - 1:
+                    raise
+                if not isinstance(e, CircuitOpenError):
+                    logger.error(f"AI流式生成失败({provider}): {str(e)}")
+                logger.info(f"降级到{providers[index + 1][0]}模型")
+        
+        # 仅完整生成的结果写入缓存，缓存在实际应答的提供商名下
+        if caching:
+            await llm_cache.set(
+                llm_cache.make_key(
+                    prompt, provider, provider_model, temperature, max_tokens, system_message
+                ),
+                "".join(chunks)
+            )
+    
+    async def _stream_provider(
+        self,
+        provider: str,
+        provider_model: str,
+        prompt: str,
+        temperature: float,
+        max_tokens: int,
+        system_message: Optional[str]
+    ) -> AsyncIterator[str]:
+        """
+        流式调用指定提供商，熔断、延迟和用量的记录与_call_provider一致
+        收到首个片段即视为提供商可用；完整结束时记录延迟，
+        用量按已生成的内容记录（调用方提前结束时同样计入）
+        """
+        breaker = circuit_breakers.get(provider)
+        if not breaker.allow_request():
+            raise CircuitOpenError(provider)
+        
+        if provider == "openai":
+            stream = self._stream_openai(
+                prompt, provider_model, temperature, max_tokens, system_message
+            )
+        elif provider == "mock":
+            stream = self._stream_mock(prompt, provider_model, max_tokens, system_message)
+        else:
+            stream = self._stream_qwen(prompt, temperature, max_tokens, system_message)
         
+        prompt_tokens = self._estimate_request_tokens(
+            prompt, system_message, 0, provider_model
+        )
+        started_at = time.monotonic()
+        chunks = []
+        completed = False
+        try:
+            async for chunk in stream:
+                if not chunks:
+                    breaker.record_success()
+                chunks.append(chunk)
+                yield chunk
+            completed = True
+        except Exception as e:
+            if is_rate_limited(e):
+                if not chunks:
+                    breaker.release()
+            elif is_provider_failure(e):
+                breaker.record_failure()
+            elif not chunks:
+                # 请求本身有误，但提供商可正常响应
+                breaker.record_success()
+            raise
+        except BaseException:
+            # 取消或调用方提前结束，未得出结论时归还探测名额
+            if not chunks:
+                breaker.release()
+            raise
+        finally:
+            await stream.aclose()
+            latency = time.monotonic() - started_at
+            if completed:
+                if not chunks:
+                    breaker.record_success()
+                llm_router.latency.record(provider, provider_model, latency)
+            if chunks or completed:
+                record_usage(
+                    prompt_tokens,
+                    estimate_tokens("".join(chunks), provider_model),
+                    latency
+                )
+    
+    async def _stream_mock(
+        self,
+        prompt: str,
+        model: str,
+        max_tokens: int,
+        system_message: Optional[str]
+    ) -> AsyncIterator[str]:
+        """流式调用模拟提供商（不发起网络请求）"""
+        estimated_tokens = self._estimate_request_tokens(prompt, system_message, max_tokens, model)
+        async with llm_rate_limiter.limit("mock", model, estimated_tokens):
+            async for chunk in mock_llm.stream(prompt, max_tokens, system_message):
+                yield chunk
+    
+    async def _stream_openai(
+        self,
+        prompt: str,
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        system_message: Optional[str]
+    ) -> AsyncIterator[str]:
+        """流式调用OpenAI API"""
+        prompt = fit_prompt_to_context(prompt, model, max_tokens, system_message)
+        messages = self._build_messages(prompt, system_message)
+        
+        estimated_tokens = self._estimate_request_tokens(prompt, system_message, max_tokens, model)
+        async with llm_rate_limiter.limit("openai", model, estimated_tokens):
+            stream = await self.openai_client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True
+            )
+            async with stream:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+    
+    async def _stream_qwen(
+        self,
+        prompt: str,
+        temperature: float,
+        max_tokens: int,
+        system_message: Optional[str]
+    ) -> AsyncIterator[str]:
+        """流式调用通义千问API（SSE增量输出）"""
+        prompt = fit_prompt_to_context(prompt, settings.QWEN_MODEL, max_tokens, system_message)
+        messages = self._build_messages(prompt, system_message)
+        
+        client = llm_clients.get_http_client("qwen")
+        estimated_tokens = self._estimate_request_tokens(
+            prompt, system_message, max_tokens, settings.QWEN_MODEL
+        )
+        async with llm_rate_limiter.limit("qwen", settings.QWEN_MODEL, estimated_tokens):
+            async with client.stream(
+                "POST",
+                f"{self.qwen_base_url}/services/aigc/text-generation/generation",
+                headers={
+                    "Authorization": f"Bearer {self.qwen_api_key}",
+                    "Accept": "text/event-stream",
+                    "X-DashScope-SSE": "enable"
+                },
+                json={
+                    "model": settings.QWEN_MODEL,
+                    "input": {"messages": messages},
+                    "parameters": {
+                        "result_format": "message",
+                        "incremental_output": True,
+                        "temperature": temperature,
+                        "max_tokens": max_tokens
+                    }
+                }
+            ) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    raise httpx.HTTPStatusError(
+                        f"Qwen API错误: {self._qwen_error_message(response)}",
+                        request=response.request,
+                        response=response
+                    )
+                
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    
+                    data = json.loads(line[len("data:"):])
+                    choices = data.get("output", {}).get("choices") or []
+                    if choices and choices[0]["message"].get("content"):
+                        yield choices[0]["message"]["content"]
+    
+    @staticmethod
+    def _build_messages(prompt: str, system_message: Optional[str]) -> List[Dict]:
+        """构建对话消息列表"""
         messages = []
         if system_message:
             messages.append({"role": "system", "content": system_message})
         
         messages.append({"role": "user", "content": prompt})
-        
-        response = Generation.call(
-            model='qwen-max',
-            messages=messages,
-            result_format='message',
-            temperature=temperature,
-            max_tokens=max_tokens
+        return messages
+    
+    @staticmethod
+    def _estimate_request_tokens(
+        prompt: str,
+        system_message: Optional[str],
+        max_tokens: int,
+        model: str
+    ) -> int:
+        """估算单次请求的token消耗（提示词+最大输出，用于TPM限流）"""
+        return (
+            estimate_tokens(prompt, model)
+            + estimate_tokens(system_message, model)
+            + max_tokens
         )
-        
-        if response.status_code == 200:
-            return response.output.choices[0].message.content
-        else:
-            raise Exception(f"Qwen API错误: {response.message}")
+    
+    @staticmethod
+    def _qwen_error_message(response: httpx.Response) -> str:
+        """提取DashScope错误信息"""
+        try:
+            return response.json().get("message") or response.text
+        except ValueError:
+            return response.text
     
     async def batch_generate(
         self,
@@ -149,6 +687,7 @@ class AIService:
     ) -> List[str]:
         """
         批量生成AI响应
+        并发度由共享限流器控制，超出配额的请求排队等待
         
         Args:
             prompts: 提示词列表
@@ -210,8 +749,6 @@ class AIService:
         Returns:
             结构化的字典数据
         """
-        import json
-        
         system_message = f"你是一个专业的教学设计专家。请严格按照以下JSON结构返回结果：\n{json.dumps(schema, ensure_ascii=False, indent=2)}"
         
         response = await self.generate(
@@ -0,0 +1,174 @@
+"""
+熔断器
+按提供商维护进程级共享的熔断状态（closed/open/half-open）
+提供商被判定为不可用期间，调用直接跳过该提供商
+"""
+import asyncio
+import enum
+import time
+from typing import Dict, Optional
+import httpx
+import openai
+from loguru import logger
+
+from app.core.config import settings
+from app.services.mock_llm import MockLLMError
+
+
+class CircuitState(str, enum.Enum):
+    """熔断状态"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """提供商处于熔断状态"""
+
+    def __init__(self, provider: str):
+        super().__init__(f"{provider} 处于熔断状态，暂时跳过")
+        self.provider = provider
+
+
+class CircuitBreaker:
+    """单个提供商的熔断器"""
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int,
+        recovery_timeout: float,
+        half_open_max_calls: int = 1
+    ):
+        """
+        Args:
+            name: 提供商名称
+            failure_threshold: 连续失败多少次后熔断
+            recovery_timeout: 熔断后多久进入半开状态（秒）
+            half_open_max_calls: 半开状态下允许的探测请求数
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+
+    def _refresh_state(self):
+        """熔断超时后转为半开状态"""
+        if (
+            self.state == CircuitState.OPEN
+            and time.monotonic() - self._opened_at >= self.recovery_timeout
+        ):
+            self.state = CircuitState.HALF_OPEN
+            self._half_open_calls = 0
+            logger.info(f"🟡 {self.name} 熔断器进入半开状态，等待探测")
+
+    def is_available(self) -> bool:
+        """是否可以向该提供商发送请求（不占用探测名额）"""
+        self._refresh_state()
+        if self.state == CircuitState.CLOSED:
+            return True
+        if self.state == CircuitState.HALF_OPEN:
+            return self._half_open_calls < self.half_open_max_calls
+        return False
+
+    def allow_request(self) -> bool:
+        """申请发送请求，半开状态下占用一个探测名额"""
+        if not self.is_available():
+            return False
+        if self.state == CircuitState.HALF_OPEN:
+            self._half_open_calls += 1
+        return True
+
+    def record_success(self):
+        """记录成功调用"""
+        if self.state != CircuitState.CLOSED:
+            logger.info(f"🟢 {self.name} 已恢复，熔断器关闭")
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self._half_open_calls = 0
+
+    def record_failure(self):
+        """记录失败调用"""
+        self.failures += 1
+        if self.state == CircuitState.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != CircuitState.OPEN:
+                logger.warning(f"🔴 {self.name} 连续失败 {self.failures} 次，熔断器打开")
+            self.state = CircuitState.OPEN
+            self._opened_at = time.monotonic()
+            self._half_open_calls = 0
+
+    def release(self):
+        """请求被取消（未得出结论），归还探测名额"""
+        if self.state == CircuitState.HALF_OPEN and self._half_open_calls > 0:
+            self._half_open_calls -= 1
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    """提取HTTP状态码（非HTTP状态错误时为None）"""
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code
+    return None
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """是否为限流（429）：提供商可用，只是需要退避"""
+    return _status_code(error) == 429
+
+
+def is_provider_failure(error: Exception) -> bool:
+    """
+    判断异常是否说明提供商不可用
+    4xx（包括限流429）属于请求本身或配额的问题，不计入熔断
+    """
+    status_code = _status_code(error)
+    if status_code is not None:
+        return status_code >= 500
+    return True
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """判断异常是否为暂时性错误（超时、连接错误、5xx、限流429），可退避后重试"""
+    status_code = _status_code(error)
+    if status_code is not None:
+        return status_code >= 500 or status_code == 429
+    return isinstance(error, (
+        httpx.TransportError,
+        openai.APIConnectionError,
+        asyncio.TimeoutError,
+        MockLLMError
+    ))
+
+
+class CircuitBreakerRegistry:
+    """熔断器注册表（每个提供商一个）"""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, provider: str) -> CircuitBreaker:
+        if provider not in self._breakers:
+            self._breakers[provider] = CircuitBreaker(
+                provider,
+                failure_threshold=settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+                recovery_timeout=settings.LLM_CIRCUIT_RECOVERY_TIMEOUT,
+                half_open_max_calls=settings.LLM_CIRCUIT_HALF_OPEN_CALLS
+            )
+        return self._breakers[provider]
+
+    def get_stats(self) -> Dict:
+        """获取各提供商熔断状态"""
+        return {
+            name: {"state": breaker.state.value, "failures": breaker.failures}
+            for name, breaker in self._breakers.items()
+        }
+
+
+# 进程级共享的熔断器注册表
+circuit_breakers = CircuitBreakerRegistry()
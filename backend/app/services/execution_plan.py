@@ -0,0 +1,265 @@
+"""
+教学模型执行计划
+将TeachingModel.config校验并编译为不可变的执行计划：预解析提示词模板、
+固定讨论参数，并估算每个教案的LLM调用次数和token量
+编译结果按(模型ID, updated_at)缓存，模型配置更新后自动重新编译
+"""
+from dataclasses import dataclass
+from string import Formatter
+from typing import Optional, Tuple
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.models.teaching_model import TeachingModel
+from app.services.llm_routing import llm_router
+from app.services.token_budget import estimate_tokens
+
+# 各协作阶段的模型和输出上限（任务处理器与成本估算共用）
+LESSON_LLM_MODEL = "gpt-4"
+STAGE1_MAX_TOKENS = 1500
+VOTE_MAX_TOKENS = 500
+BALLOT_MAX_TOKENS_PER_OPINION = 400
+BALLOT_MAX_TOKENS = 2000
+
+VOTING_STRATEGIES = ("per_opinion", "ballot")
+TEMPLATE_FIELDS = ("agent_role", "content")
+
+
+class ExecutionPlanError(ValueError):
+    """教学模型配置无效"""
+
+
+@dataclass(frozen=True)
+class AgentSpec:
+    """专家角色"""
+    role: str
+    expertise: str
+
+
+@dataclass(frozen=True)
+class StagePlan:
+    """
+    教学阶段
+    template_parts为预解析的模板：[(字面文本, 字段名或None), ...]
+    intent为阶段意图的简短描述，用于构建该阶段的参考资料检索向量
+    """
+    id: str
+    name: str
+    template_parts: Tuple[Tuple[str, Optional[str]], ...]
+    intent: str
+
+    def render(self, agent_role: str, content: str) -> str:
+        """填充提示词模板"""
+        values = {"agent_role": agent_role, "content": content}
+        return "".join(
+            literal + (values[field] if field else "")
+            for literal, field in self.template_parts
+        )
+
+    @property
+    def template_text(self) -> str:
+        """模板中的固定文本（不含字段）"""
+        return "".join(literal for literal, _ in self.template_parts)
+
+
+@dataclass(frozen=True)
+class PlanEstimate:
+    """单个教案的LLM消耗估算（按输出上限计，为上界）"""
+    llm_calls_min: int
+    llm_calls_max: int
+    prompt_tokens_max: int
+    completion_tokens_max: int
+    latency_seconds_min: Optional[float]
+    latency_seconds_max: Optional[float]
+
+
+@dataclass(frozen=True)
+class ExecutionPlan:
+    """编译后的教学模型执行计划"""
+    model_id: str
+    model_name: str
+    version: str
+    stages: Tuple[StagePlan, ...]
+    agents: Tuple[AgentSpec, ...]
+    rounds: int
+    vote_threshold: float
+    voting_strategy: str
+
+    @property
+    def vote_max_tokens(self) -> int:
+        """单次投票调用的输出上限"""
+        if self.voting_strategy == "ballot":
+            return min(BALLOT_MAX_TOKENS_PER_OPINION * len(self.agents), BALLOT_MAX_TOKENS)
+        return VOTE_MAX_TOKENS
+
+    def estimate(self) -> PlanEstimate:
+        """
+        估算单个教案的LLM消耗
+        Stage 1每个(阶段, 专家)一次调用；Stage 2每轮per_opinion为每个方案一次调用，
+        ballot为每个阶段一次调用，至少1轮、至多rounds轮
+        """
+        stage_count = len(self.stages)
+        agent_count = len(self.agents)
+        opinion_tokens = STAGE1_MAX_TOKENS
+
+        # Stage 1：模板 + 教材内容 + 参考资料
+        stage1_prompt = sum(
+            estimate_tokens(stage.template_text, LESSON_LLM_MODEL)
+            + settings.LESSON_CONTENT_TOKEN_BUDGET
+            + settings.LESSON_REFERENCE_TOKEN_BUDGET
+            for stage in self.stages
+        ) * agent_count
+        stage1_calls = stage_count * agent_count
+
+        # Stage 2：每轮的调用次数和提示词大小
+        if self.voting_strategy == "ballot":
+            votes_per_round = stage_count
+            vote_prompt = agent_count * min(
+                opinion_tokens, settings.LESSON_BALLOT_OPINION_TOKEN_BUDGET
+            )
+        else:
+            votes_per_round = stage_count * agent_count
+            # 当前方案全文 + 其他方案摘要（各约200字）
+            vote_prompt = opinion_tokens + (agent_count - 1) * 250
+        # 上一轮投票理由
+        vote_prompt += agent_count * 150
+
+        stage2_calls_max = votes_per_round * self.rounds
+
+        # 每个阶段的关键路径：1次分析 + 每轮1次投票
+        p50 = _median_latency()
+        latency_min = latency_max = None
+        if p50 is not None:
+            latency_min = round(p50 * 2, 2)
+            latency_max = round(p50 * (1 + self.rounds), 2)
+
+        return PlanEstimate(
+            llm_calls_min=stage1_calls + votes_per_round,
+            llm_calls_max=stage1_calls + stage2_calls_max,
+            prompt_tokens_max=stage1_prompt + vote_prompt * stage2_calls_max,
+            completion_tokens_max=(
+                stage1_calls * STAGE1_MAX_TOKENS + stage2_calls_max * self.vote_max_tokens
+            ),
+            latency_seconds_min=latency_min,
+            latency_seconds_max=latency_max
+        )
+
+
+def _median_latency() -> Optional[float]:
+    """按提供商优先级取第一个有足够样本的中位延迟（秒）"""
+    if settings.LLM_PROVIDER == "mock":
+        candidates = [("mock", LESSON_LLM_MODEL)]
+    else:
+        candidates = [("openai", LESSON_LLM_MODEL), ("qwen", settings.QWEN_MODEL)]
+
+    for provider, model in candidates:
+        p50 = llm_router.latency.percentile(provider, model, 0.5)
+        if p50 is not None:
+            return p50
+    return None
+
+
+def _parse_template(stage_id: str, template) -> Tuple[Tuple[str, Optional[str]], ...]:
+    """预解析提示词模板，只允许agent_role和content两个字段"""
+    if not isinstance(template, str) or not template.strip():
+        raise ExecutionPlanError(f"阶段 {stage_id} 缺少提示词模板")
+
+    try:
+        parsed = list(Formatter().parse(template))
+    except ValueError as e:
+        raise ExecutionPlanError(f"阶段 {stage_id} 提示词模板格式错误: {e}")
+
+    parts = []
+    for literal, field, format_spec, conversion in parsed:
+        if field is not None:
+            if field not in TEMPLATE_FIELDS:
+                raise ExecutionPlanError(
+                    f"阶段 {stage_id} 提示词模板包含未知字段: {{{field}}}"
+                )
+            if format_spec or conversion:
+                raise ExecutionPlanError(
+                    f"阶段 {stage_id} 提示词模板字段不支持格式说明: {{{field}}}"
+                )
+        parts.append((literal, field))
+    return tuple(parts)
+
+
+def compile_execution_plan(model: TeachingModel) -> ExecutionPlan:
+    """
+    校验并编译教学模型配置
+
+    Raises:
+        ExecutionPlanError: 配置无效
+    """
+    config = model.config or {}
+
+    raw_stages = config.get("stages") or []
+    if not isinstance(raw_stages, list) or not raw_stages:
+        raise ExecutionPlanError("教学模型未配置教学阶段")
+
+    stages = []
+    for stage in raw_stages:
+        if not isinstance(stage, dict) or not stage.get("id") or not stage.get("name"):
+            raise ExecutionPlanError("教学阶段缺少id或name")
+        stages.append(StagePlan(
+            id=stage["id"],
+            name=stage["name"],
+            template_parts=_parse_template(stage["id"], stage.get("prompt_template")),
+            intent=stage.get("description") or stage["name"]
+        ))
+
+    # 阶段名称用作讨论记录的主题，需唯一
+    if len({stage.id for stage in stages}) != len(stages):
+        raise ExecutionPlanError("教学阶段id重复")
+    if len({stage.name for stage in stages}) != len(stages):
+        raise ExecutionPlanError("教学阶段名称重复")
+
+    raw_agents = config.get("agents") or []
+    if not isinstance(raw_agents, list) or not raw_agents:
+        raise ExecutionPlanError("教学模型未配置专家角色")
+
+    agents = []
+    for agent in raw_agents:
+        if not isinstance(agent, dict) or not agent.get("role"):
+            raise ExecutionPlanError("专家角色缺少role")
+        agents.append(AgentSpec(role=agent["role"], expertise=agent.get("expertise", "")))
+
+    if len({agent.role for agent in agents}) != len(agents):
+        raise ExecutionPlanError("专家角色重复")
+
+    rounds = config.get("discussion_rounds", 3)
+    if not isinstance(rounds, int) or rounds < 1:
+        raise ExecutionPlanError(f"讨论轮数无效: {rounds}")
+
+    vote_threshold = config.get("vote_threshold", 0.6)
+    if not isinstance(vote_threshold, (int, float)) or not 0 < vote_threshold <= 1:
+        raise ExecutionPlanError(f"投票通过阈值无效: {vote_threshold}")
+
+    voting_strategy = config.get("voting_strategy", "per_opinion")
+    if voting_strategy not in VOTING_STRATEGIES:
+        raise ExecutionPlanError(f"不支持的投票方式: {voting_strategy}")
+
+    return ExecutionPlan(
+        model_id=model.id,
+        model_name=model.name,
+        version=str(model.updated_at),
+        stages=tuple(stages),
+        agents=tuple(agents),
+        rounds=rounds,
+        vote_threshold=float(vote_threshold),
+        voting_strategy=voting_strategy
+    )
+
+
+# 编译结果缓存，键包含updated_at，模型更新后旧条目自然失效
+_plan_cache = TTLCache(max_entries=256, ttl=3600)
+
+
+def get_execution_plan(model: TeachingModel) -> ExecutionPlan:
+    """获取教学模型的执行计划（带缓存）"""
+    key = f"{model.id}:{model.updated_at}"
+    plan = _plan_cache.get(key)
+    if plan is None:
+        plan = compile_execution_plan(model)
+        _plan_cache.set(key, plan)
+    return plan
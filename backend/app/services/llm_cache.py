@@ -0,0 +1,165 @@
+"""
+LLM响应缓存
+按提示词、系统消息、实际应答的提供商和模型、采样参数的哈希寻址
+第一层为进程内LRU，第二层为Redis（出错后暂停访问一段时间）
+"""
+import hashlib
+import json
+import time
+from typing import Dict, Optional
+from loguru import logger
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+
+class LLMResponseCache:
+    """两级LLM响应缓存"""
+
+    KEY_PREFIX = "llm:response:v2:"
+
+    def __init__(self):
+        self.memory = TTLCache(
+            max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+            ttl=settings.LLM_CACHE_MEMORY_TTL
+        )
+        self._redis = None
+        self._redis_retry_at = 0.0
+        self.stats = {
+            "memory_hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "redis_errors": 0
+        }
+
+    @staticmethod
+    def make_key(
+        prompt: str,
+        provider: str,
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        system_message: Optional[str]
+    ) -> str:
+        """
+        计算缓存键
+        provider和model为实际应答的提供商和模型，降级得到的响应不会缓存到原模型名下
+        """
+        payload = json.dumps(
+            {
+                "prompt": prompt,
+                "system_message": system_message,
+                "provider": provider,
+                "model": model,
+                "temperature": temperature,
+                "max_tokens": max_tokens
+            },
+            ensure_ascii=False,
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def should_cache(self, temperature: float, use_cache: Optional[bool]) -> bool:
+        """
+        判断本次调用是否使用缓存
+
+        Args:
+            temperature: 温度参数
+            use_cache: 调用方显式指定；为None时按温度上限决定
+        """
+        if not settings.LLM_CACHE_ENABLED:
+            return False
+        if use_cache is not None:
+            return use_cache
+        return temperature <= settings.LLM_CACHE_MAX_TEMPERATURE
+
+    def _get_redis(self):
+        """获取Redis客户端（懒创建；出错后的暂停期内返回None）"""
+        if not settings.LLM_CACHE_REDIS_ENABLED:
+            return None
+        if time.monotonic() < self._redis_retry_at:
+            return None
+
+        if self._redis is None:
+            import redis.asyncio as aioredis
+            self._redis = aioredis.from_url(
+                settings.REDIS_URL,
+                encoding="utf-8",
+                decode_responses=True,
+                socket_connect_timeout=1,
+                socket_timeout=1
+            )
+        return self._redis
+
+    async def get(self, key: str) -> Optional[str]:
+        """读取缓存（先内存后Redis）"""
+        value = self.memory.get(key)
+        if value is not None:
+            self.stats["memory_hits"] += 1
+            return value
+
+        redis_client = self._get_redis()
+        if redis_client is not None:
+            try:
+                value = await redis_client.get(self.KEY_PREFIX + key)
+            except Exception as e:
+                self._on_redis_error("读取", e)
+                value = None
+
+            if value is not None:
+                self.stats["redis_hits"] += 1
+                self.memory.set(key, value)
+                return value
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: str):
+        """写入缓存（同时写入内存和Redis）"""
+        self.memory.set(key, value)
+        self.stats["writes"] += 1
+
+        redis_client = self._get_redis()
+        if redis_client is not None:
+            try:
+                await redis_client.set(
+                    self.KEY_PREFIX + key,
+                    value,
+                    ex=settings.LLM_CACHE_TTL
+                )
+            except Exception as e:
+                self._on_redis_error("写入", e)
+
+    def _on_redis_error(self, operation: str, error: Exception):
+        """Redis出错后暂停访问，避免每次缓存未命中都等待连接超时"""
+        self.stats["redis_errors"] += 1
+        self._redis_retry_at = time.monotonic() + settings.LLM_CACHE_REDIS_BACKOFF
+        logger.warning(
+            f"LLM缓存{operation}Redis失败，{settings.LLM_CACHE_REDIS_BACKOFF:.0f}秒内只使用进程内缓存: {str(error)}"
+        )
+
+    def get_stats(self) -> Dict:
+        """获取缓存统计"""
+        hits = self.stats["memory_hits"] + self.stats["redis_hits"]
+        total = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "memory_entries": len(self.memory),
+            "hit_rate": round(hits / total, 4) if total else 0.0
+        }
+
+    async def close(self):
+        """关闭Redis连接"""
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+
+# 进程级共享的响应缓存
+llm_cache = LLMResponseCache()
+
+
+async def close_llm_cache():
+    """关闭LLM响应缓存"""
+    await llm_cache.close()
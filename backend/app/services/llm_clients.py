@@ -0,0 +1,100 @@
+"""
+LLM客户端注册表
+为每个模型提供商维护一个进程级共享的keep-alive连接池
+在FastAPI lifespan中创建，应用关闭时统一释放
+"""
+from typing import Dict, Optional
+import httpx
+from openai import AsyncOpenAI
+from loguru import logger
+
+from app.core.config import settings
+
+
+class LLMClientRegistry:
+    """LLM客户端注册表（每个提供商一个连接池）"""
+
+    def __init__(self):
+        self._http_clients: Dict[str, httpx.AsyncClient] = {}
+        self._openai_client: Optional[AsyncOpenAI] = None
+
+    def _build_http_client(self) -> httpx.AsyncClient:
+        """创建带连接池限制的HTTP客户端"""
+        return httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.LLM_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_POOL_MAX_KEEPALIVE,
+                keepalive_expiry=settings.LLM_POOL_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(
+                settings.LLM_REQUEST_TIMEOUT,
+                connect=settings.LLM_CONNECT_TIMEOUT
+            )
+        )
+
+    def get_http_client(self, provider: str) -> httpx.AsyncClient:
+        """
+        获取提供商的共享HTTP客户端
+        未在启动时初始化（如独立脚本）则懒创建
+
+        Args:
+            provider: 提供商名称（openai/qwen）
+
+        Returns:
+            共享的httpx.AsyncClient
+        """
+        client = self._http_clients.get(provider)
+        if client is None or client.is_closed:
+            client = self._build_http_client()
+            self._http_clients[provider] = client
+            if provider == "openai":
+                # 连接池重建后，OpenAI客户端需绑定新的连接池
+                self._openai_client = None
+        return client
+
+    def get_openai_client(self) -> Optional[AsyncOpenAI]:
+        """获取共享的OpenAI客户端（未配置API Key时返回None）"""
+        if not settings.OPENAI_API_KEY:
+            return None
+
+        http_client = self.get_http_client("openai")
+        if self._openai_client is None:
+            self._openai_client = AsyncOpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                base_url=settings.OPENAI_BASE_URL,
+                http_client=http_client,
+                # 重试由AIService统一处理（每次尝试都经过熔断器）
+                max_retries=0
+            )
+        return self._openai_client
+
+    def init(self):
+        """预先创建所有已配置提供商的连接池"""
+        if settings.OPENAI_API_KEY:
+            self.get_openai_client()
+        if settings.QWEN_API_KEY:
+            self.get_http_client("qwen")
+        logger.info(f"✅ LLM连接池已初始化: {list(self._http_clients.keys())}")
+
+    async def close(self):
+        """关闭所有连接池"""
+        for client in self._http_clients.values():
+            if not client.is_closed:
+                await client.aclose()
+        self._http_clients.clear()
+        self._openai_client = None
+        logger.info("🔚 LLM连接池已关闭")
+
+
+# 进程级共享的客户端注册表
+llm_clients = LLMClientRegistry()
+
+
+def init_llm_clients():
+    """初始化LLM连接池"""
+    llm_clients.init()
+
+
+async def close_llm_clients():
+    """关闭LLM连接池"""
+    await llm_clients.close()
@@ -0,0 +1,133 @@
+"""
+LLM路由统计
+按提供商和模型维护滚动延迟样本，用于延迟路由和对冲请求
+"""
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+
+class LatencyTracker:
+    """滚动窗口延迟统计"""
+
+    def __init__(self, window: int, min_samples: int):
+        """
+        Args:
+            window: 每个(提供商, 模型)保留的样本数
+            min_samples: 计算分位数所需的最少样本数
+        """
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[Tuple[str, str], Deque[float]] = {}
+
+    def record(self, provider: str, model: str, seconds: float):
+        """记录一次成功调用的延迟"""
+        key = (provider, model)
+        if key not in self._samples:
+            self._samples[key] = deque(maxlen=self.window)
+        self._samples[key].append(seconds)
+
+    def percentile(self, provider: str, model: str, q: float) -> Optional[float]:
+        """
+        获取延迟分位数
+
+        Args:
+            q: 分位数（0-1）
+
+        Returns:
+            延迟秒数，样本不足时返回None
+        """
+        samples = self._samples.get((provider, model))
+        if not samples or len(samples) < self.min_samples:
+            return None
+
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[index]
+
+    def get_stats(self) -> Dict:
+        """获取各提供商的延迟统计"""
+        stats = {}
+        for (provider, model), samples in self._samples.items():
+            stats[f"{provider}/{model}"] = {
+                "samples": len(samples),
+                "p50": self.percentile(provider, model, 0.5),
+                "p95": self.percentile(provider, model, 0.95)
+            }
+        return stats
+
+
+class HedgeBudget:
+    """
+    对冲请求预算
+    每个主请求积累ratio个额度，每次对冲消耗1个，控制对冲比例上限
+    """
+
+    def __init__(self, ratio: float, burst: float):
+        self.ratio = ratio
+        self.burst = burst
+        self._credits = burst
+        self.hedged = 0
+        self.denied = 0
+
+    def on_request(self):
+        """登记一次主请求"""
+        self._credits = min(self.burst, self._credits + self.ratio)
+
+    def try_spend(self) -> bool:
+        """尝试消耗一次对冲额度"""
+        if self._credits >= 1:
+            self._credits -= 1
+            self.hedged += 1
+            return True
+        self.denied += 1
+        return False
+
+
+class LLMRouter:
+    """基于滚动延迟统计的提供商路由"""
+
+    def __init__(self):
+        self.latency = LatencyTracker(
+            window=settings.LLM_LATENCY_WINDOW,
+            min_samples=settings.LLM_LATENCY_MIN_SAMPLES
+        )
+        self.hedge_budget = HedgeBudget(
+            ratio=settings.LLM_HEDGE_MAX_RATIO,
+            burst=settings.LLM_HEDGE_BURST
+        )
+
+    def order_providers(self, candidates: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """
+        按中位延迟排序候选提供商
+        样本不足的提供商保持原有优先级
+
+        Args:
+            candidates: [(provider, model), ...]，按配置优先级排列
+        """
+        if not settings.LLM_LATENCY_ROUTING:
+            return candidates
+
+        def sort_key(item):
+            index, (provider, model) = item
+            p50 = self.latency.percentile(provider, model, 0.5)
+            return (p50 is None, p50 or 0, index)
+
+        return [candidate for _, candidate in sorted(enumerate(candidates), key=sort_key)]
+
+    def hedge_delay(self, provider: str, model: str) -> Optional[float]:
+        """获取主请求的对冲等待时间，样本不足时返回None（不对冲）"""
+        return self.latency.percentile(provider, model, settings.LLM_HEDGE_PERCENTILE)
+
+    def get_stats(self) -> Dict:
+        """获取路由统计"""
+        return {
+            "latency": self.latency.get_stats(),
+            "hedged": self.hedge_budget.hedged,
+            "hedge_denied": self.hedge_budget.denied
+        }
+
+
+# 进程级共享的路由器
+llm_router = LLMRouter()
@@ -0,0 +1,185 @@
+"""
+模拟LLM提供商
+不发起任何网络请求，按可配置的延迟分布返回模板化响应
+用于在无API Key、无费用的情况下压测调度器、数据库、RAG和导出链路
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+from collections import OrderedDict
+from typing import AsyncIterator, List, Optional, Tuple
+
+from app.core.config import settings
+
+
+class MockLLMError(Exception):
+    """模拟的提供商错误"""
+
+
+class MockLLMProvider:
+    """
+    确定性的离线模拟LLM
+    响应内容只由提示词决定；延迟和注入错误还取决于该提示词的调用次数，
+    因此注入的错误是暂时的，重试、降级和断点续跑可以成功
+    """
+
+    # 记录调用次数的提示词数量上限（超出时淘汰最久未用的）
+    MAX_TRACKED_PROMPTS = 10000
+
+    def __init__(
+        self,
+        latency_profile: str,
+        latency_ms: float,
+        latency_stddev_ms: float,
+        tail_sigma: float,
+        error_rate: float,
+        seed: int
+    ):
+        """
+        Args:
+            latency_profile: 延迟分布（fixed/normal/longtail）
+            latency_ms: 固定延迟、正态分布均值或长尾分布中位数（毫秒）
+            latency_stddev_ms: 正态分布标准差（毫秒）
+            tail_sigma: 长尾分布（对数正态）的sigma
+            error_rate: 注入错误的概率（0-1）
+            seed: 随机种子
+        """
+        if latency_profile not in ("fixed", "normal", "longtail"):
+            raise ValueError(f"不支持的延迟分布: {latency_profile}")
+
+        self.latency_profile = latency_profile
+        self.latency_ms = latency_ms
+        self.latency_stddev_ms = latency_stddev_ms
+        self.tail_sigma = tail_sigma
+        self.error_rate = error_rate
+        self.seed = seed
+        self._attempts: "OrderedDict[str, int]" = OrderedDict()
+
+    def _call_rngs(self, prompt: str) -> Tuple[random.Random, random.Random]:
+        """
+        返回(内容, 故障)两个随机数生成器
+        内容生成器只由提示词派生，相同输入得到相同输出；故障生成器混入该提示词的调用序号，同一提示词的第n次调用在各次运行中结果一致
+        """
+        digest = hashlib.sha256(f"{self.seed}:{prompt}".encode("utf-8")).hexdigest()
+        attempt = self._attempts.pop(digest, 0)
+        self._attempts[digest] = attempt + 1
+        if len(self._attempts) > self.MAX_TRACKED_PROMPTS:
+            self._attempts.popitem(last=False)
+
+        fault_digest = hashlib.sha256(f"{digest}:{attempt}".encode("utf-8")).hexdigest()
+        return random.Random(int(digest[:16], 16)), random.Random(int(fault_digest[:16], 16))
+
+    def _sample_latency(self, rng: random.Random) -> float:
+        """按延迟分布采样（秒）"""
+        if self.latency_profile == "normal":
+            latency_ms = rng.gauss(self.latency_ms, self.latency_stddev_ms)
+        elif self.latency_profile == "longtail":
+            latency_ms = self.latency_ms * rng.lognormvariate(0, self.tail_sigma)
+        else:
+            latency_ms = self.latency_ms
+        return max(latency_ms, 0) / 1000
+
+    async def generate(
+        self,
+        prompt: str,
+        max_tokens: int,
+        system_message: Optional[str] = None
+    ) -> str:
+        """生成模拟响应"""
+        rng, fault_rng = self._call_rngs(prompt)
+        await asyncio.sleep(self._sample_latency(fault_rng))
+
+        if fault_rng.random() < self.error_rate:
+            raise MockLLMError("模拟提供商错误")
+
+        return self._render(prompt, max_tokens, rng)
+
+    async def stream(
+        self,
+        prompt: str,
+        max_tokens: int,
+        system_message: Optional[str] = None,
+        chunk_size: int = 20
+    ) -> AsyncIterator[str]:
+        """流式生成模拟响应，总延迟均匀分摊到各片段"""
+        rng, fault_rng = self._call_rngs(prompt)
+        latency = self._sample_latency(fault_rng)
+
+        if fault_rng.random() < self.error_rate:
+            await asyncio.sleep(latency)
+            raise MockLLMError("模拟提供商错误")
+
+        text = self._render(prompt, max_tokens, rng)
+        chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        for chunk in chunks:
+            await asyncio.sleep(latency / len(chunks))
+            yield chunk
+
+    def _render(self, prompt: str, max_tokens: int, rng: random.Random) -> str:
+        """按提示词类型渲染响应"""
+        if '"ballots"' in prompt:
+            return self._render_ballot(prompt, rng)
+        if '"votes"' in prompt:
+            return self._render_votes(prompt, rng)
+        return self._render_text(prompt, max_tokens, rng)
+
+    @staticmethod
+    def _extract_agents(prompt: str) -> List[str]:
+        """从投票提示词中提取专家角色（格式：- 角色 (专长)）"""
+        return re.findall(r"^- (.+?) \(", prompt, flags=re.MULTILINE)
+
+    def _random_votes(self, agents: List[str], rng: random.Random) -> List[dict]:
+        """为每个专家随机生成投票"""
+        return [
+            {
+                "agent": agent,
+                "vote": "agree" if rng.random() < 0.7 else "disagree",
+                "reason": "模拟投票理由"
+            }
+            for agent in agents
+        ]
+
+    def _render_votes(self, prompt: str, rng: random.Random) -> str:
+        """渲染投票JSON"""
+        agents = self._extract_agents(prompt) or [f"专家{i + 1}" for i in range(5)]
+        return json.dumps({"votes": self._random_votes(agents, rng)}, ensure_ascii=False)
+
+    def _render_ballot(self, prompt: str, rng: random.Random) -> str:
+        """渲染批量投票JSON（方案格式：**方案N**）"""
+        agents = self._extract_agents(prompt) or [f"专家{i + 1}" for i in range(5)]
+        proposals = sorted({int(n) for n in re.findall(r"\*\*方案(\d+)\*\*", prompt)})
+        ballots = [
+            {"proposal": proposal, "votes": self._random_votes(agents, rng)}
+            for proposal in proposals
+        ]
+        return json.dumps({"ballots": ballots}, ensure_ascii=False)
+
+    def _render_text(self, prompt: str, max_tokens: int, rng: random.Random) -> str:
+        """渲染模板化的教学方案文本"""
+        first_line = prompt.strip().splitlines()[0][:50] if prompt.strip() else ""
+        paragraphs = [f"【模拟响应】{first_line}"]
+
+        # 约按最大token数的一半生成内容
+        target_length = max_tokens // 2
+        index = 1
+        while sum(len(p) for p in paragraphs) < target_length:
+            paragraphs.append(
+                f"{index}. 教学活动设计要点{rng.randint(100, 999)}：围绕核心概念组织探究与讨论，"
+                f"结合学生已有经验设计任务，并通过形成性评价检验学习效果。"
+            )
+            index += 1
+
+        return "\n".join(paragraphs)
+
+
+# 进程级共享的模拟提供商
+mock_llm = MockLLMProvider(
+    latency_profile=settings.MOCK_LLM_LATENCY_PROFILE,
+    latency_ms=settings.MOCK_LLM_LATENCY_MS,
+    latency_stddev_ms=settings.MOCK_LLM_LATENCY_STDDEV_MS,
+    tail_sigma=settings.MOCK_LLM_TAIL_SIGMA,
+    error_rate=settings.MOCK_LLM_ERROR_RATE,
+    seed=settings.MOCK_LLM_SEED
+)
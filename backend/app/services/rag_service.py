@@ -1,37 +1,154 @@
 """
 RAG检索服务
-基于Chroma向量数据库的检索增强生成
+基于向量库的检索增强生成，后端由VECTOR_BACKEND选择：Chroma服务或本地mmap向量库
+向量库调用为同步实现，所有调用在有界线程池中执行并带超时，不阻塞事件循环
+进程内共享一个实例（rag_service），启动时连接
 """
-from typing import List, Dict, Optional
+import asyncio
+import hashlib
+import json
+import math
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Dict, Optional
 import chromadb
 from chromadb.config import Settings
+from chromadb.utils import embedding_functions
 from loguru import logger
 
+from app.core.cache import TTLCache
 from app.core.config import settings as app_settings
+from app.services.single_flight import SingleFlight
+from app.services.token_budget import estimate_tokens
+from app.services.vector_store import LocalVectorCollection
 
 class RAGService:
     """RAG检索服务类"""
     
     def __init__(self):
-        # 初始化Chroma客户端
-        try:
-            self.client = chromadb.HttpClient(
-                host=app_settings.CHROMA_HOST,
-                port=app_settings.CHROMA_PORT,
-                settings=Settings(anonymized_telemetry=False)
+        self.client = None
+        self.collection = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._last_connect_attempt = 0.0
+        
+        # 检索结果缓存；_generation在向量库变更时递增，防止变更前发起的检索写入旧结果
+        self._cache = TTLCache(
+            max_entries=app_settings.RAG_CACHE_MAX_ENTRIES,
+            ttl=app_settings.RAG_CACHE_TTL
+        )
+        self._generation = 0
+        self._single_flight = SingleFlight()
+        
+        # 嵌入函数和短文本（如阶段意图）的嵌入缓存
+        self._embedding_function = None
+        self._embedding_cache = TTLCache(
+            max_entries=app_settings.RAG_CACHE_MAX_ENTRIES,
+            ttl=app_settings.RAG_CACHE_TTL
+        )
+        self.cache_hits = 0
+        self.cache_misses = 0
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """获取线程池（首次使用时创建）"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=app_settings.RAG_MAX_WORKERS,
+                thread_name_prefix="rag"
             )
-            
-            # 获取或创建集合
-            self.collection = self.client.get_or_create_collection(
-                name="educational_references",
-                metadata={"description": "教育参考资料库"}
+        return self._executor
+    
+    async def _run(self, timeout: float, func: Callable, *args, **kwargs) -> Any:
+        """
+        在线程池中执行同步的向量库调用
+        
+        Raises:
+            asyncio.TimeoutError: 超时（线程中的调用会继续执行完，但不再等待其结果）
+        """
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(
+            loop.run_in_executor(self._get_executor(), lambda: func(*args, **kwargs)),
+            timeout=timeout
+        )
+    
+    def _get_embedding_function(self):
+        """获取嵌入函数（首次使用时加载）"""
+        if self._embedding_function is None:
+            self._embedding_function = embedding_functions.DefaultEmbeddingFunction()
+        return self._embedding_function
+    
+    def _connect_sync(self):
+        """连接向量库并获取集合（在线程池中执行）"""
+        if app_settings.VECTOR_BACKEND == "local":
+            # 本地向量库：映射磁盘上的向量文件，无需网络往返
+            collection = LocalVectorCollection(
+                path=app_settings.VECTOR_STORE_PATH,
+                embedding_function=self._get_embedding_function(),
+                ann_min_documents=app_settings.VECTOR_ANN_MIN_DOCUMENTS
             )
+            return None, collection
+        if app_settings.VECTOR_BACKEND != "chroma":
+            raise ValueError(f"不支持的向量库后端: {app_settings.VECTOR_BACKEND}")
+        
+        client = chromadb.HttpClient(
+            host=app_settings.CHROMA_HOST,
+            port=app_settings.CHROMA_PORT,
+            settings=Settings(anonymized_telemetry=False)
+        )
+        
+        # 获取或创建集合（显式指定嵌入函数，与embed_texts使用同一模型）
+        collection = client.get_or_create_collection(
+            name="educational_references",
+            metadata={"description": "教育参考资料库"},
+            embedding_function=self._get_embedding_function()
+        )
+        return client, collection
+    
+    async def init(self) -> bool:
+        """
+        连接向量库
+        
+        Returns:
+            是否连接成功
+        """
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        
+        async with self._connect_lock:
+            if self.collection is not None:
+                return True
             
-            logger.info("✅ Chroma向量库连接成功")
-        except Exception as e:
-            logger.error(f"❌ Chroma向量库连接失败: {str(e)}")
-            self.client = None
-            self.collection = None
+            self._last_connect_attempt = time.monotonic()
+            try:
+                self.client, self.collection = await self._run(
+                    app_settings.RAG_CONNECT_TIMEOUT, self._connect_sync
+                )
+                logger.info(f"✅ 向量库连接成功（{app_settings.VECTOR_BACKEND}）")
+                return True
+            except Exception as e:
+                logger.error(
+                    f"❌ 向量库连接失败（{app_settings.VECTOR_BACKEND}）: {str(e) or type(e).__name__}"
+                )
+                self.client = None
+                self.collection = None
+                return False
+    
+    async def _ensure_collection(self) -> bool:
+        """确保已连接；未连接时按间隔重试，避免向量库不可用时每次调用都等待连接超时"""
+        if self.collection is not None:
+            return True
+        if time.monotonic() - self._last_connect_attempt < app_settings.RAG_RECONNECT_INTERVAL:
+            return False
+        return await self.init()
+    
+    async def close(self):
+        """关闭线程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self.client = None
+        self.collection = None
     
     async def add_reference(
         self,
@@ -47,27 +164,52 @@ class RAGService:
             content: 文档内容
             metadata: 元数据（包含type, subject, region等）
         """
-        if not self.collection:
+        if not await self._ensure_collection():
             logger.warning("向量库未初始化")
             return
         
         try:
-            self.collection.add(
+            await self._run(
+                app_settings.RAG_WRITE_TIMEOUT,
+                self.collection.add,
                 documents=[content],
                 metadatas=[metadata],
                 ids=[doc_id]
             )
+            self.invalidate_cache()
             logger.info(f"✅ 添加参考资料: {doc_id}")
         except Exception as e:
             logger.error(f"❌ 添加参考资料失败: {str(e)}")
     
+    @staticmethod
+    def _build_where(
+        subject: Optional[str] = None,
+        region: Optional[str] = None,
+        ref_type: Optional[str] = None
+    ) -> Optional[Dict]:
+        """构建where条件（Chroma要求多个条件用$and组合）"""
+        conditions = []
+        if subject:
+            conditions.append({"subject": subject})
+        if region:
+            conditions.append({"region": region})
+        if ref_type:
+            conditions.append({"type": ref_type})
+        
+        if not conditions:
+            return None
+        if len(conditions) == 1:
+            return conditions[0]
+        return {"$and": conditions}
+    
     async def search_references(
         self,
         query: str,
         subject: Optional[str] = None,
         region: Optional[str] = None,
         ref_type: Optional[str] = None,
-        n_results: int = 5
+        n_results: int = 5,
+        query_embedding: Optional[List[float]] = None
     ) -> List[Dict]:
         """
         检索相关参考资料
@@ -78,56 +220,278 @@ class RAGService:
             region: 地区过滤
             ref_type: 类型过滤（theory/standard/case）
             n_results: 返回结果数
+            query_embedding: 预先计算的查询向量，提供时直接按向量检索，不再嵌入查询文本
         
         Returns:
             检索到的参考资料列表
         """
-        if not self.collection:
+        if not await self._ensure_collection():
             logger.warning("向量库未初始化，返回空结果")
             return []
         
+        if not app_settings.RAG_CACHE_ENABLED:
+            return await self._query(
+                query, subject, region, ref_type, n_results, query_embedding
+            ) or []
+        
+        key = self._cache_key(query, subject, region, ref_type, n_results, query_embedding)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+        self.cache_misses += 1
+        
+        # 相同检索并发进行时只查询一次；查询期间向量库有变更则不写入缓存
+        generation = self._generation
+        references = await self._single_flight.do(
+            key, lambda: self._query(query, subject, region, ref_type, n_results, query_embedding)
+        )
+        if references is None:
+            return []
+        if generation == self._generation:
+            self._cache.set(key, references)
+        return references
+    
+    async def _query(
+        self,
+        query: str,
+        subject: Optional[str],
+        region: Optional[str],
+        ref_type: Optional[str],
+        n_results: int,
+        query_embedding: Optional[List[float]] = None
+    ) -> Optional[List[Dict]]:
+        """执行检索，失败或超时时返回None（不缓存）"""
+        if query_embedding is not None:
+            query_args = {"query_embeddings": [query_embedding]}
+        else:
+            query_args = {"query_texts": [query]}
+        
+        results = await self._query_many(
+            self._build_where(subject, region, ref_type), n_results, **query_args
+        )
+        if results is None:
+            return None
+        
+        logger.info(f"✅ 检索到 {len(results[0])} 条参考资料")
+        return results[0]
+    
+    async def _query_many(
+        self,
+        where: Optional[Dict],
+        n_results: int,
+        **query_args
+    ) -> Optional[List[List[Dict]]]:
+        """
+        一次调用执行多条检索（query_texts或query_embeddings），过滤条件和返回数相同
+        
+        Returns:
+            按查询顺序排列的结果列表，失败或超时时返回None
+        """
         try:
-            # 构建where条件
-            where = {}
-            if subject:
-                where["subject"] = subject
-            if region:
-                where["region"] = region
-            if ref_type:
-                where["type"] = ref_type
-            
             # 执行检索
-            results = self.collection.query(
-                query_texts=[query],
+            results = await self._run(
+                app_settings.RAG_QUERY_TIMEOUT,
+                self.collection.query,
                 n_results=n_results,
-                where=where if where else None
+                where=where,
+                **query_args
             )
-            
-            # 格式化结果
-            references = []
-            if results and results['documents']:
-                for i, doc in enumerate(results['documents'][0]):
-                    ref = {
-                        "id": results['ids'][0][i],
-                        "content": doc,
-                        "metadata": results['metadatas'][0][i],
-                        "distance": results['distances'][0][i] if 'distances' in results else None
-                    }
-                    references.append(ref)
-            
-            logger.info(f"✅ 检索到 {len(references)} 条参考资料")
-            return references
-            
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ 检索超时（{app_settings.RAG_QUERY_TIMEOUT}秒），返回空结果")
+            return None
         except Exception as e:
             logger.error(f"❌ 检索失败: {str(e)}")
+            return None
+        
+        # 格式化结果
+        query_count = len(next(iter(query_args.values())))
+        documents = (results or {}).get('documents') or [[] for _ in range(query_count)]
+        distances = results.get('distances') if results else None
+        
+        return [
+            [
+                {
+                    "id": results['ids'][q][i],
+                    "content": doc,
+                    "metadata": results['metadatas'][q][i],
+                    "distance": distances[q][i] if distances else None
+                }
+                for i, doc in enumerate(docs)
+            ]
+            for q, docs in enumerate(documents)
+        ]
+    
+    async def search_references_batch(self, queries: List[Dict]) -> List[List[Dict]]:
+        """
+        批量检索参考资料
+        未命中缓存的查询按(过滤条件, 返回数, 查询方式)分组，每组合并为一次collection.query调用
+        
+        Args:
+            queries: 查询列表，每项为search_references的参数字典
+                （query必填，subject/region/ref_type/n_results/query_embedding可选）
+        
+        Returns:
+            与queries一一对应的参考资料列表，失败的查询返回空列表
+        """
+        if not queries:
             return []
+        if not await self._ensure_collection():
+            logger.warning("向量库未初始化，返回空结果")
+            return [[] for _ in queries]
+        
+        results: List[Optional[List[Dict]]] = [None] * len(queries)
+        keys: List[Optional[str]] = [None] * len(queries)
+        groups: Dict[tuple, List[int]] = {}
+        
+        for i, q in enumerate(queries):
+            subject, region, ref_type = q.get("subject"), q.get("region"), q.get("ref_type")
+            n_results = q.get("n_results", 5)
+            query_embedding = q.get("query_embedding")
+            
+            if app_settings.RAG_CACHE_ENABLED:
+                keys[i] = self._cache_key(
+                    q["query"], subject, region, ref_type, n_results, query_embedding
+                )
+                cached = self._cache.get(keys[i])
+                if cached is not None:
+                    self.cache_hits += 1
+                    results[i] = cached
+                    continue
+                self.cache_misses += 1
+            
+            group = (
+                json.dumps(self._build_where(subject, region, ref_type), sort_keys=True, ensure_ascii=False),
+                n_results,
+                query_embedding is not None
+            )
+            groups.setdefault(group, []).append(i)
+        
+        generation = self._generation
+        
+        async def run_group(group: tuple, indexes: List[int]):
+            where_json, n_results, by_embedding = group
+            if by_embedding:
+                query_args = {"query_embeddings": [queries[i]["query_embedding"] for i in indexes]}
+            else:
+                query_args = {"query_texts": [queries[i]["query"] for i in indexes]}
+            
+            group_results = await self._query_many(json.loads(where_json), n_results, **query_args)
+            if group_results is None:
+                return
+            for i, references in zip(indexes, group_results):
+                results[i] = references
+                if keys[i] is not None and generation == self._generation:
+                    self._cache.set(keys[i], references)
+        
+        await asyncio.gather(*(run_group(group, indexes) for group, indexes in groups.items()))
+        
+        if groups:
+            logger.info(
+                f"✅ 批量检索: {len(queries)} 条查询, {len(groups)} 次调用, "
+                f"{len(queries) - sum(len(indexes) for indexes in groups.values())} 条命中缓存"
+            )
+        return [references if references is not None else [] for references in results]
+    
+    @staticmethod
+    def _cache_key(
+        query: str,
+        subject: Optional[str],
+        region: Optional[str],
+        ref_type: Optional[str],
+        n_results: int,
+        query_embedding: Optional[List[float]] = None
+    ) -> str:
+        """检索缓存键（查询文本去除首尾空白并合并连续空白；按向量检索时使用向量本身）"""
+        if query_embedding is not None:
+            normalized = hashlib.sha256(
+                struct.pack(f"{len(query_embedding)}f", *query_embedding)
+            ).hexdigest()
+        else:
+            normalized = " ".join(query.split())
+        payload = json.dumps(
+            [normalized, subject, region, ref_type, n_results], ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    async def embed_texts(self, texts: List[str]) -> Optional[List[List[float]]]:
+        """
+        计算文本嵌入（与集合使用同一嵌入函数），结果按文本缓存
+        
+        Returns:
+            嵌入向量列表，向量库不可用、失败或超时时返回None
+        """
+        if not await self._ensure_collection():
+            return None
+        
+        keys = [hashlib.sha256(text.encode("utf-8")).hexdigest() for text in texts]
+        embeddings = [self._embedding_cache.get(key) for key in keys]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        
+        if missing:
+            try:
+                computed = await self._run(
+                    app_settings.RAG_QUERY_TIMEOUT,
+                    self._get_embedding_function(),
+                    [texts[i] for i in missing]
+                )
+            except asyncio.TimeoutError:
+                logger.warning(f"⚠️ 文本嵌入超时（{app_settings.RAG_QUERY_TIMEOUT}秒）")
+                return None
+            except Exception as e:
+                logger.error(f"❌ 文本嵌入失败: {str(e)}")
+                return None
+            
+            for i, embedding in zip(missing, computed):
+                embeddings[i] = [float(x) for x in embedding]
+                self._embedding_cache.set(keys[i], embeddings[i])
+        
+        return embeddings
+    
+    async def embed_text(self, text: str) -> Optional[List[float]]:
+        """计算单个文本的嵌入"""
+        embeddings = await self.embed_texts([text])
+        return embeddings[0] if embeddings else None
+    
+    @staticmethod
+    def combine_embeddings(base: List[float], intent: List[float], weight: float) -> List[float]:
+        """
+        组合两个向量（各自归一化后按权重相加再归一化）
+        
+        Args:
+            base: 主体向量（如教案内容）
+            intent: 意图向量（如教学阶段）
+            weight: 主体向量的权重（0-1）
+        """
+        def normalize(vector: List[float]) -> List[float]:
+            norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+            return [x / norm for x in vector]
+        
+        base, intent = normalize(base), normalize(intent)
+        return normalize([weight * b + (1 - weight) * i for b, i in zip(base, intent)])
+    
+    def invalidate_cache(self):
+        """向量库内容变更后清空检索缓存"""
+        self._generation += 1
+        self._cache.clear()
+    
+    def get_cache_stats(self) -> Dict:
+        """获取检索缓存统计"""
+        return {
+            "enabled": app_settings.RAG_CACHE_ENABLED,
+            "entries": len(self._cache),
+            "hits": self.cache_hits,
+            "misses": self.cache_misses
+        }
     
     async def enhance_prompt_with_rag(
         self,
         prompt: str,
         subject: str,
         region: str,
-        n_results: int = 3
+        n_results: int = 3,
+        max_reference_tokens: Optional[int] = None,
+        query: Optional[str] = None
     ) -> str:
         """
         使用RAG增强提示词
@@ -137,23 +501,45 @@ class RAGService:
             subject: 学科
             region: 地区
             n_results: 检索结果数
+            max_reference_tokens: 参考资料的token预算，超出的参考资料不再加入
+            query: 检索文本，默认使用原始提示词
         
         Returns:
             增强后的提示词
         """
         # 检索相关资料
         references = await self.search_references(
-            query=prompt,
+            query=query or prompt,
             subject=subject,
             region=region,
             n_results=n_results
         )
         
+        return self.build_enhanced_prompt(prompt, references, max_reference_tokens)
+    
+    def build_enhanced_prompt(
+        self,
+        prompt: str,
+        references: List[Dict],
+        max_reference_tokens: Optional[int] = None
+    ) -> str:
+        """
+        将已检索的参考资料加入提示词（同一批参考资料可用于多个提示词）
+        
+        Args:
+            prompt: 原始提示词
+            references: search_references的结果
+            max_reference_tokens: 参考资料的token预算，超出的参考资料不再加入
+        
+        Returns:
+            增强后的提示词
+        """
         if not references:
             return prompt
         
         # 构建增强提示词
         enhanced_prompt = f"{prompt}\n\n**参考资料**：\n"
+        used_tokens = 0
         
         for i, ref in enumerate(references):
             metadata = ref['metadata']
@@ -164,8 +550,15 @@ class RAGService:
             }
             ref_type_name = ref_type_map.get(metadata.get('type', ''), '参考')
             
-            enhanced_prompt += f"\n{i+1}. [{ref_type_name}] {metadata.get('title', '无标题')}\n"
-            enhanced_prompt += f"   {ref['content'][:200]}...\n"
+            ref_block = f"\n{i+1}. [{ref_type_name}] {metadata.get('title', '无标题')}\n"
+            ref_block += f"   {ref['content'][:200]}...\n"
+            
+            if max_reference_tokens is not None:
+                used_tokens += estimate_tokens(ref_block)
+                if used_tokens > max_reference_tokens:
+                    break
+            
+            enhanced_prompt += ref_block
         
         enhanced_prompt += "\n请结合以上参考资料，提供更专业、更符合实际的教学设计。"
         
@@ -178,7 +571,7 @@ class RAGService:
         Args:
             references: 参考资料列表，每项包含id, content, metadata
         """
-        if not self.collection:
+        if not await self._ensure_collection():
             logger.warning("向量库未初始化")
             return
         
@@ -187,34 +580,38 @@ class RAGService:
             documents = [ref['content'] for ref in references]
             metadatas = [ref['metadata'] for ref in references]
             
-            self.collection.add(
+            await self._run(
+                app_settings.RAG_WRITE_TIMEOUT,
+                self.collection.add,
                 ids=ids,
                 documents=documents,
                 metadatas=metadatas
             )
             
+            self.invalidate_cache()
             logger.info(f"✅ 批量添加 {len(references)} 条参考资料")
         except Exception as e:
             logger.error(f"❌ 批量添加失败: {str(e)}")
     
     async def delete_reference(self, doc_id: str):
         """删除参考资料"""
-        if not self.collection:
+        if not await self._ensure_collection():
             return
         
         try:
-            self.collection.delete(ids=[doc_id])
+            await self._run(app_settings.RAG_WRITE_TIMEOUT, self.collection.delete, ids=[doc_id])
+            self.invalidate_cache()
             logger.info(f"✅ 删除参考资料: {doc_id}")
         except Exception as e:
             logger.error(f"❌ 删除失败: {str(e)}")
     
     async def get_collection_stats(self) -> Dict:
         """获取向量库统计信息"""
-        if not self.collection:
+        if not await self._ensure_collection():
             return {"total_documents": 0}
         
         try:
-            count = self.collection.count()
+            count = await self._run(app_settings.RAG_QUERY_TIMEOUT, self.collection.count)
             return {
                 "total_documents": count,
                 "collection_name": self.collection.name
@@ -223,3 +620,16 @@ class RAGService:
             logger.error(f"获取统计信息失败: {str(e)}")
             return {"total_documents": 0, "error": str(e)}
 
+
+# 进程级共享的RAG服务
+rag_service = RAGService()
+
+
+async def init_rag_service():
+    """连接向量库（在应用启动时调用，失败时后续调用会按间隔重试）"""
+    await rag_service.init()
+
+
+async def close_rag_service():
+    """释放RAG服务资源（在应用关闭时调用）"""
+    await rag_service.close()
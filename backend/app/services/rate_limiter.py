@@ -0,0 +1,182 @@
+"""
+LLM调用限流器
+按提供商和模型维护RPM/TPM令牌桶，并用全局公平信号量限制在途请求数
+调用方在限流器中排队等待，而不是直接失败
+"""
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, Tuple
+from loguru import logger
+
+from app.core.config import settings
+
+# 当前调用所属的请求方（如教案ID），用于在多个教案之间公平排队
+llm_owner: ContextVar[str] = ContextVar("llm_owner", default="default")
+
+
+class TokenBucket:
+    """按分钟配额补充的令牌桶"""
+
+    def __init__(self, per_minute: int):
+        """
+        Args:
+            per_minute: 每分钟配额，<=0表示不限制
+        """
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self, amount: float = 1):
+        """获取令牌，不足时等待补充"""
+        if self.capacity <= 0:
+            return
+
+        # 单次请求超过桶容量时按满桶计算，避免永远无法满足
+        amount = min(amount, self.capacity)
+
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                await asyncio.sleep((amount - self._tokens) / self.rate)
+
+
+class FairSemaphore:
+    """
+    公平信号量
+    按请求方轮询分配许可，避免单个大教案占满并发
+    """
+
+    def __init__(self, limit: int):
+        """
+        Args:
+            limit: 最大并发数，<=0表示不限制
+        """
+        self.limit = limit
+        self._in_use = 0
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+
+    async def acquire(self, owner: str):
+        """获取许可"""
+        if self.limit <= 0:
+            # 不限制并发，只计数
+            self._in_use += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(owner, deque()).append(future)
+        self._wake_next()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 许可已分配但调用方被取消，归还许可
+                self.release()
+            raise
+
+    def release(self):
+        """释放许可"""
+        self._in_use -= 1
+        self._wake_next()
+
+    def _wake_next(self):
+        """按请求方轮询唤醒等待者"""
+        while self._in_use < self.limit and self._queues:
+            owner, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+
+            if queue:
+                self._queues.move_to_end(owner)
+            else:
+                del self._queues[owner]
+
+            if future.done():
+                # 等待者已取消
+                continue
+
+            self._in_use += 1
+            future.set_result(None)
+
+    @property
+    def in_use(self) -> int:
+        return self._in_use
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+
+class LLMRateLimiter:
+    """LLM调用限流器（进程级共享）"""
+
+    def __init__(self):
+        self._buckets: Dict[Tuple[str, str], Tuple[TokenBucket, TokenBucket]] = {}
+        self._semaphore = FairSemaphore(settings.LLM_MAX_IN_FLIGHT)
+
+    def _get_limits(self, provider: str, model: str) -> Tuple[int, int]:
+        """获取(RPM, TPM)配额，模型级配置优先于提供商默认值"""
+        provider_limits = {
+            "openai": (settings.OPENAI_RPM, settings.OPENAI_TPM),
+            "qwen": (settings.QWEN_RPM, settings.QWEN_TPM)
+        }
+        rpm, tpm = provider_limits.get(provider, (0, 0))
+
+        model_limits = settings.LLM_MODEL_RATE_LIMITS.get(model, {})
+        return model_limits.get("rpm", rpm), model_limits.get("tpm", tpm)
+
+    def _get_buckets(self, provider: str, model: str) -> Tuple[TokenBucket, TokenBucket]:
+        key = (provider, model)
+        if key not in self._buckets:
+            rpm, tpm = self._get_limits(provider, model)
+            self._buckets[key] = (TokenBucket(rpm), TokenBucket(tpm))
+        return self._buckets[key]
+
+    @asynccontextmanager
+    async def limit(self, provider: str, model: str, estimated_tokens: int):
+        """
+        在限流范围内执行一次调用
+
+        Args:
+            provider: 提供商名称
+            model: 模型名称
+            estimated_tokens: 预估的token消耗（提示词+最大输出）
+        """
+        started_at = time.monotonic()
+        await self._semaphore.acquire(llm_owner.get())
+        try:
+            rpm_bucket, tpm_bucket = self._get_buckets(provider, model)
+            await rpm_bucket.acquire(1)
+            await tpm_bucket.acquire(estimated_tokens)
+
+            waited = time.monotonic() - started_at
+            if waited > 1:
+                logger.debug(f"LLM限流等待 {waited:.1f}s ({provider}/{model})")
+
+            yield
+        finally:
+            self._semaphore.release()
+
+    def get_stats(self) -> Dict:
+        """获取限流器状态"""
+        return {
+            "in_flight": self._semaphore.in_use,
+            "waiting": self._semaphore.waiting,
+            "max_in_flight": self._semaphore.limit
+        }
+
+
+# 进程级共享的限流器
+llm_rate_limiter = LLMRateLimiter()
@@ -0,0 +1,68 @@
+"""
+单飞请求合并
+相同键的并发调用共享同一个进行中的任务，只实际执行一次
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class _Call:
+    """进行中的共享调用"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    合并相同键的并发异步调用
+    - 结果和异常都会传递给所有等待者
+    - 单个等待者被取消不影响其他等待者；所有等待者都取消时才取消共享任务
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行调用，已有相同键的调用进行中时直接等待其结果
+
+        Args:
+            key: 合并键
+            func: 实际执行的协程函数
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(func()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.executed += 1
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            # shield保证单个等待者取消时不会取消共享任务
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # 先移除再取消：之后到来的相同调用重新执行，不会加入正在取消的任务
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _forget(self, key: str, call: _Call):
+        """任务结束后移除，后续调用重新执行"""
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def get_stats(self) -> Dict:
+        """获取合并统计"""
+        return {
+            "in_flight": len(self._calls),
+            "executed": self.executed,
+            "coalesced": self.coalesced
+        }
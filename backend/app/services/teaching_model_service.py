@@ -68,10 +68,14 @@ class TeachingModelService:
         return model.config.get("agents", [])
     
     def get_discussion_config(self, model: TeachingModel) -> Dict:
-        """获取讨论配置"""
+        """
+        获取讨论配置
+        voting_strategy: per_opinion（每个方案单独投票）| ballot（一次调用为全部方案投票）
+        """
         return {
             "rounds": model.config.get("discussion_rounds", 3),
-            "vote_threshold": model.config.get("vote_threshold", 0.6)
+            "vote_threshold": model.config.get("vote_threshold", 0.6),
+            "voting_strategy": model.config.get("voting_strategy", "per_opinion")
         }
     
     async def increment_usage_count(self, model_id: str):
@@ -0,0 +1,186 @@
+"""
+Token预算
+按模型估算token数、按上下文窗口和预算截断文本，并统计每个教案的token消耗
+tiktoken编码器在启动时于线程中加载（首次使用需下载BPE文件，Docker镜像构建时已预取）；
+加载前或加载失败（如无法访问网络）时使用按字符类型的近似估算
+"""
+import asyncio
+import re
+from contextvars import ContextVar
+from typing import Dict, Optional
+from loguru import logger
+
+from app.core.config import settings
+
+# 常见模型的上下文窗口（token），按最长前缀匹配
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4-1106": 128000,
+    "gpt-4-0125": 128000,
+    "gpt-4o": 128000,
+    "gpt-3.5-turbo": 16385,
+    "qwen-turbo": 8000,
+    "qwen-plus": 32000,
+    "qwen-max": 8000,
+    "qwen-max-longcontext": 30000,
+}
+
+DEFAULT_CONTEXT_WINDOW = 8192
+
+TRUNCATION_MARKER = "\n…（内容过长，已截断）"
+
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+# GPT-4/GPT-3.5使用的编码，其他模型（如Qwen）按同一编码近似
+ENCODING_NAME = "cl100k_base"
+
+_encoding = None
+_encoding_loaded = False
+
+
+def load_encoding():
+    """
+    加载tiktoken编码器，只尝试一次
+    首次使用会下载BPE文件，属于阻塞调用，不能在事件循环中执行
+    """
+    global _encoding, _encoding_loaded
+    if _encoding_loaded:
+        return
+
+    try:
+        import tiktoken
+        _encoding = tiktoken.get_encoding(ENCODING_NAME)
+        logger.info(f"✅ tiktoken编码器已加载: {ENCODING_NAME}")
+    except Exception as e:
+        logger.warning(f"tiktoken编码器加载失败，使用近似估算: {str(e)}")
+    _encoding_loaded = True
+
+
+async def init_token_encoding():
+    """在线程中加载tiktoken编码器（应用启动时调用）"""
+    await asyncio.to_thread(load_encoding)
+
+
+def _get_encoding():
+    """获取已加载的tiktoken编码器，未加载或加载失败时返回None（不会触发加载）"""
+    return _encoding
+
+
+def estimate_tokens(text: Optional[str], model: str = "gpt-4") -> int:
+    """
+    估算文本的token数
+
+    Args:
+        text: 文本
+        model: 模型名称
+
+    Returns:
+        token数
+    """
+    if not text:
+        return 0
+
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+
+    # 近似估算：中文字符约1.2个token，其他字符约4个字符1个token
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    return int(cjk_count * 1.2 + (len(text) - cjk_count) / 4) + 1
+
+
+def get_context_window(model: str) -> int:
+    """获取模型上下文窗口大小"""
+    windows = {**MODEL_CONTEXT_WINDOWS, **settings.LLM_CONTEXT_WINDOWS}
+    matches = [name for name in windows if model.startswith(name)]
+    if not matches:
+        return DEFAULT_CONTEXT_WINDOW
+    return windows[max(matches, key=len)]
+
+
+def truncate_to_tokens(text: Optional[str], max_tokens: int, model: str = "gpt-4") -> str:
+    """
+    将文本截断到token预算以内（超出时追加截断标记）
+
+    Args:
+        text: 文本
+        max_tokens: token预算
+        model: 模型名称
+
+    Returns:
+        截断后的文本
+    """
+    if not text or estimate_tokens(text, model) <= max_tokens:
+        return text or ""
+
+    budget = max(max_tokens - estimate_tokens(TRUNCATION_MARKER, model), 0)
+
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        return encoding.decode(tokens[:budget]) + TRUNCATION_MARKER
+
+    # 二分查找满足预算的最长前缀
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle], model) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low] + TRUNCATION_MARKER
+
+
+def fit_prompt_to_context(
+    prompt: str,
+    model: str,
+    max_tokens: int,
+    system_message: Optional[str] = None
+) -> str:
+    """截断提示词，确保提示词、系统消息和输出预留不超过模型上下文窗口"""
+    # 预留少量token给消息格式开销
+    available = (
+        get_context_window(model)
+        - max_tokens
+        - estimate_tokens(system_message, model)
+        - 50
+    )
+    return truncate_to_tokens(prompt, max(available, 0), model)
+
+
+class TokenUsage:
+    """token消耗统计"""
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.calls = 0
+        self.latency_seconds = 0.0
+
+    def record(self, prompt_tokens: int, completion_tokens: int, latency_seconds: float):
+        """记录一次模型调用"""
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.calls += 1
+        self.latency_seconds += latency_seconds
+
+    def to_dict(self) -> Dict:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "calls": self.calls,
+            "latency_seconds": round(self.latency_seconds, 3)
+        }
+
+
+# 当前调用链的token统计（如一次教案生成），未设置时不统计
+token_usage: ContextVar[Optional[TokenUsage]] = ContextVar("token_usage", default=None)
+
+
+def record_usage(prompt_tokens: int, completion_tokens: int, latency_seconds: float):
+    """向当前调用链的统计中记录一次模型调用"""
+    usage = token_usage.get()
+    if usage is not None:
+        usage.record(prompt_tokens, completion_tokens, latency_seconds)
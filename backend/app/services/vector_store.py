@@ -0,0 +1,436 @@
+"""
+本地向量库
+向量以float32矩阵保存在本地磁盘，通过mmap只读映射，多个worker进程共享同一份页缓存；
+文档和元数据保存在清单文件中，加载时按元数据取值预先分区，过滤检索只计算对应分区
+写入在文件锁内完成读取-修改-写入，多个进程（worker、导入脚本）并发写入不会互相覆盖
+实现RAGService使用的Chroma集合接口子集（add/query/delete/count/name），可替代Chroma集合
+"""
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from loguru import logger
+
+try:
+    import hnswlib
+except ImportError:  # 可选依赖，未安装时只使用精确检索
+    hnswlib = None
+
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".write.lock"
+
+
+class LocalVectorCollection:
+    """
+    本地向量集合
+    - 向量写入前归一化，距离为余弦距离（1 - 余弦相似度）
+    - 写入时生成新版本的文件并替换清单，其他进程在下次调用时检测到清单变化后重新映射
+    - 文档数达到ann_min_documents且安装了hnswlib时，同时构建近似最近邻索引
+    """
+
+    def __init__(
+        self,
+        path: str,
+        embedding_function: Callable[[List[str]], List[List[float]]],
+        name: str = "educational_references",
+        ann_min_documents: int = 0
+    ):
+        """
+        Args:
+            path: 存储目录
+            embedding_function: 嵌入函数
+            name: 集合名称
+            ann_min_documents: 构建近似最近邻索引的最少文档数（0表示不使用）
+        """
+        self.path = path
+        self.name = name
+        self.embedding_function = embedding_function
+        self.ann_min_documents = ann_min_documents
+
+        self._lock = threading.RLock()
+        self._manifest_signature: Optional[tuple] = None
+        self._version = 0
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[Dict] = []
+        self._vectors: Optional[np.ndarray] = None
+        self._partitions: Dict[str, Dict] = {}
+        self._ann_index = None
+        self._files: Tuple[Optional[str], Optional[str]] = (None, None)
+
+        os.makedirs(path, exist_ok=True)
+        self._ensure_loaded()
+
+    # ---------- 加载 ----------
+
+    def _ensure_loaded(self):
+        """清单文件变化（本进程或其他进程写入）时重新加载"""
+        signature = self._manifest_stat()
+        if signature == self._manifest_signature:
+            return
+
+        with self._lock:
+            signature = self._manifest_stat()
+            if signature == self._manifest_signature:
+                return
+            if signature is None:
+                self._set_state(0, [], [], [], None, None)
+                self._files = (None, None)
+            else:
+                signature = self._load_latest()
+            self._manifest_signature = signature
+
+    def _load_latest(self) -> Optional[tuple]:
+        """
+        加载当前清单
+        写入方只保留当前和上一版本的文件，读到清单后其引用的文件恰好被删除时重新读取清单
+        """
+        for attempt in range(3):
+            signature = self._manifest_stat()
+            try:
+                self._load(os.path.join(self.path, MANIFEST_FILE))
+                return signature
+            except FileNotFoundError:
+                if attempt == 2:
+                    raise
+
+    def _manifest_stat(self) -> Optional[tuple]:
+        """清单文件标识（每次写入都替换为新文件，inode随之变化）"""
+        try:
+            stat = os.stat(os.path.join(self.path, MANIFEST_FILE))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load(self, manifest_path: str):
+        """映射向量文件并重建元数据分区"""
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        count = len(manifest["ids"])
+        vectors = None
+        if count:
+            # 只读映射：页面按需载入，多个进程共享同一份页缓存
+            vectors = np.memmap(
+                os.path.join(self.path, manifest["vectors_file"]),
+                dtype=np.float32,
+                mode="r",
+                shape=(count, manifest["dim"])
+            )
+
+        ann_index = None
+        if manifest.get("ann_file") and hnswlib is not None:
+            ann_index = hnswlib.Index(space="ip", dim=manifest["dim"])
+            ann_index.load_index(os.path.join(self.path, manifest["ann_file"]), max_elements=count)
+
+        self._set_state(
+            manifest["version"],
+            manifest["ids"],
+            manifest["documents"],
+            manifest["metadatas"],
+            vectors,
+            ann_index
+        )
+        self._files = (manifest["vectors_file"], manifest.get("ann_file"))
+        logger.info(f"✅ 本地向量库已加载: {count} 条文档（版本 {self._version}）")
+
+    def _set_state(self, version, ids, documents, metadatas, vectors, ann_index):
+        """替换当前状态并按元数据取值预先分区"""
+        partitions: Dict[str, Dict] = {}
+        for row, metadata in enumerate(metadatas):
+            for key, value in metadata.items():
+                partitions.setdefault(key, {}).setdefault(value, []).append(row)
+
+        self._partitions = {
+            key: {value: np.asarray(rows, dtype=np.int64) for value, rows in values.items()}
+            for key, values in partitions.items()
+        }
+        self._version = version
+        self._ids = ids
+        self._documents = documents
+        self._metadatas = metadatas
+        self._vectors = vectors
+        self._ann_index = ann_index
+
+    # ---------- 查询 ----------
+
+    def count(self) -> int:
+        self._ensure_loaded()
+        return len(self._ids)
+
+    def query(
+        self,
+        n_results: int = 10,
+        where: Optional[Dict] = None,
+        query_texts: Optional[List[str]] = None,
+        query_embeddings: Optional[Sequence[Sequence[float]]] = None
+    ) -> Dict[str, List[List]]:
+        """
+        检索最相似的文档（返回格式与Chroma一致）
+
+        Args:
+            n_results: 每条查询的返回数
+            where: 元数据过滤条件
+            query_texts: 查询文本
+            query_embeddings: 查询向量（与query_texts二选一）
+        """
+        if query_embeddings is None:
+            if query_texts is None:
+                raise ValueError("需要提供query_texts或query_embeddings")
+            query_embeddings = self.embedding_function(list(query_texts))
+
+        self._ensure_loaded()
+        # 读取快照（状态在锁内整体替换），写入不影响进行中的查询
+        with self._lock:
+            ids, documents, metadatas = self._ids, self._documents, self._metadatas
+            vectors, ann_index, partitions = self._vectors, self._ann_index, self._partitions
+
+        queries = _normalize(np.asarray(query_embeddings, dtype=np.float32))
+        empty = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        rows = self._filter_rows(where, partitions)
+
+        if vectors is None or (rows is not None and rows.size == 0):
+            return {key: [[] for _ in range(len(queries))] for key in empty}
+        if queries.shape[1] != vectors.shape[1]:
+            raise ValueError(f"查询向量维度 {queries.shape[1]} 与向量库维度 {vectors.shape[1]} 不一致")
+
+        candidates = vectors.shape[0] if rows is None else rows.size
+        k = min(n_results, candidates)
+
+        labels = distances = None
+        if ann_index is not None and candidates >= self.ann_min_documents:
+            labels, distances = self._ann_search(ann_index, queries, k, rows, vectors.shape[0])
+        if labels is None:
+            labels, distances = self._exact_search(vectors, queries, k, rows)
+
+        result = {key: [] for key in empty}
+        for query_labels, query_distances in zip(labels, distances):
+            result["ids"].append([ids[i] for i in query_labels])
+            result["documents"].append([documents[i] for i in query_labels])
+            result["metadatas"].append([metadatas[i] for i in query_labels])
+            result["distances"].append([float(d) for d in query_distances])
+        return result
+
+    @classmethod
+    def _filter_rows(cls, where: Optional[Dict], partitions: Dict[str, Dict]) -> Optional[np.ndarray]:
+        """按预先分区的元数据求满足条件的行号（None表示不过滤）"""
+        if not where:
+            return None
+
+        if len(where) != 1:
+            raise ValueError(f"多个过滤条件需使用$and组合: {where}")
+        key, value = next(iter(where.items()))
+
+        if key in ("$and", "$or"):
+            row_sets = [cls._filter_rows(condition, partitions) for condition in value]
+            row_sets = [rows for rows in row_sets if rows is not None]
+            if not row_sets:
+                return None
+            combine = np.intersect1d if key == "$and" else np.union1d
+            rows = row_sets[0]
+            for other in row_sets[1:]:
+                rows = combine(rows, other)
+            return rows
+
+        if isinstance(value, dict):
+            if list(value) != ["$eq"]:
+                raise ValueError(f"不支持的过滤条件: {where}")
+            value = value["$eq"]
+
+        return partitions.get(key, {}).get(value, np.empty(0, dtype=np.int64))
+
+    @staticmethod
+    def _exact_search(
+        vectors: np.ndarray,
+        queries: np.ndarray,
+        k: int,
+        rows: Optional[np.ndarray]
+    ):
+        """精确检索：矩阵乘法计算相似度，argpartition取前k再排序"""
+        matrix = vectors if rows is None else vectors[rows]
+        scores = queries @ matrix.T
+
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        labels = top if rows is None else rows[top]
+        return labels, 1.0 - top_scores
+
+    @staticmethod
+    def _ann_search(ann_index, queries: np.ndarray, k: int, rows: Optional[np.ndarray], total: int):
+        """近似检索，结果不足k条时返回(None, None)，由调用方改用精确检索"""
+        filter_func = None
+        if rows is not None:
+            mask = np.zeros(total, dtype=bool)
+            mask[rows] = True
+            filter_func = lambda label: bool(mask[label])
+
+        ann_index.set_ef(max(k * 4, 64))
+        try:
+            labels, distances = ann_index.knn_query(queries, k=k, filter=filter_func)
+        except RuntimeError:
+            return None, None
+        return labels, distances
+
+    # ---------- 写入 ----------
+
+    def add(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: Optional[List[Dict]] = None,
+        embeddings: Optional[Sequence[Sequence[float]]] = None
+    ):
+        """添加文档（已存在的ID跳过，与Chroma一致）"""
+        metadatas = metadatas or [{} for _ in ids]
+        with self._write_lock():
+            seen = set(self._ids)
+            new_rows = []
+            for i, doc_id in enumerate(ids):
+                if doc_id not in seen:
+                    seen.add(doc_id)
+                    new_rows.append(i)
+            if len(new_rows) < len(ids):
+                logger.warning(f"跳过已存在的文档: {len(ids) - len(new_rows)} 条")
+            if not new_rows:
+                return
+
+            new_documents = [documents[i] for i in new_rows]
+            if embeddings is None:
+                new_vectors = self.embedding_function(new_documents)
+            else:
+                new_vectors = [embeddings[i] for i in new_rows]
+            new_vectors = _normalize(np.asarray(new_vectors, dtype=np.float32))
+
+            if self._vectors is not None:
+                if new_vectors.shape[1] != self._vectors.shape[1]:
+                    raise ValueError(
+                        f"向量维度 {new_vectors.shape[1]} 与向量库维度 {self._vectors.shape[1]} 不一致"
+                    )
+                new_vectors = np.vstack([self._vectors, new_vectors])
+
+            self._write(
+                self._ids + [ids[i] for i in new_rows],
+                self._documents + new_documents,
+                self._metadatas + [metadatas[i] for i in new_rows],
+                new_vectors
+            )
+
+    def delete(self, ids: List[str]):
+        """删除文档"""
+        with self._write_lock():
+            removed = set(ids)
+            keep = [row for row, doc_id in enumerate(self._ids) if doc_id not in removed]
+            if len(keep) == len(self._ids):
+                return
+
+            vectors = None
+            if keep:
+                vectors = np.asarray(self._vectors[keep])
+            self._write(
+                [self._ids[row] for row in keep],
+                [self._documents[row] for row in keep],
+                [self._metadatas[row] for row in keep],
+                vectors
+            )
+
+    @contextmanager
+    def _write_lock(self):
+        """
+        进程内外互斥的写入锁，持有期间基于磁盘上的最新版本修改
+        文件锁保证多个进程不会基于同一版本各自写入而丢失更新
+        """
+        with self._lock:
+            with open(os.path.join(self.path, LOCK_FILE), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._ensure_loaded()
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: List[Dict],
+        vectors: Optional[np.ndarray]
+    ):
+        """
+        写入新版本（调用方持有写入锁）
+        先写版本化的向量和索引文件并落盘，最后原子替换清单；
+        保留上一版本的文件，刚读到旧清单的进程仍可映射，已映射旧文件的进程不受影响
+        """
+        version = self._version + 1
+        manifest = {
+            "version": version,
+            "dim": int(vectors.shape[1]) if vectors is not None else None,
+            "ids": ids,
+            "documents": documents,
+            "metadatas": metadatas,
+            "vectors_file": None,
+            "ann_file": None
+        }
+
+        if vectors is not None:
+            manifest["vectors_file"] = f"vectors-{version}.f32"
+            with open(os.path.join(self.path, manifest["vectors_file"]), "wb") as f:
+                f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            if hnswlib is not None and self.ann_min_documents and len(ids) >= self.ann_min_documents:
+                ann_index = hnswlib.Index(space="ip", dim=vectors.shape[1])
+                ann_index.init_index(max_elements=len(ids), ef_construction=200, M=16)
+                ann_index.add_items(vectors, np.arange(len(ids)))
+                manifest["ann_file"] = f"index-{version}.hnsw"
+                ann_path = os.path.join(self.path, manifest["ann_file"])
+                ann_index.save_index(ann_path)
+                _fsync_file(ann_path)
+
+        manifest_path = os.path.join(self.path, MANIFEST_FILE)
+        tmp_path = f"{manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, manifest_path)
+        _fsync_file(self.path)
+
+        previous_files = self._files
+        self._ensure_loaded()
+        self._remove_stale_files({manifest["vectors_file"], manifest["ann_file"], *previous_files})
+
+    def _remove_stale_files(self, keep: set):
+        """删除当前和上一版本以外的旧文件（已映射的进程在POSIX下仍可继续读取）"""
+        for filename in os.listdir(self.path):
+            if filename.startswith(("vectors-", "index-")) and filename not in keep:
+                try:
+                    os.remove(os.path.join(self.path, filename))
+                except OSError:
+                    pass
+
+
+def _fsync_file(path: str):
+    """将文件（或目录项）落盘"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """按行归一化"""
+    if vectors.ndim == 1:
+        vectors = vectors[np.newaxis, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
@@ -0,0 +1,69 @@
+"""
+教案任务注册表
+记录正在运行的教案任务，删除或取消教案时取消对应任务
+取消会传递到任务中所有正在等待的LLM和RAG调用，并释放占用的并发名额
+"""
+import asyncio
+from typing import Dict, Optional
+from loguru import logger
+
+# 取消原因
+CANCEL_USER = "user"  # 用户删除或取消教案
+CANCEL_LEASE_LOST = "lease_lost"  # 租约已被其他进程接管
+
+
+class LessonTaskRegistry:
+    """教案ID到运行中任务的映射（进程内）"""
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._cancel_reasons: Dict[asyncio.Task, str] = {}
+
+    def register(self, lesson_id: str, task: asyncio.Task):
+        """登记运行中的任务"""
+        self._tasks[lesson_id] = task
+
+    def unregister(self, lesson_id: str, task: asyncio.Task):
+        """任务结束后移除（只移除本任务，避免误删重试产生的新任务）"""
+        if self._tasks.get(lesson_id) is task:
+            del self._tasks[lesson_id]
+        self._cancel_reasons.pop(task, None)
+
+    def cancel_task(self, task: asyncio.Task, reason: str):
+        """以指定原因取消任务，任务内可通过cancel_reason区分"""
+        self._cancel_reasons.setdefault(task, reason)
+        task.cancel()
+
+    def cancel_reason(self, task: asyncio.Task) -> Optional[str]:
+        """任务被取消的原因（非经本注册表取消时为None，如进程关闭）"""
+        return self._cancel_reasons.get(task)
+
+    def is_running(self, lesson_id: str) -> bool:
+        return lesson_id in self._tasks
+
+    async def cancel(self, lesson_id: str, timeout: float = 5.0) -> bool:
+        """
+        取消教案任务并等待其结束
+
+        Args:
+            lesson_id: 教案ID
+            timeout: 等待任务完成清理的最长时间（秒）
+
+        Returns:
+            是否有任务被取消
+        """
+        task: Optional[asyncio.Task] = self._tasks.get(lesson_id)
+        if task is None or task.done():
+            return False
+
+        self.cancel_task(task, CANCEL_USER)
+        await asyncio.wait([task], timeout=timeout)
+        logger.info(f"🛑 教案任务已取消: {lesson_id}")
+        return True
+
+    def get_stats(self) -> Dict:
+        return {"running": len(self._tasks)}
+
+
+# 进程级共享的教案任务注册表
+lesson_tasks = LessonTaskRegistry()
@@ -0,0 +1,147 @@
+"""
+教案任务租约
+多个进程（多个uvicorn worker、重启时仍在收尾的旧进程）共享同一数据库，
+执行教案前先以一条条件UPDATE原子地认领，运行期间定期续约；
+租约过期（持有进程已退出）的教案可被其他进程接管，同一教案不会同时在两个进程中执行；
+教案在其他进程被取消后续约失败，持有进程随之停止，不会再覆盖其状态
+"""
+import asyncio
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from loguru import logger
+
+from app.core.config import settings
+from app.core.database import async_session_maker
+from app.models.lesson import LessonPlan, LessonStatus
+from app.tasks.cancellation import CANCEL_LEASE_LOST, CANCEL_USER, lesson_tasks
+
+# 当前进程的标识
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# 可以执行（持有租约）的教案状态
+ACTIVE_STATUSES = (LessonStatus.QUEUED, LessonStatus.PROCESSING)
+
+
+def lease_expired_before() -> datetime:
+    """心跳早于该时间的租约视为已过期"""
+    return datetime.utcnow() - timedelta(seconds=settings.LESSON_LEASE_TIMEOUT)
+
+
+def lease_available():
+    """租约可被当前进程认领的条件：无人持有、由本进程持有或已过期"""
+    return or_(
+        LessonPlan.worker_id.is_(None),
+        LessonPlan.worker_id == WORKER_ID,
+        LessonPlan.heartbeat_at.is_(None),
+        LessonPlan.heartbeat_at < lease_expired_before()
+    )
+
+
+async def claim_lesson(session: AsyncSession, lesson_id: str) -> bool:
+    """
+    认领排队中或处理中的教案（提交事务）
+
+    Returns:
+        是否认领成功（已被其他进程持有或状态已变化时返回False）
+    """
+    result = await session.execute(
+        update(LessonPlan)
+        .where(and_(
+            LessonPlan.id == lesson_id,
+            LessonPlan.status.in_(ACTIVE_STATUSES),
+            lease_available()
+        ))
+        .values(worker_id=WORKER_ID, heartbeat_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+    return result.rowcount == 1
+
+
+async def finish_lesson(session: AsyncSession, lesson_id: str, **values) -> bool:
+    """
+    仍持有租约且教案未被取消时写入最终状态并释放租约（不提交）
+
+    Returns:
+        是否写入（租约已被接管或教案已被取消、删除时返回False）
+    """
+    result = await session.execute(
+        update(LessonPlan)
+        .where(and_(
+            LessonPlan.id == lesson_id,
+            LessonPlan.worker_id == WORKER_ID,
+            LessonPlan.status.in_(ACTIVE_STATUSES)
+        ))
+        .values(worker_id=None, **values)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+async def _renew_lease(lesson_id: str) -> bool:
+    """
+    续约（使用独立会话，不与任务的会话并发）
+    教案已被取消（其他进程可能已将其标记为失败）时同样续约失败
+    """
+    async with async_session_maker() as session:
+        result = await session.execute(
+            update(LessonPlan)
+            .where(and_(
+                LessonPlan.id == lesson_id,
+                LessonPlan.worker_id == WORKER_ID,
+                LessonPlan.status.in_(ACTIVE_STATUSES)
+            ))
+            .values(heartbeat_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+        return result.rowcount == 1
+
+
+async def _lesson_active(lesson_id: str) -> bool:
+    """教案是否仍在排队或处理中（已被取消或删除时为False）"""
+    async with async_session_maker() as session:
+        status = await session.scalar(
+            select(LessonPlan.status).where(LessonPlan.id == lesson_id)
+        )
+        return status in ACTIVE_STATUSES
+
+
+async def keep_lease(lesson_id: str, task: asyncio.Task):
+    """
+    定期续约，直到被取消
+    教案已在其他进程被取消或删除时，以CANCEL_USER取消任务；
+    租约已被其他进程接管，或超过租约时长未能续约（可能已被接管）时，
+    以CANCEL_LEASE_LOST取消任务，避免同一教案重复执行
+    """
+    interval = settings.LESSON_LEASE_TIMEOUT / 4
+    last_renewed = time.monotonic()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            renewed = await _renew_lease(lesson_id)
+            if renewed:
+                last_renewed = time.monotonic()
+        except Exception as e:
+            logger.warning(f"教案租约续约失败 {lesson_id}: {str(e)}")
+            renewed = time.monotonic() - last_renewed < settings.LESSON_LEASE_TIMEOUT
+
+        if not renewed:
+            try:
+                cancelled = not await _lesson_active(lesson_id)
+            except Exception:
+                cancelled = False
+
+            if cancelled:
+                logger.info(f"🛑 教案已被取消，停止执行: {lesson_id}")
+                lesson_tasks.cancel_task(task, CANCEL_USER)
+            else:
+                logger.warning(f"⚠️ 教案租约已失去，停止执行: {lesson_id}")
+                lesson_tasks.cancel_task(task, CANCEL_LEASE_LOST)
+            return
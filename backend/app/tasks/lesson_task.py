@@ -3,20 +3,41 @@
 处理异步的教案生成任务
 """
 import asyncio
-import uuid
-from typing import Dict, List, Optional
+from functools import partial
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from loguru import logger
+from apscheduler.jobstores.base import JobLookupError
 
+from app.core.config import settings
 from app.core.database import async_session_maker
+from app.core.socketio import emit_lesson_event
 from app.models.lesson import LessonPlan, Discussion, LessonStatus
 from app.models.teaching_model import TeachingModel
 from app.services.teaching_model_service import TeachingModelService
+from app.services.execution_plan import (
+    AgentSpec,
+    BALLOT_MAX_TOKENS,
+    BALLOT_MAX_TOKENS_PER_OPINION,
+    ExecutionPlan,
+    LESSON_LLM_MODEL,
+    STAGE1_MAX_TOKENS,
+    StagePlan,
+    VOTE_MAX_TOKENS,
+    get_execution_plan
+)
 from app.services.ai_service import AIService
 from app.services.document_parser import DocumentParserService
-from app.services.rag_service import RAGService
+from app.services.rag_service import rag_service
+from app.services.rate_limiter import llm_owner
+from app.services.token_budget import TokenUsage, token_usage, truncate_to_tokens
+from app.tasks.cancellation import CANCEL_LEASE_LOST, CANCEL_USER, lesson_tasks
+from app.tasks.lease import claim_lesson, finish_lesson, keep_lease, lease_available
+from app.tasks.scheduler import scheduler
+from app.tasks.task_graph import TaskGraph
+from app.tasks.write_buffer import LessonWriteBuffer
 
 
 class LessonTaskHandler:
@@ -25,57 +46,187 @@ class LessonTaskHandler:
     def __init__(self):
         self.ai_service = AIService()
         self.doc_parser = DocumentParserService()
-        self.rag_service = RAGService()
+        self.rag_service = rag_service
     
     async def process_lesson(self, lesson_id: str):
         """
         处理教案生成任务
+        先认领教案的租约（已由其他进程执行时直接返回），运行期间定期续约；
+        任务登记在lesson_tasks中，删除或取消教案时会被取消；
+        协作过程超过LESSON_DEADLINE_SECONDS时中止并标记为失败
         
         Args:
             lesson_id: 教案ID
         """
-        async with async_session_maker() as session:
-            try:
-                # 获取教案
-                lesson = await self._get_lesson(session, lesson_id)
-                if not lesson:
-                    logger.error(f"教案不存在: {lesson_id}")
+        # 以教案为单位在LLM限流器中公平排队，并统计token消耗
+        llm_owner.set(lesson_id)
+        usage = TokenUsage()
+        token_usage.set(usage)
+        
+        task = asyncio.current_task()
+        lesson_tasks.register(lesson_id, task)
+        deadline = asyncio.timeout(settings.LESSON_DEADLINE_SECONDS or None)
+        heartbeat = None
+        
+        try:
+            async with async_session_maker() as session:
+                if not await claim_lesson(session, lesson_id):
+                    logger.info(f"教案已由其他进程执行或无需执行，跳过: {lesson_id}")
                     return
+                heartbeat = asyncio.create_task(keep_lease(lesson_id, task))
                 
-                # 更新状态为处理中
-                lesson.status = LessonStatus.PROCESSING
-                lesson.started_at = datetime.utcnow()
+                writer = None
+                try:
+                    # 获取教案
+                    lesson = await self._get_lesson(session, lesson_id)
+                    if not lesson:
+                        logger.error(f"教案不存在: {lesson_id}")
+                        return
+                    
+                    # 断点续跑时在已有消耗上累计
+                    usage.prompt_tokens = lesson.prompt_tokens or 0
+                    usage.completion_tokens = lesson.completion_tokens or 0
+                    usage.calls = lesson.llm_calls or 0
+                    usage.latency_seconds = (lesson.llm_latency_ms or 0) / 1000
+                    
+                    # 更新状态为处理中
+                    lesson.status = LessonStatus.PROCESSING
+                    lesson.started_at = lesson.started_at or datetime.utcnow()
+                    lesson.error_message = None
+                    await session.commit()
+                    
+                    writer = LessonWriteBuffer(
+                        session,
+                        lesson,
+                        flush_interval=settings.LESSON_WRITE_FLUSH_INTERVAL,
+                        max_pending=settings.LESSON_WRITE_BATCH_SIZE
+                    )
+                    
+                    # 获取教学模型
+                    model_service = TeachingModelService(session)
+                    teaching_model = await model_service.get_model_by_id(lesson.teaching_model_id)
+                    
+                    if not teaching_model:
+                        raise Exception("教学模型不存在")
+                    
+                    # 执行三阶段协作（超过截止时间时取消所有进行中的调用）
+                    async with deadline:
+                        await self._execute_three_stage_collaboration(
+                            session, lesson, teaching_model, writer
+                        )
+                    
+                    # 更新状态为完成（教案已在其他进程被取消或租约已被接管时不覆盖其状态）
+                    lesson.progress = 100
+                    lesson.checkpoint = None
+                    self._save_usage(lesson, usage)
+                    if not await finish_lesson(
+                        session,
+                        lesson_id,
+                        status=LessonStatus.COMPLETED,
+                        completed_at=datetime.utcnow()
+                    ):
+                        await session.rollback()
+                        logger.warning(f"教案已被取消或由其他进程接管，不再标记完成: {lesson_id}")
+                        return
+                    await session.commit()
+                    
+                    logger.info(f"✅ 教案生成完成: {lesson_id}")
+                    await emit_lesson_event(lesson_id, "lesson_completed", {
+                        "status": LessonStatus.COMPLETED.value,
+                        "progress": 100
+                    })
+                    
+                except asyncio.CancelledError:
+                    reason = lesson_tasks.cancel_reason(task)
+                    if reason == CANCEL_LEASE_LOST:
+                        # 教案已由其他进程接管，丢弃本进程未落库的写入，不再更新状态
+                        await session.rollback()
+                        logger.warning(f"教案已由其他进程接管，停止执行: {lesson_id}")
+                        return
+                    if reason == CANCEL_USER:
+                        # 用户取消是正常结束，不再向调度器抛出
+                        logger.info(f"🛑 教案生成已取消: {lesson_id}")
+                        await self._mark_failed(session, lesson_id, writer, usage, "任务已取消")
+                        return
+                    
+                    # 进程关闭：保留已完成的工作并释放租约，由其他进程或重启后接管
+                    logger.warning(f"进程关闭，中断教案生成: {lesson_id}")
+                    await self._release_interrupted(session, lesson_id, writer, usage)
+                    raise
+                    
+                except Exception as e:
+                    if deadline.expired():
+                        error_message = f"超过截止时间（{settings.LESSON_DEADLINE_SECONDS:g}秒）"
+                    else:
+                        error_message = str(e)
+                    logger.error(f"❌ 教案生成失败 {lesson_id}: {error_message}")
+                    await self._mark_failed(session, lesson_id, writer, usage, error_message)
+        finally:
+            if heartbeat is not None:
+                heartbeat.cancel()
+            lesson_tasks.unregister(lesson_id, task)
+    
+    async def _mark_failed(
+        self,
+        session: AsyncSession,
+        lesson_id: str,
+        writer: Optional[LessonWriteBuffer],
+        usage: TokenUsage,
+        error_message: str
+    ):
+        """标记教案失败（已提交的检查点保留，重试时续跑）"""
+        try:
+            # 先落库已缓冲的专家意见和检查点，重试时无需重新生成
+            if writer is not None:
+                try:
+                    await writer.flush()
+                except Exception as flush_error:
+                    logger.warning(f"缓冲写入落库失败 {lesson_id}: {str(flush_error)}")
+            
+            await session.rollback()
+            lesson = await self._get_lesson(session, lesson_id)
+            if lesson:
+                lesson.status = LessonStatus.FAILED
+                lesson.error_message = error_message
+                lesson.worker_id = None
+                self._save_usage(lesson, usage)
                 await session.commit()
-                
-                # 获取教学模型
-                model_service = TeachingModelService(session)
-                teaching_model = await model_service.get_model_by_id(lesson.teaching_model_id)
-                
-                if not teaching_model:
-                    raise Exception("教学模型不存在")
-                
-                # 执行三阶段协作
-                await self._execute_three_stage_collaboration(
-                    session, lesson, teaching_model
-                )
-                
-                # 更新状态为完成
-                lesson.status = LessonStatus.COMPLETED
-                lesson.completed_at = datetime.utcnow()
-                lesson.progress = 100
+        except Exception as e:
+            # 教案可能已被删除
+            logger.warning(f"更新失败状态出错 {lesson_id}: {str(e)}")
+        
+        await emit_lesson_event(lesson_id, "lesson_error", {
+            "status": LessonStatus.FAILED.value,
+            "error": error_message
+        })
+    
+    async def _release_interrupted(
+        self,
+        session: AsyncSession,
+        lesson_id: str,
+        writer: Optional[LessonWriteBuffer],
+        usage: TokenUsage
+    ):
+        """进程关闭时落库已缓冲的写入并释放租约（状态保持处理中，便于接管续跑）"""
+        try:
+            if writer is not None:
+                await writer.flush()
+            await session.rollback()
+            lesson = await self._get_lesson(session, lesson_id)
+            if lesson:
+                lesson.worker_id = None
+                self._save_usage(lesson, usage)
                 await session.commit()
-                
-                logger.info(f"✅ 教案生成完成: {lesson_id}")
-                
-            except Exception as e:
-                logger.error(f"❌ 教案生成失败 {lesson_id}: {str(e)}")
-                
-                # 更新失败状态
-                lesson = await self._get_lesson(session, lesson_id)
-                if lesson:
-                    lesson.status = LessonStatus.FAILED
-                    lesson.error_message = str(e)
-                    await session.commit()
+        except Exception as e:
+            logger.warning(f"释放中断的教案出错 {lesson_id}: {str(e)}")
+    
+    def _save_usage(self, lesson: LessonPlan, usage: TokenUsage):
+        """记录教案的LLM消耗"""
+        lesson.prompt_tokens = usage.prompt_tokens
+        lesson.completion_tokens = usage.completion_tokens
+        lesson.llm_calls = usage.calls
+        lesson.llm_latency_ms = int(usage.latency_seconds * 1000)
+        logger.info(f"📊 教案 {lesson.id} LLM消耗: {usage.to_dict()}")
     
     async def _get_lesson(self, session: AsyncSession, lesson_id: str) -> Optional[LessonPlan]:
         """获取教案"""
@@ -88,7 +239,8 @@ class LessonTaskHandler:
         self,
         session: AsyncSession,
         lesson: LessonPlan,
-        teaching_model: TeachingModel
+        teaching_model: TeachingModel,
+        writer: LessonWriteBuffer
     ):
         """
         执行三阶段协作流程
@@ -96,256 +248,519 @@ class LessonTaskHandler:
         Stage 1: 5位专家独立分析
         Stage 2: 主持人引导讨论投票
         Stage 3: 生成最终教学材料
-        """
-        model_service = TeachingModelService(session)
         
-        # 获取模型配置
-        stages = teaching_model.config.get("stages", [])
-        agents = teaching_model.config.get("agents", [])
-        discussion_config = model_service.get_discussion_config(teaching_model)
+        每个(教学阶段, 协作阶段)为依赖图中的一个节点，某教学阶段的专家意见齐全后
+        即开始讨论，方案通过后即整理材料，不必等待其他教学阶段。
+        进度按已完成节点数计算。
         
-        # Stage 1: 独立分析
-        logger.info(f"Stage 1: 5位专家独立分析 - {lesson.id}")
-        lesson.current_stage = 1
-        lesson.progress = 10
-        await session.commit()
+        专家意见逐条保存为Discussion记录，讨论结果保存在lesson.checkpoint中，
+        重新执行时从中恢复，只补跑缺失的部分。
+        """
+        # 获取编译后的执行计划（配置无效时直接失败）
+        plan = get_execution_plan(teaching_model)
+        stages = plan.stages
+        agents = plan.agents
         
-        stage1_results = await self._stage1_independent_analysis(
-            session, lesson, teaching_model, agents, stages
+        # 教材内容按token预算截断，避免超出上下文窗口
+        content = truncate_to_tokens(
+            lesson.parsed_content or lesson.source_content,
+            settings.LESSON_CONTENT_TOKEN_BUDGET
         )
         
-        # Stage 2: 讨论与投票
-        logger.info(f"Stage 2: 主持人引导讨论 - {lesson.id}")
-        lesson.current_stage = 2
-        lesson.progress = 50
-        await session.commit()
+        # 从检查点和已保存的专家意见恢复
+        checkpoint = dict(lesson.checkpoint or {})
+        saved_opinions = await self._load_stage1_opinions(session, lesson.id)
+        if checkpoint or saved_opinions:
+            logger.info(
+                f"从检查点恢复: {len(saved_opinions)} 条专家意见, "
+                f"{len(checkpoint)} 个讨论结果 - {lesson.id}"
+            )
         
-        stage2_results = await self._stage2_discussion_voting(
-            session, lesson, teaching_model, agents, stages, stage1_results, discussion_config
+        # 各教学阶段的参考资料一次批量检索
+        stage_references = await self._prefetch_stage_references(
+            lesson, stages, agents, content, saved_opinions
         )
         
-        # Stage 3: 生成教学材料
-        logger.info(f"Stage 3: 生成教学材料 - {lesson.id}")
-        lesson.current_stage = 3
-        lesson.progress = 80
+        # 所有阶段的专家分析共享并发上限
+        analysis_semaphore = asyncio.Semaphore(settings.LESSON_STAGE1_CONCURRENCY)
+        
+        graph = TaskGraph()
+        for stage in stages:
+            stage_id = stage.id
+            graph.add(
+                (stage_id, 1),
+                partial(
+                    self._stage1_analyze_stage,
+                    writer, lesson, stage, agents, content, analysis_semaphore,
+                    saved_opinions, stage_references.get(stage.id)
+                )
+            )
+            if self._checkpoint_key(stage_id, 2) in checkpoint:
+                graph.add(
+                    (stage_id, 2),
+                    partial(self._restore_checkpoint, checkpoint[self._checkpoint_key(stage_id, 2)]),
+                    deps=[(stage_id, 1)]
+                )
+            else:
+                graph.add(
+                    (stage_id, 2),
+                    partial(
+                        self._stage2_discuss_stage,
+                        writer, lesson, stage, plan
+                    ),
+                    deps=[(stage_id, 1)]
+                )
+            graph.add(
+                (stage_id, 3),
+                partial(self._stage3_assemble_stage, stage),
+                deps=[(stage_id, 2)]
+            )
+        
+        total_nodes = len(graph)
+        completed_phases = {phase: 0 for phase in (1, 2, 3)}
+        
+        async def on_complete(node, result):
+            """节点完成后更新当前阶段和进度"""
+            stage_id, phase = node
+            completed_phases[phase] += 1
+            completed = sum(completed_phases.values())
+            
+            # 当前阶段取仍有未完成节点的最早阶段
+            current_stage = next(
+                (p for p in (1, 2, 3) if completed_phases[p] < len(stages)), 3
+            )
+            
+            # 预留首尾进度给初始化和最终保存
+            progress = 5 + int(completed / total_nodes * 90)
+            await writer.set_progress(progress, current_stage)
+            
+            # 协作阶段边界：该阶段全部教学阶段完成时立即落库
+            if completed_phases[phase] == len(stages):
+                await writer.flush()
+            
+            await emit_lesson_event(lesson.id, "progress_update", {
+                "progress": progress,
+                "current_stage": current_stage,
+                "completed_nodes": completed,
+                "total_nodes": total_nodes
+            })
+            
+            logger.info(
+                f"  节点完成: {stage_id}/Stage {phase} "
+                f"({completed}/{total_nodes}) - {lesson.id}"
+            )
+        
+        logger.info(f"开始三阶段协作: {len(stages)} 个阶段 × 3 个协作阶段 - {lesson.id}")
+        lesson.current_stage = 1
+        lesson.progress = 5
         await session.commit()
+        await emit_lesson_event(lesson.id, "progress_update", {
+            "progress": 5,
+            "current_stage": 1,
+            "completed_nodes": 0,
+            "total_nodes": total_nodes
+        })
         
-        final_content = await self._stage3_generate_materials(
-            lesson, teaching_model, stages, stage2_results
-        )
+        results = await graph.run(on_complete)
+        await writer.flush()
         
         # 保存最终内容
+        final_content = {
+            "title": lesson.title,
+            "subject": lesson.subject,
+            "grade_level": lesson.grade_level,
+            "teaching_model": teaching_model.name,
+            "stages": {stage.id: results[(stage.id, 3)] for stage in stages}
+        }
+        
         lesson.final_content = final_content
         lesson.progress = 100
         await session.commit()
     
-    async def _stage1_independent_analysis(
+    async def _prefetch_stage_references(
         self,
-        session: AsyncSession,
         lesson: LessonPlan,
-        teaching_model: TeachingModel,
-        agents: List[Dict],
-        stages: List[Dict]
-    ) -> Dict:
+        stages: Tuple[StagePlan, ...],
+        agents: Tuple[AgentSpec, ...],
+        content: str,
+        saved_opinions: Dict[Tuple[str, str], str]
+    ) -> Dict[str, List[Dict]]:
         """
-        Stage 1: 5位专家独立分析
-        每位专家针对每个教学阶段提供建议
+        RAG_LESSON_SCOPED开启时，为仍有专家待分析的教学阶段批量检索参考资料
+        检索向量由教案内容向量和阶段意图向量组合而成，不再嵌入完整提示词；
+        无法计算向量时以不含具体角色的阶段提示词检索
+        
+        Returns:
+            阶段ID到参考资料的映射（未检索的阶段不在其中）
         """
-        results = {}
+        if not settings.RAG_LESSON_SCOPED:
+            return {}
         
-        for stage in stages:
-            stage_id = stage["id"]
-            stage_name = stage["name"]
-            
-            logger.info(f"  分析阶段: {stage_name}")
+        pending_stages = [
+            stage for stage in stages
+            if any((stage.name, agent.role) not in saved_opinions for agent in agents)
+        ]
+        if not pending_stages:
+            return {}
+        
+        query_embeddings: List[Optional[List[float]]] = [None] * len(pending_stages)
+        lesson_embedding = await self._get_lesson_embedding(lesson)
+        if lesson_embedding is not None:
+            intent_embeddings = await self.rag_service.embed_texts(
+                [stage.intent for stage in pending_stages]
+            )
+            if intent_embeddings is not None:
+                query_embeddings = [
+                    self.rag_service.combine_embeddings(
+                        lesson_embedding, intent, settings.RAG_LESSON_EMBEDDING_WEIGHT
+                    )
+                    for intent in intent_embeddings
+                ]
+        
+        references = await self.rag_service.search_references_batch([
+            {
+                "query": stage.render(agent_role="教学专家团队", content=content),
+                "subject": lesson.subject,
+                "region": lesson.region,
+                "n_results": 2,
+                "query_embedding": query_embedding
+            }
+            for stage, query_embedding in zip(pending_stages, query_embeddings)
+        ])
+        return {stage.id: refs for stage, refs in zip(pending_stages, references)}
+    
+    async def _get_lesson_embedding(self, lesson: LessonPlan) -> Optional[List[float]]:
+        """
+        获取教案内容的检索向量
+        已保存时直接复用，否则嵌入教案内容的开头部分（受嵌入模型输入长度限制），
+        结果随下一次提交保存到教案；向量库不可用时返回None
+        """
+        if lesson.content_embedding:
+            return lesson.content_embedding
+        
+        text = truncate_to_tokens(
+            lesson.parsed_content or lesson.source_content or lesson.title,
+            settings.RAG_LESSON_EMBEDDING_TOKENS
+        )
+        embedding = await self.rag_service.embed_text(text)
+        if embedding is not None:
+            lesson.content_embedding = embedding
+        return embedding
+    
+    async def _stage1_analyze_stage(
+        self,
+        writer: LessonWriteBuffer,
+        lesson: LessonPlan,
+        stage: StagePlan,
+        agents: Tuple[AgentSpec, ...],
+        content: str,
+        semaphore: asyncio.Semaphore,
+        saved_opinions: Dict[Tuple[str, str], str],
+        stage_references: Optional[List[Dict]] = None
+    ) -> List[Dict]:
+        """
+        Stage 1: 5位专家独立分析单个教学阶段
+        各专家并发执行，并发数受所有阶段共享的LESSON_STAGE1_CONCURRENCY限制
+        每条意见生成后写入缓冲，已保存的意见不再重新生成
+        stage_references为预先检索的本阶段参考资料（供所有专家共用），
+        为None时每位专家各自检索
+        """
+        async def analyze(agent: AgentSpec) -> str:
+            """单个专家的分析"""
+            saved = saved_opinions.get((stage.name, agent.role))
+            if saved is not None:
+                return saved
             
-            # 并行请求5位专家的意见
-            prompts = []
-            for agent in agents:
-                base_prompt = stage["prompt_template"].format(
-                    agent_role=agent["role"],
-                    content=lesson.parsed_content or lesson.source_content
-                )
+            async with semaphore:
+                base_prompt = stage.render(agent_role=agent.role, content=content)
                 
                 # 使用RAG增强提示词
-                enhanced_prompt = await self.rag_service.enhance_prompt_with_rag(
-                    base_prompt,
-                    subject=lesson.subject,
-                    region=lesson.region,
-                    n_results=2
-                )
+                if stage_references is not None:
+                    enhanced_prompt = self.rag_service.build_enhanced_prompt(
+                        base_prompt,
+                        stage_references,
+                        max_reference_tokens=settings.LESSON_REFERENCE_TOKEN_BUDGET
+                    )
+                else:
+                    enhanced_prompt = await self.rag_service.enhance_prompt_with_rag(
+                        base_prompt,
+                        subject=lesson.subject,
+                        region=lesson.region,
+                        n_results=2,
+                        max_reference_tokens=settings.LESSON_REFERENCE_TOKEN_BUDGET
+                    )
                 
-                prompts.append(enhanced_prompt)
+                response = await self.ai_service.generate(
+                    enhanced_prompt,
+                    model=LESSON_LLM_MODEL,
+                    temperature=0.7,
+                    max_tokens=STAGE1_MAX_TOKENS,
+                    use_cache=settings.LESSON_STAGE1_CACHE_ENABLED
+                )
             
-            # 批量生成
-            responses = await self.ai_service.batch_generate(
-                prompts,
-                model="gpt-4",
-                temperature=0.7,
-                max_tokens=1500
+            # 保存到数据库
+            await writer.add_discussion(
+                stage=1,
+                round=1,
+                topic=stage.name,
+                agent_role=agent.role,
+                opinion=response
             )
             
-            # 保存专家意见
-            stage_opinions = []
-            for i, (agent, response) in enumerate(zip(agents, responses)):
-                opinion = {
-                    "agent_role": agent["role"],
-                    "expertise": agent["expertise"],
-                    "opinion": response
-                }
-                stage_opinions.append(opinion)
-                
-                # 保存到数据库
-                discussion = Discussion(
-                    id=str(uuid.uuid4()),
-                    lesson_plan_id=lesson.id,
-                    stage=1,
-                    round=1,
-                    topic=stage_name,
-                    agent_role=agent["role"],
-                    opinion=response,
-                    is_accepted=False
-                )
-                session.add(discussion)
+            await emit_lesson_event(lesson.id, "discussion_update", {
+                "stage": 1,
+                "round": 1,
+                "topic": stage.name,
+                "agent_role": agent.role,
+                "opinion": response,
+                "is_accepted": False
+            })
             
-            results[stage_id] = stage_opinions
+            return response
         
-        await session.commit()
-        return results
+        logger.info(f"  分析阶段: {stage.name}（{len(agents)} 位专家）")
+        
+        # 单个专家失败时其余专家照常完成并保存，重试时无需重新生成
+        responses = await asyncio.gather(
+            *[analyze(agent) for agent in agents],
+            return_exceptions=True
+        )
+        for response in responses:
+            if isinstance(response, BaseException):
+                raise response
+        
+        # 按专家的原始顺序整理专家意见
+        return [
+            {
+                "agent_role": agent.role,
+                "expertise": agent.expertise,
+                "opinion": response
+            }
+            for agent, response in zip(agents, responses)
+        ]
     
-    async def _stage2_discussion_voting(
+    async def _stage2_discuss_stage(
         self,
-        session: AsyncSession,
+        writer: LessonWriteBuffer,
         lesson: LessonPlan,
-        teaching_model: TeachingModel,
-        agents: List[Dict],
-        stages: List[Dict],
-        stage1_results: Dict,
-        discussion_config: Dict
+        stage: StagePlan,
+        plan: ExecutionPlan,
+        opinions: List[Dict]
     ) -> Dict:
         """
-        Stage 2: 主持人引导讨论和投票
-        对每个阶段的方案进行讨论和投票
+        Stage 2: 主持人引导单个教学阶段的讨论和投票
         """
-        results = {}
-        rounds = discussion_config["rounds"]
-        vote_threshold = discussion_config["vote_threshold"]
+        best_opinion, accepted_round, rounds_used = await self._discuss_stage(
+            stage, opinions, plan
+        )
+        best_opinion["rounds_used"] = rounds_used
+        best_opinion["rounds_saved"] = plan.rounds - rounds_used
         
-        for stage in stages:
-            stage_id = stage["id"]
-            stage_name = stage["name"]
+        # 保存通过的意见，并与检查点在同一事务中提交
+        discussion = None
+        if accepted_round is not None:
+            discussion = {
+                "stage": 2,
+                "round": accepted_round,
+                "topic": stage.name,
+                "agent_role": best_opinion["agent_role"],
+                "opinion": best_opinion["opinion"],
+                "votes": best_opinion["votes"],
+                "pass_rate": best_opinion["pass_rate"],
+                "is_accepted": True
+            }
+        await writer.save_checkpoint(
+            self._checkpoint_key(stage.id, 2), best_opinion, discussion
+        )
+        
+        await emit_lesson_event(lesson.id, "discussion_update", {
+            "stage": 2,
+            "round": accepted_round,
+            "topic": stage.name,
+            "agent_role": best_opinion["agent_role"],
+            "opinion": best_opinion["opinion"],
+            "votes": best_opinion.get("votes"),
+            "pass_rate": best_opinion.get("pass_rate"),
+            "is_accepted": accepted_round is not None
+        })
+        
+        return best_opinion
+    
+    @staticmethod
+    def _checkpoint_key(stage_id: str, phase: int) -> str:
+        """检查点中节点的键"""
+        return f"{stage_id}:{phase}"
+    
+    async def _restore_checkpoint(self, result, *deps):
+        """从检查点恢复节点结果"""
+        return result
+    
+    async def _load_stage1_opinions(
+        self,
+        session: AsyncSession,
+        lesson_id: str
+    ) -> Dict[Tuple[str, str], str]:
+        """加载已保存的Stage 1专家意见，键为(阶段名称, 专家角色)"""
+        result = await session.execute(
+            select(Discussion).where(
+                Discussion.lesson_plan_id == lesson_id,
+                Discussion.stage == 1
+            )
+        )
+        return {
+            (discussion.topic, discussion.agent_role): discussion.opinion
+            for discussion in result.scalars().all()
+        }
+    
+    async def _discuss_stage(
+        self,
+        stage: StagePlan,
+        opinions: List[Dict],
+        plan: ExecutionPlan
+    ) -> Tuple[Dict, Optional[int], int]:
+        """
+        单个阶段的多轮讨论
+        每轮内各意见的投票并发进行；第2轮起提示词附带上一轮的投票理由。
+        以下情况提前结束：
+        - 有方案达到通过阈值
+        - 本轮提示词与上一轮完全相同（结果不会变化）
+        - 方案排名与上一轮一致（已收敛）
+        
+        Returns:
+            (最佳意见, 通过的轮次, 实际进行的轮数)，所有轮次都未通过时通过轮次为None
+        """
+        stage_name = stage.name
+        agents = plan.agents
+        rounds = plan.rounds
+        vote_threshold = plan.vote_threshold
+        ballot_mode = plan.voting_strategy == "ballot"
+        
+        logger.info(f"  讨论阶段: {stage_name}")
+        
+        previous_prompts = None
+        previous_ranking = None
+        rounds_used = 0
+        
+        # 多轮讨论
+        for round_num in range(1, rounds + 1):
+            if ballot_mode:
+                prompts = [self._create_ballot_prompt(stage_name, opinions, agents)]
+            else:
+                prompts = [
+                    self._create_vote_prompt(stage_name, opinion, opinions, agents)
+                    for opinion in opinions
+                ]
             
-            logger.info(f"  讨论阶段: {stage_name}")
+            if prompts == previous_prompts:
+                logger.info(f"    {stage_name} 输入与上一轮相同，跳过剩余轮次")
+                break
             
-            opinions = stage1_results[stage_id]
+            logger.info(f"    {stage_name} 第 {round_num} 轮讨论")
+            rounds_used = round_num
             
-            # 多轮讨论
-            for round_num in range(1, rounds + 1):
-                logger.info(f"    第 {round_num} 轮讨论")
-                
-                # 对每个意见进行投票
-                for opinion in opinions:
-                    # 生成投票请求
-                    vote_prompt = self._create_vote_prompt(
-                        stage_name,
-                        opinion,
-                        opinions,
-                        agents
-                    )
-                    
-                    vote_response = await self.ai_service.generate(
-                        vote_prompt,
-                        model="gpt-4",
-                        temperature=0.3,
-                        max_tokens=500
-                    )
-                    
-                    # 解析投票结果（简化版，实际应更复杂）
-                    votes = self._parse_votes(vote_response, len(agents))
-                    opinion["votes"] = votes
-                    opinion["pass_rate"] = votes["agree"] / len(agents)
-                
-                # 检查是否有方案通过
-                passed_opinions = [
-                    op for op in opinions
-                    if op.get("pass_rate", 0) >= vote_threshold
-                ]
-                
-                if passed_opinions:
-                    # 选择得票最高的方案
-                    best_opinion = max(passed_opinions, key=lambda x: x["pass_rate"])
-                    
-                    # 保存通过的意见
-                    discussion = Discussion(
-                        id=str(uuid.uuid4()),
-                        lesson_plan_id=lesson.id,
-                        stage=2,
-                        round=round_num,
-                        topic=stage_name,
-                        agent_role=best_opinion["agent_role"],
-                        opinion=best_opinion["opinion"],
-                        votes=best_opinion["votes"],
-                        pass_rate=best_opinion["pass_rate"],
-                        is_accepted=True
-                    )
-                    session.add(discussion)
-                    
-                    results[stage_id] = best_opinion
-                    break
+            if ballot_mode:
+                round_votes = await self._collect_ballot_votes(
+                    prompts[0], len(opinions), len(agents)
+                )
+            else:
+                round_votes = await self._collect_opinion_votes(prompts, len(agents))
+            
+            for opinion, votes in zip(opinions, round_votes):
+                opinion["votes"] = votes
+                opinion["pass_rate"] = votes["agree"] / len(agents)
+            
+            # 检查是否有方案通过
+            passed_opinions = [
+                op for op in opinions
+                if op.get("pass_rate", 0) >= vote_threshold
+            ]
             
-            # 如果所有轮次都没通过，使用得票最高的
-            if stage_id not in results:
-                best_opinion = max(opinions, key=lambda x: x.get("pass_rate", 0))
-                results[stage_id] = best_opinion
+            if passed_opinions:
+                # 选择得票最高的方案
+                return max(passed_opinions, key=lambda x: x["pass_rate"]), round_num, rounds_used
+            
+            ranking = [
+                op["agent_role"]
+                for op in sorted(opinions, key=lambda x: x["pass_rate"], reverse=True)
+            ]
+            if ranking == previous_ranking:
+                logger.info(f"    {stage_name} 排名已稳定，提前结束讨论")
+                break
+            
+            previous_prompts = prompts
+            previous_ranking = ranking
         
-        await session.commit()
-        return results
+        # 如果所有轮次都没通过，使用得票最高的
+        return max(opinions, key=lambda x: x.get("pass_rate", 0)), None, rounds_used
     
-    async def _stage3_generate_materials(
+    async def _collect_opinion_votes(
         self,
-        lesson: LessonPlan,
-        teaching_model: TeachingModel,
-        stages: List[Dict],
-        stage2_results: Dict
-    ) -> Dict:
+        prompts: List[str],
+        total_agents: int
+    ) -> List[Dict]:
         """
-        Stage 3: 生成最终教学材料
-        根据通过的方案生成完整的教案
+        逐个方案投票：每个方案一次调用，并发进行
+        相同方案的评审结果直接复用缓存（投票是评判而非创作）
         """
-        final_content = {
-            "title": lesson.title,
-            "subject": lesson.subject,
-            "grade_level": lesson.grade_level,
-            "teaching_model": teaching_model.name,
-            "stages": {}
-        }
+        vote_responses = await asyncio.gather(*[
+            self.ai_service.generate(
+                prompt,
+                model=LESSON_LLM_MODEL,
+                temperature=0.3,
+                max_tokens=VOTE_MAX_TOKENS,
+                use_cache=True
+            )
+            for prompt in prompts
+        ])
         
-        for stage in stages:
-            stage_id = stage["id"]
-            stage_name = stage["name"]
-            
-            if stage_id in stage2_results:
-                final_content["stages"][stage_id] = {
-                    "name": stage_name,
-                    "content": stage2_results[stage_id]["opinion"],
-                    "expert": stage2_results[stage_id]["agent_role"]
-                }
-        
-        return final_content
+        # 解析投票结果（简化版，实际应更复杂）
+        return [
+            self._parse_votes(vote_response, total_agents)
+            for vote_response in vote_responses
+        ]
+    
+    async def _collect_ballot_votes(
+        self,
+        prompt: str,
+        total_opinions: int,
+        total_agents: int
+    ) -> List[Dict]:
+        """批量投票：一次调用为阶段内全部方案投票"""
+        ballot_response = await self.ai_service.generate(
+            prompt,
+            model=LESSON_LLM_MODEL,
+            temperature=0.3,
+            max_tokens=min(BALLOT_MAX_TOKENS_PER_OPINION * total_opinions, BALLOT_MAX_TOKENS),
+            use_cache=True
+        )
+        
+        return self._parse_ballot(ballot_response, total_opinions, total_agents)
+    
+    async def _stage3_assemble_stage(self, stage: StagePlan, best_opinion: Dict) -> Dict:
+        """
+        Stage 3: 根据通过的方案整理单个教学阶段的教学材料
+        """
+        return {
+            "name": stage.name,
+            "content": best_opinion["opinion"],
+            "expert": best_opinion["agent_role"],
+            "discussion_rounds": best_opinion.get("rounds_used"),
+            "rounds_saved": best_opinion.get("rounds_saved")
+        }
     
     def _create_vote_prompt(
         self,
         stage_name: str,
         opinion: Dict,
         all_opinions: List[Dict],
-        agents: List[Dict]
+        agents: Tuple[AgentSpec, ...]
     ) -> str:
         """创建投票提示词"""
         prompt = f"""作为教学专家团队，请对以下{stage_name}的教学方案进行投票评估：
 
 **当前方案**（由{opinion['agent_role']}提出）：
 {opinion['opinion']}
-
+{self._format_previous_votes(opinion)}
 **其他专家的方案**：
 """
         for i, other_op in enumerate(all_opinions):
@@ -357,40 +772,191 @@ class LessonTaskHandler:
 请从以下5个专家角色的角度进行投票（同意/不同意）：
 """
         for agent in agents:
-            prompt += f"- {agent['role']} ({agent['expertise']})\n"
+            prompt += f"- {agent.role} ({agent.expertise})\n"
         
         prompt += "\n请以JSON格式返回投票结果：{\"votes\": [{\"agent\": \"角色名\", \"vote\": \"agree/disagree\", \"reason\": \"理由\"}]}"
         
         return prompt
     
-    def _parse_votes(self, vote_response: str, total_agents: int) -> Dict:
-        """解析投票结果"""
+    def _create_ballot_prompt(
+        self,
+        stage_name: str,
+        opinions: List[Dict],
+        agents: Tuple[AgentSpec, ...]
+    ) -> str:
+        """创建批量投票提示词（一次评估阶段内全部方案）"""
+        prompt = f"作为教学专家团队，请对以下{stage_name}的{len(opinions)}个教学方案逐一进行投票评估：\n"
+        
+        for i, opinion in enumerate(opinions):
+            opinion_text = truncate_to_tokens(
+                opinion['opinion'], settings.LESSON_BALLOT_OPINION_TOKEN_BUDGET
+            )
+            prompt += f"\n**方案{i+1}**（由{opinion['agent_role']}提出）：\n{opinion_text}\n"
+            prompt += self._format_previous_votes(opinion)
+        
+        prompt += """
+
+请从以下5个专家角色的角度，对每个方案分别投票（同意/不同意）：
+"""
+        for agent in agents:
+            prompt += f"- {agent.role} ({agent.expertise})\n"
+        
+        prompt += "\n请以JSON格式返回投票结果：{\"ballots\": [{\"proposal\": 方案编号, \"votes\": [{\"agent\": \"角色名\", \"vote\": \"agree/disagree\", \"reason\": \"理由\"}]}]}"
+        
+        return prompt
+    
+    def _format_previous_votes(self, opinion: Dict) -> str:
+        """格式化上一轮的投票理由（首轮或无理由时为空）"""
+        details = opinion.get("votes", {}).get("details") or []
+        if not details:
+            return ""
+        
+        text = "\n*上一轮投票意见*：\n"
+        for vote in details:
+            vote_name = "同意" if vote.get("vote") == "agree" else "不同意"
+            text += f"- {vote.get('agent', '')}: {vote_name}（{str(vote.get('reason', ''))[:100]}）\n"
+        return text
+    
+    def _extract_json(self, response: str) -> Dict:
+        """从模型响应中提取JSON（可能包含在markdown代码块中）"""
         import json
         
+        if "```json" in response:
+            json_str = response.split("```json")[1].split("```")[0].strip()
+        elif "{" in response:
+            json_str = response[response.find("{"):response.rfind("}")+1]
+        else:
+            json_str = response
+        
+        return json.loads(json_str)
+    
+    def _count_votes(self, votes_list: List[Dict]) -> Dict:
+        """统计投票"""
+        agree_count = sum(1 for v in votes_list if v.get("vote") == "agree")
+        
+        return {
+            "agree": agree_count,
+            "disagree": len(votes_list) - agree_count,
+            "details": votes_list
+        }
+    
+    def _default_votes(self, total_agents: int) -> Dict:
+        """解析失败时的默认投票（假设大多数同意）"""
+        return {
+            "agree": int(total_agents * 0.7),
+            "disagree": int(total_agents * 0.3),
+            "details": []
+        }
+    
+    def _parse_votes(self, vote_response: str, total_agents: int) -> Dict:
+        """解析投票结果"""
         try:
-            # 尝试提取JSON
-            if "```json" in vote_response:
-                json_str = vote_response.split("```json")[1].split("```")[0].strip()
-            elif "{" in vote_response:
-                json_str = vote_response[vote_response.find("{"):vote_response.rfind("}")+1]
-            else:
-                json_str = vote_response
-            
-            data = json.loads(json_str)
-            votes_list = data.get("votes", [])
-            
-            agree_count = sum(1 for v in votes_list if v.get("vote") == "agree")
-            
-            return {
-                "agree": agree_count,
-                "disagree": len(votes_list) - agree_count,
-                "details": votes_list
-            }
+            data = self._extract_json(vote_response)
+            return self._count_votes(data.get("votes", []))
         except:
             # 解析失败，假设大多数同意
-            return {
-                "agree": int(total_agents * 0.7),
-                "disagree": int(total_agents * 0.3),
-                "details": []
-            }
+            return self._default_votes(total_agents)
+    
+    def _parse_ballot(
+        self,
+        ballot_response: str,
+        total_opinions: int,
+        total_agents: int
+    ) -> List[Dict]:
+        """解析批量投票结果，返回与方案顺序一致的投票列表"""
+        results = [self._default_votes(total_agents) for _ in range(total_opinions)]
+        
+        try:
+            data = self._extract_json(ballot_response)
+            ballots = data.get("ballots", [])
+        except:
+            # 解析失败，全部使用默认投票
+            return results
+        
+        for position, ballot in enumerate(ballots):
+            if not isinstance(ballot, dict):
+                continue
+            try:
+                index = int(ballot.get("proposal", position + 1)) - 1
+            except (TypeError, ValueError):
+                index = position
+            
+            if 0 <= index < total_opinions:
+                results[index] = self._count_votes(ballot.get("votes", []))
+        
+        return results
+
+
+def schedule_lesson(lesson_id: str):
+    """将教案生成任务加入调度器（立即执行一次）"""
+    task_handler = LessonTaskHandler()
+    scheduler.add_job(
+        task_handler.process_lesson,
+        'date',
+        args=[lesson_id],
+        id=f"lesson_{lesson_id}",
+        replace_existing=True
+    )
+
+
+async def cancel_lesson(lesson_id: str) -> bool:
+    """
+    取消教案任务：移除尚未开始的调度任务，并取消正在运行的任务
+    
+    Returns:
+        是否取消了排队中或运行中的任务
+    """
+    cancelled = False
+    try:
+        scheduler.remove_job(f"lesson_{lesson_id}")
+        cancelled = True
+    except JobLookupError:
+        pass
+    
+    if await lesson_tasks.cancel(lesson_id):
+        cancelled = True
+    return cancelled
+
+
+async def resume_interrupted_lessons() -> int:
+    """
+    接管中断的教案任务（排队中或处理中，且无进程持有有效租约）
+    每个教案先原子地认领，认领成功才调度，多个进程同时执行时同一教案只会被一个进程接管
+    
+    Returns:
+        重新调度的教案数
+    """
+    resumed = 0
+    async with async_session_maker() as session:
+        result = await session.execute(
+            select(LessonPlan.id).where(
+                LessonPlan.status.in_([LessonStatus.QUEUED, LessonStatus.PROCESSING]),
+                lease_available()
+            )
+        )
+        lesson_ids = result.scalars().all()
+        
+        for lesson_id in lesson_ids:
+            # 本进程已在执行或即将执行的教案
+            if lesson_tasks.is_running(lesson_id) or scheduler.get_job(f"lesson_{lesson_id}"):
+                continue
+            if await claim_lesson(session, lesson_id):
+                schedule_lesson(lesson_id)
+                resumed += 1
+    
+    if resumed:
+        logger.info(f"🔁 已接管 {resumed} 个中断的教案任务")
+    return resumed
+
 
+def schedule_lesson_recovery():
+    """启动时接管一次中断的教案，之后按租约时长定期检查（接管其他进程退出后遗留的教案）"""
+    scheduler.add_job(
+        resume_interrupted_lessons,
+        'interval',
+        seconds=settings.LESSON_LEASE_TIMEOUT,
+        id="lesson_recovery",
+        next_run_time=datetime.now(scheduler.timezone),
+        replace_existing=True,
+        max_instances=1
+    )
@@ -0,0 +1,113 @@
+"""
+任务依赖图
+每个节点在其所有依赖完成后立即启动，无依赖关系的节点并发执行
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+
+class TaskGraph:
+    """
+    异步任务依赖图
+    - 节点函数接收各依赖节点的结果（按声明顺序）
+    - 任一节点失败后不再启动新节点，已在执行的节点照常完成（保留已产生的结果），
+      全部结束后抛出首个异常
+    """
+
+    def __init__(self):
+        self._funcs: Dict[Hashable, Callable[..., Awaitable[Any]]] = {}
+        self._deps: Dict[Hashable, List[Hashable]] = {}
+        self.results: Dict[Hashable, Any] = {}
+
+    def add(
+        self,
+        node: Hashable,
+        func: Callable[..., Awaitable[Any]],
+        deps: Optional[List[Hashable]] = None
+    ):
+        """
+        添加节点
+
+        Args:
+            node: 节点标识
+            func: 协程函数，参数为各依赖节点的结果
+            deps: 依赖的节点标识
+        """
+        if node in self._funcs:
+            raise ValueError(f"节点重复: {node}")
+        self._funcs[node] = func
+        self._deps[node] = list(deps or [])
+
+    def __len__(self) -> int:
+        return len(self._funcs)
+
+    def _validate(self):
+        """检查依赖是否存在且无环"""
+        for node, deps in self._deps.items():
+            for dep in deps:
+                if dep not in self._funcs:
+                    raise ValueError(f"节点 {node} 依赖不存在的节点 {dep}")
+
+        visited = set()
+        visiting = set()
+
+        def visit(node):
+            if node in visited:
+                return
+            if node in visiting:
+                raise ValueError(f"依赖图存在环: {node}")
+            visiting.add(node)
+            for dep in self._deps[node]:
+                visit(dep)
+            visiting.discard(node)
+            visited.add(node)
+
+        for node in self._funcs:
+            visit(node)
+
+    async def run(
+        self,
+        on_complete: Optional[Callable[[Hashable, Any], Awaitable[None]]] = None
+    ) -> Dict[Hashable, Any]:
+        """
+        执行依赖图
+
+        Args:
+            on_complete: 节点完成回调，参数为(节点, 结果)
+
+        Returns:
+            各节点结果
+        """
+        self._validate()
+        done = {node: asyncio.Event() for node in self._funcs}
+        errors: List[BaseException] = []
+
+        async def run_node(node):
+            try:
+                for dep in self._deps[node]:
+                    await done[dep].wait()
+                # 已有节点失败时不再启动新节点
+                if errors:
+                    return
+                result = await self._funcs[node](*[self.results[dep] for dep in self._deps[node]])
+                self.results[node] = result
+                if on_complete is not None:
+                    await on_complete(node, result)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                done[node].set()
+
+        tasks = [asyncio.ensure_future(run_node(node)) for node in self._funcs]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # 外部取消时一并取消所有节点
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if errors:
+            raise errors[0]
+        return self.results
@@ -0,0 +1,155 @@
+"""
+教案写入缓冲
+讨论记录批量插入，进度和检查点的更新合并后随同一事务提交
+达到条数或时间阈值时自动落库，协作阶段边界处由调用方显式落库
+"""
+import asyncio
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from loguru import logger
+
+from app.models.lesson import LessonPlan, Discussion
+
+
+class LessonWriteBuffer:
+    """
+    单个教案的写入缓冲
+    AsyncSession不支持并发操作，所有写入和提交都在内部锁中串行进行
+    """
+
+    def __init__(
+        self,
+        session: AsyncSession,
+        lesson: LessonPlan,
+        flush_interval: float,
+        max_pending: int
+    ):
+        """
+        Args:
+            session: 数据库会话
+            lesson: 教案
+            flush_interval: 距上次落库超过该时间（秒）时落库
+            max_pending: 缓冲的讨论记录达到该条数时落库
+        """
+        self.session = session
+        self.lesson = lesson
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._lock = asyncio.Lock()
+        self._discussions: List[Dict[str, Any]] = []
+        self._lesson_dirty = False
+        self._last_flush = time.monotonic()
+        self.flushes = 0
+
+    async def add_discussion(
+        self,
+        stage: int,
+        round: int,
+        topic: str,
+        agent_role: str,
+        opinion: str,
+        votes: Optional[Dict] = None,
+        pass_rate: Optional[float] = None,
+        is_accepted: bool = False
+    ):
+        """缓冲一条讨论记录"""
+        async with self._lock:
+            self._append_discussion(
+                stage, round, topic, agent_role, opinion, votes, pass_rate, is_accepted
+            )
+            await self._maybe_flush()
+
+    async def set_progress(self, progress: int, current_stage: int):
+        """更新进度（只保留最新值）"""
+        async with self._lock:
+            self.lesson.progress = progress
+            self.lesson.current_stage = current_stage
+            self._lesson_dirty = True
+            await self._maybe_flush()
+
+    async def save_checkpoint(
+        self,
+        key: str,
+        value: Any,
+        discussion: Optional[Dict[str, Any]] = None
+    ):
+        """
+        更新检查点中的一个节点并立即落库
+        附带的讨论记录与检查点在同一事务中提交，续跑时不会重复写入
+
+        Args:
+            key: 检查点键
+            value: 节点结果
+            discussion: 随检查点一起写入的讨论记录（add_discussion的参数）
+        """
+        async with self._lock:
+            if discussion is not None:
+                self._append_discussion(**discussion)
+            # 重新赋值整个字典，确保JSON列的变更被追踪
+            self.lesson.checkpoint = {**(self.lesson.checkpoint or {}), key: value}
+            self._lesson_dirty = True
+            await self._flush()
+
+    def _append_discussion(
+        self,
+        stage: int,
+        round: int,
+        topic: str,
+        agent_role: str,
+        opinion: str,
+        votes: Optional[Dict] = None,
+        pass_rate: Optional[float] = None,
+        is_accepted: bool = False
+    ):
+        """加入缓冲（调用方持有锁）"""
+        # 所有行字段一致，才能合并为一条多行INSERT
+        self._discussions.append({
+            "id": str(uuid.uuid4()),
+            "lesson_plan_id": self.lesson.id,
+            "stage": stage,
+            "round": round,
+            "topic": topic,
+            "agent_role": agent_role,
+            "opinion": opinion,
+            "votes": votes,
+            "pass_rate": pass_rate,
+            "is_accepted": is_accepted
+        })
+
+    async def flush(self):
+        """立即落库"""
+        async with self._lock:
+            await self._flush()
+
+    async def _maybe_flush(self):
+        """达到条数或时间阈值时落库"""
+        if (
+            len(self._discussions) >= self.max_pending
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            await self._flush()
+
+    async def _flush(self):
+        """在一个事务中批量插入讨论记录并提交教案更新"""
+        if not self._discussions and not self._lesson_dirty:
+            return
+
+        rows, self._discussions = self._discussions, []
+        try:
+            if rows:
+                # 多行INSERT，一次往返写入全部缓冲的讨论记录
+                await self.session.execute(insert(Discussion), rows)
+            await self.session.commit()
+        except BaseException:
+            # 落库失败时保留缓冲，便于调用方重试
+            self._discussions = rows + self._discussions
+            raise
+
+        self._lesson_dirty = False
+        self._last_flush = time.monotonic()
+        self.flushes += 1
+        logger.debug(f"教案写入落库: {len(rows)} 条讨论记录 - {self.lesson.id}")
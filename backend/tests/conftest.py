@@ -0,0 +1,75 @@
+"""
+测试公共夹具
+LLM调用统一走模拟提供商，不访问网络和Redis；数据库使用临时SQLite文件
+"""
+import uuid
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.core.config import settings
+from app.core.database import Base
+from app.models.lesson import LessonPlan, LessonStatus, SourceType
+from app.models.teaching_model import TeachingModel  # noqa: F401  注册表结构
+from app.models.user import User  # noqa: F401  注册表结构
+from app.services.circuit_breaker import circuit_breakers
+from app.services.llm_cache import llm_cache
+from app.services.mock_llm import mock_llm
+
+
+@pytest.fixture
+def mock_provider(monkeypatch):
+    """使用无延迟、无注入错误的模拟提供商，并清空进程级缓存和熔断状态"""
+    monkeypatch.setattr(settings, "LLM_PROVIDER", "mock")
+    monkeypatch.setattr(settings, "LLM_CACHE_REDIS_ENABLED", False)
+    monkeypatch.setattr(mock_llm, "latency_ms", 0.0)
+    monkeypatch.setattr(mock_llm, "error_rate", 0.0)
+    monkeypatch.setattr(circuit_breakers, "_breakers", {})
+    llm_cache.memory.clear()
+    monkeypatch.setattr(llm_cache, "stats", {key: 0 for key in llm_cache.stats})
+
+    calls = []
+    original = mock_llm.generate
+
+    async def counting_generate(prompt, *args, **kwargs):
+        calls.append(prompt)
+        return await original(prompt, *args, **kwargs)
+
+    monkeypatch.setattr(mock_llm, "generate", counting_generate)
+    return calls
+
+
+@pytest.fixture
+async def session_maker(tmp_path, monkeypatch):
+    """临时SQLite数据库，租约模块的独立会话也使用该数据库"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    monkeypatch.setattr("app.tasks.lease.async_session_maker", maker)
+    yield maker
+    await engine.dispose()
+
+
+@pytest.fixture
+def create_lesson(session_maker):
+    """创建教案记录，返回教案ID"""
+    async def create(status: LessonStatus = LessonStatus.QUEUED, **values) -> str:
+        lesson = LessonPlan(
+            id=str(uuid.uuid4()),
+            user_id=str(uuid.uuid4()),
+            title="光的传播",
+            subject="科学",
+            grade_level="小学",
+            teaching_model_id=str(uuid.uuid4()),
+            source_type=SourceType.MANUAL,
+            status=status,
+            **values
+        )
+        async with session_maker() as session:
+            session.add(lesson)
+            await session.commit()
+        return lesson.id
+
+    return create
@@ -0,0 +1,84 @@
+"""AIService重试、熔断与请求合并测试"""
+import asyncio
+
+import httpx
+import pytest
+
+from app.core.config import settings
+from app.services import ai_service as ai_service_module
+from app.services.ai_service import AIService
+from app.services.circuit_breaker import CircuitState, circuit_breakers
+from app.services.mock_llm import MockLLMError, mock_llm
+
+
+@pytest.fixture
+def no_retry_wait(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_RETRY_MAX_WAIT", 0.0)
+
+
+def _rate_limited() -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://llm.example.com")
+    return httpx.HTTPStatusError(
+        "rate limited", request=request, response=httpx.Response(429, request=request)
+    )
+
+
+async def test_transient_error_is_retried(mock_provider, no_retry_wait, monkeypatch):
+    """暂时性错误重试后成功，不计入熔断"""
+    failures = [MockLLMError("模拟的提供商错误")]
+
+    async def flaky_generate(prompt, max_tokens, system_message=None):
+        if failures:
+            raise failures.pop()
+        return "ok"
+
+    monkeypatch.setattr(mock_llm, "generate", flaky_generate)
+
+    assert await AIService().generate("你好", use_cache=False) == "ok"
+    assert circuit_breakers.get("mock").failures == 0
+
+
+async def test_rate_limit_does_not_open_breaker(mock_provider, no_retry_wait, monkeypatch):
+    """持续限流时有限次重试后失败，熔断器保持关闭"""
+    attempts = []
+
+    async def rate_limited_generate(prompt, max_tokens, system_message=None):
+        attempts.append(prompt)
+        raise _rate_limited()
+
+    monkeypatch.setattr(mock_llm, "generate", rate_limited_generate)
+
+    service = AIService()
+    for _ in range(3):
+        with pytest.raises(httpx.HTTPStatusError):
+            await service.generate("你好", use_cache=False)
+
+    assert len(attempts) == 3 * settings.LLM_RETRY_ATTEMPTS
+    assert circuit_breakers.get("mock").state == CircuitState.CLOSED
+
+
+async def test_prompt_fitting_error_keeps_probe_slot(mock_provider, monkeypatch):
+    """提示词处理出错时不占用半开状态的探测名额"""
+    breaker = circuit_breakers.get("mock")
+    breaker.state = CircuitState.HALF_OPEN
+
+    def broken_fit(*args, **kwargs):
+        raise ValueError("bad prompt")
+
+    monkeypatch.setattr(ai_service_module, "fit_prompt_to_context", broken_fit)
+
+    with pytest.raises(ValueError):
+        await AIService().generate("你好", use_cache=False)
+    assert breaker.is_available()
+
+
+async def test_identical_uncached_calls_are_coalesced(mock_provider):
+    """不使用缓存的相同并发调用同样只调用一次模型"""
+    service = AIService()
+
+    results = await asyncio.gather(*[
+        service.generate("同一份教案", temperature=0.7) for _ in range(2)
+    ])
+
+    assert results[0] == results[1]
+    assert len(mock_provider) == 1
@@ -0,0 +1,95 @@
+"""熔断器测试"""
+import httpx
+import pytest
+
+from app.services import circuit_breaker as circuit_breaker_module
+from app.services.circuit_breaker import (
+    CircuitBreaker,
+    CircuitState,
+    is_provider_failure,
+    is_retryable_error
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可手动推进的单调时钟"""
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def _open_breaker() -> CircuitBreaker:
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    return breaker
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=30)
+    breaker.record_failure()
+    assert breaker.allow_request()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitState.OPEN
+    assert not breaker.allow_request()
+
+
+def test_half_open_allows_single_probe(clock):
+    breaker = _open_breaker()
+    clock[0] += 30
+
+    assert breaker.allow_request()
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert not breaker.allow_request()
+
+
+def test_probe_success_closes(clock):
+    breaker = _open_breaker()
+    clock[0] += 30
+    assert breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker.failures == 0
+
+
+def test_probe_failure_reopens(clock):
+    breaker = _open_breaker()
+    clock[0] += 30
+    assert breaker.allow_request()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitState.OPEN
+    assert not breaker.allow_request()
+
+    clock[0] += 30
+    assert breaker.allow_request()
+
+
+def test_released_probe_slot_can_be_reused(clock):
+    breaker = _open_breaker()
+    clock[0] += 30
+    assert breaker.allow_request()
+
+    breaker.release()
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert breaker.allow_request()
+
+
+def _status_error(status_code: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://llm.example.com")
+    return httpx.HTTPStatusError(
+        "error", request=request, response=httpx.Response(status_code, request=request)
+    )
+
+
+@pytest.mark.parametrize(
+    "status_code, provider_failure, retryable",
+    [(500, True, True), (503, True, True), (429, False, True), (400, False, False)]
+)
+def test_error_classification(status_code, provider_failure, retryable):
+    error = _status_error(status_code)
+    assert is_provider_failure(error) is provider_failure
+    assert is_retryable_error(error) is retryable
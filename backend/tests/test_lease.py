@@ -0,0 +1,114 @@
+"""教案任务租约测试"""
+import asyncio
+from datetime import datetime, timedelta
+
+from app.core.config import settings
+from app.models.lesson import LessonPlan, LessonStatus
+from app.tasks import lease
+from app.tasks.cancellation import CANCEL_USER, lesson_tasks
+
+
+async def _get_lesson(session_maker, lesson_id: str) -> LessonPlan:
+    async with session_maker() as session:
+        return await session.get(LessonPlan, lesson_id)
+
+
+async def test_claim_free_lesson(session_maker, create_lesson):
+    lesson_id = await create_lesson()
+
+    async with session_maker() as session:
+        assert await lease.claim_lesson(session, lesson_id)
+
+    lesson = await _get_lesson(session_maker, lesson_id)
+    assert lesson.worker_id == lease.WORKER_ID
+    assert lesson.heartbeat_at is not None
+
+
+async def test_fresh_foreign_lease_cannot_be_claimed(session_maker, create_lesson):
+    lesson_id = await create_lesson(
+        LessonStatus.PROCESSING, worker_id="other-worker", heartbeat_at=datetime.utcnow()
+    )
+
+    async with session_maker() as session:
+        assert not await lease.claim_lesson(session, lesson_id)
+
+
+async def test_stale_foreign_lease_can_be_claimed(session_maker, create_lesson):
+    stale = datetime.utcnow() - timedelta(seconds=settings.LESSON_LEASE_TIMEOUT + 1)
+    lesson_id = await create_lesson(
+        LessonStatus.PROCESSING, worker_id="other-worker", heartbeat_at=stale
+    )
+
+    async with session_maker() as session:
+        assert await lease.claim_lesson(session, lesson_id)
+    assert (await _get_lesson(session_maker, lesson_id)).worker_id == lease.WORKER_ID
+
+
+async def test_finished_lesson_cannot_be_claimed(session_maker, create_lesson):
+    lesson_id = await create_lesson(LessonStatus.COMPLETED)
+
+    async with session_maker() as session:
+        assert not await lease.claim_lesson(session, lesson_id)
+
+
+async def test_renew_only_by_holder(session_maker, create_lesson, monkeypatch):
+    lesson_id = await create_lesson()
+    async with session_maker() as session:
+        assert await lease.claim_lesson(session, lesson_id)
+    assert await lease._renew_lease(lesson_id)
+
+    # 租约过期后被其他进程接管，原持有者续约失败
+    holder = lease.WORKER_ID
+    monkeypatch.setattr(lease, "WORKER_ID", "other-worker")
+    stale = datetime.utcnow() - timedelta(seconds=settings.LESSON_LEASE_TIMEOUT + 1)
+    async with session_maker() as session:
+        lesson = await session.get(LessonPlan, lesson_id)
+        lesson.heartbeat_at = stale
+        await session.commit()
+        assert await lease.claim_lesson(session, lesson_id)
+    monkeypatch.setattr(lease, "WORKER_ID", holder)
+
+    assert not await lease._renew_lease(lesson_id)
+
+
+async def _claim_then_cancel_elsewhere(session_maker, create_lesson) -> str:
+    """本进程认领后，教案在其他进程被取消（取消接口只修改状态）"""
+    lesson_id = await create_lesson()
+    async with session_maker() as session:
+        assert await lease.claim_lesson(session, lesson_id)
+        lesson = await session.get(LessonPlan, lesson_id)
+        lesson.status = LessonStatus.FAILED
+        lesson.error_message = "任务已取消"
+        await session.commit()
+    return lesson_id
+
+
+async def test_renew_fails_after_lesson_cancelled(session_maker, create_lesson):
+    lesson_id = await _claim_then_cancel_elsewhere(session_maker, create_lesson)
+    assert not await lease._renew_lease(lesson_id)
+
+
+async def test_heartbeat_cancels_task_when_lesson_cancelled(session_maker, create_lesson, monkeypatch):
+    """持有进程的心跳发现教案已被取消，以用户取消的原因停止任务"""
+    monkeypatch.setattr(settings, "LESSON_LEASE_TIMEOUT", 0.04)
+    lesson_id = await _claim_then_cancel_elsewhere(session_maker, create_lesson)
+    task = asyncio.create_task(asyncio.sleep(10))
+
+    await asyncio.wait_for(lease.keep_lease(lesson_id, task), timeout=1)
+
+    assert lesson_tasks.cancel_reason(task) == CANCEL_USER
+    await asyncio.gather(task, return_exceptions=True)
+    assert task.cancelled()
+    lesson_tasks.unregister(lesson_id, task)
+
+
+async def test_finish_does_not_overwrite_cancelled_lesson(session_maker, create_lesson):
+    lesson_id = await _claim_then_cancel_elsewhere(session_maker, create_lesson)
+
+    async with session_maker() as session:
+        assert not await lease.finish_lesson(session, lesson_id, status=LessonStatus.COMPLETED)
+        await session.commit()
+
+    lesson = await _get_lesson(session_maker, lesson_id)
+    assert lesson.status == LessonStatus.FAILED
+    assert lesson.error_message == "任务已取消"
@@ -0,0 +1,28 @@
+"""LLM响应缓存测试"""
+from app.tasks.lesson_task import LessonTaskHandler
+from app.services.llm_cache import llm_cache
+
+
+async def test_lesson_vote_call_is_cached(mock_provider):
+    """教案投票调用（温度0.3）第二次直接命中缓存，不再调用模型"""
+    handler = LessonTaskHandler()
+    prompt = "请学科专家、一线教师对以下方案投票：方案A"
+
+    first = await handler._collect_opinion_votes([prompt], total_agents=2)
+    second = await handler._collect_opinion_votes([prompt], total_agents=2)
+
+    assert first == second
+    assert len(mock_provider) == 1
+    assert llm_cache.stats["writes"] == 1
+    assert llm_cache.stats["memory_hits"] == 1
+
+
+async def test_high_temperature_call_is_not_cached_by_default(mock_provider):
+    """未显式指定时，高温度调用不使用缓存"""
+    handler = LessonTaskHandler()
+
+    await handler.ai_service.generate("写一首诗", temperature=0.9)
+    await handler.ai_service.generate("写一首诗", temperature=0.9)
+
+    assert len(mock_provider) == 2
+    assert llm_cache.stats["writes"] == 0
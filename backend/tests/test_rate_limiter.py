@@ -0,0 +1,56 @@
+"""LLM限流器测试"""
+import asyncio
+
+from app.services.rate_limiter import FairSemaphore
+
+
+async def _acquire(semaphore: FairSemaphore, owner: str, name: str, order: list):
+    await semaphore.acquire(owner)
+    order.append(name)
+
+
+async def test_permits_rotate_between_owners():
+    """许可按请求方轮询分配，大教案排队的请求不会饿死其他教案"""
+    semaphore = FairSemaphore(1)
+    order = []
+
+    await _acquire(semaphore, "big", "big-1", order)
+    waiters = [
+        asyncio.create_task(_acquire(semaphore, "big", "big-2", order)),
+        asyncio.create_task(_acquire(semaphore, "big", "big-3", order)),
+        asyncio.create_task(_acquire(semaphore, "small", "small-1", order)),
+    ]
+    await asyncio.sleep(0)
+    assert semaphore.waiting == 3
+
+    for _ in range(3):
+        semaphore.release()
+        await asyncio.sleep(0)
+    await asyncio.gather(*waiters)
+
+    assert order == ["big-1", "big-2", "small-1", "big-3"]
+    assert semaphore.in_use == 1
+
+
+async def test_cancelled_waiter_is_skipped():
+    """取消的等待者不占用许可"""
+    semaphore = FairSemaphore(1)
+    await semaphore.acquire("a")
+
+    cancelled = asyncio.create_task(semaphore.acquire("b"))
+    waiting = asyncio.create_task(semaphore.acquire("c"))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await asyncio.sleep(0)
+
+    semaphore.release()
+    await asyncio.wait_for(waiting, timeout=1)
+    assert semaphore.in_use == 1
+    assert semaphore.waiting == 0
+
+
+async def test_non_positive_limit_is_unlimited():
+    semaphore = FairSemaphore(0)
+    for _ in range(100):
+        await asyncio.wait_for(semaphore.acquire("a"), timeout=1)
+    assert semaphore.in_use == 100
@@ -0,0 +1,71 @@
+"""单飞请求合并测试"""
+import asyncio
+
+import pytest
+
+from app.services.single_flight import SingleFlight
+
+
+async def test_concurrent_calls_share_one_execution():
+    """相同键的并发调用只执行一次，异常传递给所有等待者"""
+    flight = SingleFlight()
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def failing():
+        started.set()
+        await release.wait()
+        raise ValueError("boom")
+
+    waiters = [asyncio.create_task(flight.do("key", failing)) for _ in range(3)]
+    await started.wait()
+    release.set()
+    results = await asyncio.gather(*waiters, return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.executed == 1
+    assert flight.coalesced == 2
+
+
+async def test_cancelling_one_waiter_keeps_shared_call():
+    """单个等待者取消不影响其他等待者"""
+    flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def slow():
+        await release.wait()
+        return "done"
+
+    first = asyncio.create_task(flight.do("key", slow))
+    second = asyncio.create_task(flight.do("key", slow))
+    await asyncio.sleep(0)
+
+    first.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await second == "done"
+    with pytest.raises(asyncio.CancelledError):
+        await first
+
+
+async def test_caller_after_last_waiter_cancelled_runs_fresh_call():
+    """最后一个等待者取消后，随即到来的相同调用重新执行，不会收到CancelledError"""
+    flight = SingleFlight()
+    never = asyncio.Event()
+
+    async def slow():
+        await never.wait()
+
+    async def fresh():
+        return "fresh"
+
+    waiter = asyncio.create_task(flight.do("key", slow))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    # 等待者处理完取消，共享任务尚未结束
+    await asyncio.sleep(0)
+    assert waiter.done()
+
+    assert await flight.do("key", fresh) == "fresh"
+    assert flight.executed == 2
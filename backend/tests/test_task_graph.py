@@ -0,0 +1,80 @@
+"""任务依赖图测试"""
+import asyncio
+
+import pytest
+
+from app.tasks.task_graph import TaskGraph
+
+
+async def test_nodes_start_when_dependencies_finish():
+    """节点在依赖完成后立即启动，结果按依赖顺序传入"""
+    graph = TaskGraph()
+    slow_release = asyncio.Event()
+    started = []
+
+    async def fast():
+        started.append("fast")
+        return 1
+
+    async def slow():
+        await slow_release.wait()
+        return 2
+
+    async def after_fast(value):
+        started.append("after_fast")
+        slow_release.set()
+        return value + 10
+
+    async def join(a, b):
+        return (a, b)
+
+    graph.add("fast", fast)
+    graph.add("slow", slow)
+    graph.add("after_fast", after_fast, deps=["fast"])
+    graph.add("join", join, deps=["after_fast", "slow"])
+
+    results = await asyncio.wait_for(graph.run(), timeout=1)
+
+    assert started == ["fast", "after_fast"]
+    assert results["join"] == (11, 2)
+
+
+async def test_failure_stops_dependent_nodes():
+    """节点失败后不再启动依赖它的节点，已在执行的节点照常完成"""
+    graph = TaskGraph()
+    independent_started = asyncio.Event()
+    ran = []
+
+    async def failing():
+        await independent_started.wait()
+        raise ValueError("boom")
+
+    async def dependent(_):
+        ran.append("dependent")
+
+    async def independent():
+        independent_started.set()
+        await asyncio.sleep(0)
+        return "kept"
+
+    graph.add("failing", failing)
+    graph.add("dependent", dependent, deps=["failing"])
+    graph.add("independent", independent)
+
+    with pytest.raises(ValueError):
+        await graph.run()
+    assert ran == []
+    assert graph.results["independent"] == "kept"
+
+
+async def test_cycle_is_rejected():
+    graph = TaskGraph()
+
+    async def node(_):
+        return None
+
+    graph.add("a", node, deps=["b"])
+    graph.add("b", node, deps=["a"])
+
+    with pytest.raises(ValueError):
+        await graph.run()
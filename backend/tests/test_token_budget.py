@@ -0,0 +1,23 @@
+"""Token预算测试"""
+import sys
+import types
+
+from app.services import token_budget
+
+
+def test_encoding_load_failure_falls_back_to_estimate(monkeypatch):
+    """BPE文件无法下载时退回近似估算，截断仍然可用"""
+    def unavailable(name):
+        raise OSError("network unreachable")
+
+    monkeypatch.setitem(sys.modules, "tiktoken", types.SimpleNamespace(get_encoding=unavailable))
+    monkeypatch.setattr(token_budget, "_encoding", None)
+    monkeypatch.setattr(token_budget, "_encoding_loaded", False)
+
+    token_budget.load_encoding()
+
+    assert token_budget._get_encoding() is None
+    assert token_budget.estimate_tokens("光的传播" * 10) > 0
+    truncated = token_budget.truncate_to_tokens("光的传播" * 1000, 100)
+    assert truncated.endswith(token_budget.TRUNCATION_MARKER)
+    assert token_budget.estimate_tokens(truncated) <= 100
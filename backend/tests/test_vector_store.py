@@ -0,0 +1,132 @@
+"""本地向量库测试"""
+import hashlib
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+
+from app.services.vector_store import LocalVectorCollection
+
+DIMENSION = 16
+
+
+def fake_embedding(texts):
+    """按文本哈希生成确定的向量"""
+    vectors = []
+    for text in texts:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+        vectors.append(np.random.default_rng(seed).standard_normal(DIMENSION).tolist())
+    return vectors
+
+
+def _collection(path, **kwargs) -> LocalVectorCollection:
+    return LocalVectorCollection(str(path), fake_embedding, **kwargs)
+
+
+def _add_documents(collection, count: int, prefix: str = "doc"):
+    collection.add(
+        ids=[f"{prefix}-{i}" for i in range(count)],
+        documents=[f"{prefix} 文档 {i}" for i in range(count)],
+        metadatas=[{"subject": "物理" if i % 2 else "化学"} for i in range(count)]
+    )
+
+
+def test_add_and_query(tmp_path):
+    collection = _collection(tmp_path)
+    _add_documents(collection, 10)
+
+    result = collection.query(query_texts=["doc 文档 3"], n_results=3)
+
+    assert collection.count() == 10
+    assert result["ids"][0][0] == "doc-3"
+    assert result["distances"][0][0] == pytest.approx(0, abs=1e-5)
+    assert result["distances"][0] == sorted(result["distances"][0])
+
+
+def test_filtered_query(tmp_path):
+    collection = _collection(tmp_path)
+    _add_documents(collection, 10)
+
+    result = collection.query(query_texts=["doc 文档 3"], n_results=10, where={"subject": "化学"})
+
+    assert len(result["ids"][0]) == 5
+    assert all(metadata["subject"] == "化学" for metadata in result["metadatas"][0])
+    assert collection.query(query_texts=["x"], where={"subject": "生物"})["ids"] == [[]]
+
+
+def test_duplicate_ids_are_skipped(tmp_path):
+    collection = _collection(tmp_path)
+    _add_documents(collection, 5)
+    _add_documents(collection, 5)
+    assert collection.count() == 5
+
+
+def test_delete_and_reload(tmp_path):
+    collection = _collection(tmp_path)
+    _add_documents(collection, 10)
+    collection.delete(["doc-3", "doc-4"])
+
+    reloaded = _collection(tmp_path)
+    result = reloaded.query(query_texts=["doc 文档 3"], n_results=10)
+
+    assert reloaded.count() == 8
+    assert "doc-3" not in result["ids"][0]
+    assert "doc-4" not in result["ids"][0]
+
+
+def test_other_instance_sees_writes(tmp_path):
+    """其他实例（进程）的写入在下次调用时可见"""
+    reader = _collection(tmp_path)
+    writer = _collection(tmp_path)
+    assert reader.count() == 0
+
+    _add_documents(writer, 4)
+    assert reader.count() == 4
+
+    writer.delete(["doc-0"])
+    assert reader.count() == 3
+
+
+def test_keeps_current_and_previous_version_files(tmp_path):
+    collection = _collection(tmp_path)
+    for i in range(4):
+        _add_documents(collection, 1, prefix=f"batch{i}")
+
+    vector_files = sorted(name for name in os.listdir(tmp_path) if name.startswith("vectors-"))
+    assert vector_files == ["vectors-3.f32", "vectors-4.f32"]
+
+
+def test_ann_index(tmp_path):
+    pytest.importorskip("hnswlib")
+    collection = _collection(tmp_path, ann_min_documents=10)
+    _add_documents(collection, 50)
+
+    assert any(name.startswith("index-") for name in os.listdir(tmp_path))
+    result = _collection(tmp_path, ann_min_documents=10).query(
+        query_texts=["doc 文档 17"], n_results=5
+    )
+    assert result["ids"][0][0] == "doc-17"
+
+
+def _write_batches(path: str, worker: int, count: int):
+    collection = _collection(path)
+    for i in range(count):
+        collection.add(ids=[f"w{worker}-{i}"], documents=[f"worker {worker} doc {i}"])
+
+
+def test_concurrent_writers_do_not_lose_updates(tmp_path):
+    """多个进程同时写入，不会基于同一版本互相覆盖"""
+    processes = [
+        multiprocessing.get_context("fork").Process(
+            target=_write_batches, args=(str(tmp_path), worker, 10)
+        )
+        for worker in range(3)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert all(process.exitcode == 0 for process in processes)
+    assert _collection(tmp_path).count() == 30
@@ -52,12 +52,22 @@ CREATE TABLE IF NOT EXISTS `lesson_plans` (
   `progress` INT DEFAULT 0 COMMENT '进度（0-100）',
   `current_stage` INT DEFAULT 0 COMMENT '当前阶段（1,2,3）',
   `error_message` TEXT COMMENT '错误信息',
+  `worker_id` VARCHAR(100) COMMENT '持有任务租约的进程',
+  `heartbeat_at` TIMESTAMP NULL COMMENT '租约最近续约时间',
   
   -- 内容
   `source_type` ENUM('upload', 'manual') NOT NULL COMMENT '来源类型',
   `source_content` TEXT COMMENT '原始内容',
   `parsed_content` TEXT COMMENT '解析后内容',
   `final_content` JSON COMMENT '最终教案（结构化）',
+  `checkpoint` JSON COMMENT '断点续跑检查点',
+  `content_embedding` JSON COMMENT '教案内容嵌入向量（RAG检索）',
+  
+  -- LLM消耗统计
+  `prompt_tokens` INT DEFAULT 0 COMMENT '提示词token数',
+  `completion_tokens` INT DEFAULT 0 COMMENT '生成token数',
+  `llm_calls` INT DEFAULT 0 COMMENT 'LLM调用次数',
+  `llm_latency_ms` INT DEFAULT 0 COMMENT 'LLM调用累计耗时（毫秒）',
   
   -- 时间戳
   `started_at` TIMESTAMP NULL COMMENT '开始时间',
@@ -95,6 +95,11 @@ class APIClient {
     return response.data;
   }
 
+  async retryLesson(id: string) {
+    const response = await this.client.post(`/lessons/${id}/retry`);
+    return response.data;
+  }
+
   async deleteLesson(id: string) {
     await this.client.delete(`/lessons/${id}`);
   }
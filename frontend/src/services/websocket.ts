@@ -9,18 +9,35 @@ class WebSocketService {
   private socket: Socket | null = null;
   private listeners: Map<string, Set<Function>> = new Map();
 
+  private lessonId: string | null = null;
+
   connect(lessonId: string) {
-    if (this.socket?.connected) {
+    if (this.socket?.connected && this.lessonId === lessonId) {
       return;
     }
 
+    // 切换教案时重新连接，以加入新的教案房间
+    if (this.socket) {
+      this.socket.disconnect();
+    }
+    this.lessonId = lessonId;
+
+    // 服务端校验令牌和教案归属后才会推送该教案的事件
     this.socket = io(WS_URL, {
       transports: ['websocket'],
+      auth: {
+        token: localStorage.getItem('access_token'),
+        lesson_id: lessonId,
+      },
       query: {
         lesson_id: lessonId,
       },
     });
 
+    this.socket.on('connect_error', (error) => {
+      console.error('❌ WebSocket connection refused:', error.message);
+    });
+
     this.socket.on('connect', () => {
       console.log('✅ WebSocket connected');
     });
@@ -55,6 +72,7 @@ class WebSocketService {
       this.socket.disconnect();
       this.socket = null;
     }
+    this.lessonId = null;
     this.listeners.clear();
   }
 